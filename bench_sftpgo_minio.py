@@ -0,0 +1,535 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+bench_sftpgo_minio.py
+
+Benchmark de sftpgo_yesterday_to_minio_flat_inbound-2.py sin tocar producción:
+- Levanta un SFTP local (servidor paramiko en 127.0.0.1 sirviendo un directorio temporal).
+- Levanta un S3 local: moto (ThreadedMotoServer) o el binario de MinIO; o usa uno externo.
+- Genera un árbol sintético remote_root/YYYYMMDD(ayer)/subNN/*INBOUND*.wav con N archivos
+  de tamaño configurable (semilla fija: mismo árbol en cada corrida).
+- Corre el copier como subproceso una vez por modo (cada uno con su prefijo S3), valida
+  en S3 que llegaron todos los objetos y mide archivos/s y MB/s.
+- --json-out guarda los resultados; --baseline compara contra una corrida anterior y sale
+  con código 1 si algún modo cae más de --max-regression (para CI antes de desplegar).
+
+Modos (--modes, separados por coma):
+  seq            el copier secuencial original: el script tal como estaba en --seq-ref (por
+                 defecto el commit que lo agregó al repo) o el de --seq-copier; solo recibe las
+                 opciones comunes (SFTP, S3, prefijo, tz, reporte)
+  threads:N      --engine threads --workers N (threads:1 = pipeline actual con un solo worker)
+  async:N        --engine async --inflight N (requiere asyncssh)
+  Sufijos opcionales: threads:8+sha256 (agrega --checksum sha256)
+
+Requisitos: paramiko, boto3 y moto[server] (o --s3 minio --minio-bin /ruta/minio).
+Nota: el servidor SFTP de prueba es Python puro; sirve para comparar modos entre sí y entre
+versiones, no como cifra absoluta de lo que da SFTPGo.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import logging
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+try:
+    import paramiko
+    import boto3
+    from botocore.client import Config
+except ImportError as e:
+    print(f"[ERROR] Falta dependencia ({e.name}). Instala con: pip install paramiko boto3 'moto[server]'")
+    sys.exit(1)
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+COPIER = os.path.join(HERE, "sftpgo_yesterday_to_minio_flat_inbound-2.py")
+
+SFTP_USER = "bench"
+SFTP_PASS = "bench"
+S3_KEY = "benchbench"
+S3_SECRET = "benchbench"
+BUCKET = "bench"
+
+
+# =========================
+# Utilidades
+# =========================
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def parse_size(value: str) -> int:
+    v = value.strip().upper().rstrip("B")
+    mult = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}.get(v[-1:], 1)
+    return int(float(v[:-1] if v[-1:] in "KMG" else v) * mult)
+
+
+def parse_size_range(value: str) -> Tuple[int, int]:
+    """
+    '256K' -> (256K, 256K); '10K-2M' -> (10K, 2M)
+    """
+    lo, _, hi = value.partition("-")
+    lo_b = parse_size(lo)
+    return lo_b, parse_size(hi) if hi else lo_b
+
+
+def wait_port(port: int, timeout: float = 20.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+# =========================
+# Árbol sintético
+# =========================
+def generate_tree(root: str, remote_root: str, day: str, files: int, dirs: int, size_range: Tuple[int, int],
+                  noise_ratio: float, seed: int) -> Tuple[int, int]:
+    """
+    Crea remote_root/day/subNN/... Retorna (archivos INBOUND, bytes INBOUND).
+    noise_ratio agrega archivos OUTBOUND que el filtro debe ignorar.
+    """
+    rnd = random.Random(seed)
+    base = os.path.join(root, remote_root.strip("/"), day)
+    chunk = rnd.randbytes(1024 * 1024)
+    total_files = 0
+    total_bytes = 0
+    noise = int(files * noise_ratio)
+
+    for i in range(files + noise):
+        sub = os.path.join(base, f"sub{i % max(1, dirs):02d}")
+        os.makedirs(sub, exist_ok=True)
+        size = rnd.randint(*size_range)
+        kind = "INBOUND" if i < files else "OUTBOUND"
+        path = os.path.join(sub, f"{day}_{i:06d}_{kind}.wav")
+        with open(path, "wb") as f:
+            left = size
+            off = rnd.randrange(len(chunk))
+            while left > 0:
+                piece = chunk[off:off + left] or chunk[:left]
+                f.write(piece)
+                left -= len(piece)
+                off = 0
+        if kind == "INBOUND":
+            total_files += 1
+            total_bytes += size
+    return total_files, total_bytes
+
+
+# =========================
+# SFTP local (paramiko)
+# =========================
+class _SshServer(paramiko.ServerInterface):
+    def check_auth_password(self, username, password):
+        if username == SFTP_USER and password == SFTP_PASS:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+class _SftpHandle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class _SftpServer(paramiko.SFTPServerInterface):
+    """
+    Solo lectura sobre 'root' (lo que usa el copier: listdir_attr, stat, open rb).
+    """
+
+    def __init__(self, server, *args, root: str = "", **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.root = root
+
+    def _local(self, path: str) -> str:
+        return os.path.join(self.root, os.path.normpath("/" + path).lstrip("/"))
+
+    def canonicalize(self, path):
+        return os.path.normpath("/" + path)
+
+    def list_folder(self, path):
+        local = self._local(path)
+        try:
+            out = []
+            for name in os.listdir(local):
+                attr = paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(local, name)))
+                attr.filename = name
+                out.append(attr)
+            return out
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._local(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        if flags & (os.O_WRONLY | os.O_RDWR):
+            return paramiko.SFTP_PERMISSION_DENIED
+        try:
+            f = open(self._local(path), "rb")
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        handle = _SftpHandle(flags)
+        handle.filename = self._local(path)
+        handle.readfile = f
+        return handle
+
+
+class LocalSftp:
+    def __init__(self, root: str):
+        self.root = root
+        self.port = free_port()
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(("127.0.0.1", self.port))
+        self._sock.listen(64)
+        self._transports: List[paramiko.Transport] = []
+        self._stop = threading.Event()
+        threading.Thread(target=self._accept, name="sftp-accept", daemon=True).start()
+
+    def _accept(self):
+        while not self._stop.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            t = paramiko.Transport(conn)
+            t.add_server_key(self.host_key)
+            t.set_subsystem_handler("sftp", paramiko.SFTPServer, _SftpServer, root=self.root)
+            try:
+                t.start_server(server=_SshServer())
+            except (paramiko.SSHException, EOFError):
+                continue
+            self._transports.append(t)
+
+    def close(self):
+        self._stop.set()
+        try:
+            self._sock.close()
+        except OSError:
+            pass
+        for t in self._transports:
+            t.close()
+
+
+# =========================
+# S3 local (moto / MinIO / externo)
+# =========================
+class LocalS3:
+    def __init__(self, kind: str, minio_bin: str, endpoint: str, workdir: str):
+        self.kind = kind
+        self._server = None
+        self._proc: Optional[subprocess.Popen] = None
+
+        if kind == "external":
+            self.endpoint = endpoint
+        elif kind == "moto":
+            try:
+                from moto.server import ThreadedMotoServer
+            except ImportError:
+                print("[ERROR] --s3 moto requiere moto: pip install 'moto[server]'")
+                sys.exit(1)
+            logging.getLogger("werkzeug").setLevel(logging.ERROR)
+            port = free_port()
+            self._server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+            self._server.start()
+            self.endpoint = f"127.0.0.1:{port}"
+        else:
+            port = free_port()
+            env = dict(os.environ, MINIO_ROOT_USER=S3_KEY, MINIO_ROOT_PASSWORD=S3_SECRET)
+            data = os.path.join(workdir, "minio-data")
+            os.makedirs(data, exist_ok=True)
+            self._proc = subprocess.Popen([minio_bin, "server", data, "--address", f"127.0.0.1:{port}",
+                                           "--console-address", f"127.0.0.1:{free_port()}"],
+                                          env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            if not wait_port(port):
+                self.close()
+                raise RuntimeError("MinIO no levantó a tiempo")
+            self.endpoint = f"127.0.0.1:{port}"
+
+        self.client = boto3.client(
+            "s3", endpoint_url=f"http://{self.endpoint}", aws_access_key_id=S3_KEY,
+            aws_secret_access_key=S3_SECRET, region_name="us-east-1",
+            config=Config(s3={"addressing_style": "path"}, retries={"max_attempts": 5}),
+        )
+
+    def ensure_bucket(self, bucket: str):
+        try:
+            self.client.head_bucket(Bucket=bucket)
+        except Exception:
+            self.client.create_bucket(Bucket=bucket)
+
+    def count(self, bucket: str, prefix: str) -> Tuple[int, int]:
+        n = 0
+        total = 0
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                n += 1
+                total += obj["Size"]
+        return n, total
+
+    def close(self):
+        if self._server is not None:
+            self._server.stop()
+        if self._proc is not None:
+            self._proc.terminate()
+            try:
+                self._proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+
+
+# =========================
+# Corridas
+# =========================
+@dataclass
+class BenchResult:
+    mode: str
+    files: int
+    bytes: int
+    seconds: float
+    files_per_s: float
+    mb_per_s: float
+    ok: bool
+    note: str = ""
+
+
+def mode_args(mode: str) -> List[str]:
+    base, _, checksum = mode.partition("+")
+    kind, _, n = base.partition(":")
+    extra = ["--checksum", checksum] if checksum else []
+    if kind == "seq":
+        if n or extra:
+            raise ValueError(f"El modo seq no lleva parámetros (el copier original no los conoce): {mode}")
+        return []
+    if kind == "threads":
+        return ["--engine", "threads", "--workers", n or "4"] + extra
+    if kind == "async":
+        return ["--engine", "async", "--inflight", n or "256"] + extra
+    raise ValueError(f"Modo desconocido: {mode}")
+
+
+def seq_copier_source(ref: str) -> Tuple[str, bytes]:
+    """
+    (ref, contenido) del copier tal como estaba en `ref` (git show).
+    ref vacío = el commit que agregó el copier al repo: la versión secuencial original.
+    """
+    name = os.path.basename(COPIER)
+    if not ref:
+        added = subprocess.run(["git", "-C", HERE, "log", "--diff-filter=A", "--format=%H", "--", name],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True).stdout.split()
+        if not added:
+            raise RuntimeError(f"git no tiene historia de {name}")
+        ref = added[-1]
+    data = subprocess.run(["git", "-C", HERE, "show", f"{ref}:{name}"],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True).stdout
+    return ref, data
+
+
+def run_mode(mode: str, run_idx: int, sftp: LocalSftp, s3: LocalS3, args, expected: Tuple[int, int],
+             workdir: str) -> BenchResult:
+    prefix = f"bench/{mode.replace(':', '-').replace('+', '-')}/r{run_idx}"
+    seq = mode == "seq"
+    cmd = [
+        sys.executable, args.seq_copier if seq else COPIER,
+        "--sftp-host", "127.0.0.1", "--sftp-port", str(sftp.port),
+        "--sftp-user", SFTP_USER, "--sftp-pass", SFTP_PASS,
+        "--remote-root", args.remote_root,
+        "--s3-endpoint", s3.endpoint, "--s3-bucket", BUCKET,
+        "--s3-access-key", S3_KEY, "--s3-secret-key", S3_SECRET,
+        "--s3-prefix", prefix,
+        "--tz", args.tz,
+        "--report-file", os.path.join(workdir, f"report_{prefix.replace('/', '_')}.txt"),
+    ] + ([] if seq else ["--list-workers", str(args.list_workers)]) + mode_args(mode) + args.copier_arg
+
+    t0 = time.monotonic()
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    seconds = time.monotonic() - t0
+
+    n, nbytes = s3.count(BUCKET, prefix + "/")
+    ok = proc.returncode == 0 and (n, nbytes) == expected
+    note = ""
+    if proc.returncode != 0:
+        note = f"rc={proc.returncode}: " + " | ".join(proc.stdout.strip().splitlines()[-3:])
+    elif (n, nbytes) != expected:
+        note = f"S3 tiene {n} objetos/{nbytes} bytes, se esperaban {expected[0]}/{expected[1]}"
+    if args.verbose:
+        print(proc.stdout)
+
+    return BenchResult(mode=mode, files=n, bytes=nbytes, seconds=round(seconds, 3),
+                       files_per_s=round(n / seconds, 2) if seconds else 0.0,
+                       mb_per_s=round(nbytes / 1024 / 1024 / seconds, 2) if seconds else 0.0,
+                       ok=ok, note=note)
+
+
+def best_of(results: List[BenchResult]) -> BenchResult:
+    good = [r for r in results if r.ok]
+    return max(good, key=lambda r: r.files_per_s) if good else results[-1]
+
+
+def compare_baseline(path: str, results: Dict[str, BenchResult], max_regression: float) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        base = {r["mode"]: r for r in json.load(f)["results"]}
+    problems = []
+    for mode, r in results.items():
+        b = base.get(mode)
+        if not b or not b.get("ok"):
+            continue
+        for metric in ("files_per_s", "mb_per_s"):
+            if b[metric] and getattr(r, metric) < b[metric] * (1 - max_regression):
+                problems.append(f"{mode}: {metric} {getattr(r, metric)} < baseline {b[metric]} "
+                                f"(-{(1 - getattr(r, metric) / b[metric]) * 100:.0f}%)")
+    return problems
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark del copier SFTP -> MinIO con SFTP y S3 locales.")
+    ap.add_argument("--files", type=int, default=500, help="Archivos INBOUND a generar.")
+    ap.add_argument("--size", default="64K-1M", help="Tamaño por archivo: '256K' o rango '10K-2M'.")
+    ap.add_argument("--dirs", type=int, default=10, help="Subdirectorios dentro de la carpeta del día.")
+    ap.add_argument("--noise-ratio", type=float, default=0.2,
+                    help="Proporción extra de archivos OUTBOUND (ejercitan el filtro).")
+    ap.add_argument("--seed", type=int, default=1234)
+    ap.add_argument("--modes", default="seq,threads:4,threads:16",
+                    help="Modos separados por coma: seq, threads:N, async:N, con sufijo opcional +md5/+sha256.")
+    ap.add_argument("--repeat", type=int, default=1, help="Corridas por modo (se reporta la mejor).")
+    ap.add_argument("--seq-copier", default="", help="Script del copier original para el modo seq.")
+    ap.add_argument("--seq-ref", default="",
+                    help="Ref de git del copier original para el modo seq (default: el commit que lo agregó).")
+    ap.add_argument("--list-workers", type=int, default=4)
+    ap.add_argument("--remote-root", default="/recordings")
+    ap.add_argument("--tz", default="UTC")
+    ap.add_argument("--s3", choices=("moto", "minio", "external"), default="moto")
+    ap.add_argument("--minio-bin", default="minio", help="Binario de MinIO para --s3 minio.")
+    ap.add_argument("--s3-endpoint", default="", help="host:puerto para --s3 external (credenciales bench/bench...).")
+    ap.add_argument("--copier-arg", action="append", default=[],
+                    help="Argumento extra para el copier (repetible, también va al modo seq), "
+                         "ej: --copier-arg=--max-bandwidth=50M")
+    ap.add_argument("--workdir", default="", help="Directorio de trabajo (por defecto uno temporal).")
+    ap.add_argument("--keep", action="store_true", help="No borrar el árbol generado ni los reportes.")
+    ap.add_argument("--json-out", default="", help="Guarda resultados en JSON (sirve como --baseline después).")
+    ap.add_argument("--baseline", default="", help="JSON de una corrida anterior para detectar regresiones.")
+    ap.add_argument("--max-regression", type=float, default=0.15, help="Caída tolerada vs baseline (0.15 = 15%%).")
+    ap.add_argument("-v", "--verbose", action="store_true", help="Muestra la salida del copier.")
+    args = ap.parse_args()
+
+    if args.s3 == "external" and not args.s3_endpoint:
+        ap.error("--s3 external requiere --s3-endpoint")
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    for m in modes:
+        try:
+            mode_args(m)
+        except ValueError as e:
+            ap.error(str(e))
+
+    seq_source = None
+    if "seq" in modes and not args.seq_copier:
+        try:
+            seq_source = seq_copier_source(args.seq_ref)
+        except (OSError, RuntimeError, subprocess.CalledProcessError) as e:
+            detail = getattr(e, "stderr", "") or ""
+            detail = detail.decode(errors="replace") if isinstance(detail, bytes) else detail
+            ap.error(f"No pude sacar el copier original de git ({detail.strip() or e}); usa --seq-copier RUTA")
+    elif args.seq_copier and not os.path.isfile(args.seq_copier):
+        ap.error(f"No existe --seq-copier {args.seq_copier}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_sftp_minio_")
+    os.makedirs(workdir, exist_ok=True)
+    if seq_source is not None:
+        ref, data = seq_source
+        args.seq_copier = os.path.join(workdir, f"copier_seq_{ref[:12]}.py")
+        with open(args.seq_copier, "wb") as f:
+            f.write(data)
+        print(f"[INFO] Modo seq: copier original de {ref[:12]}")
+    day = (datetime.now(tz=ZoneInfo(args.tz)) - timedelta(days=1)).strftime("%Y%m%d")
+    sftp_root = os.path.join(workdir, "sftp")
+
+    print(f"[INFO] Generando {args.files} archivos ({args.size}) en {sftp_root} (día {day})...")
+    expected = generate_tree(sftp_root, args.remote_root, day, args.files, args.dirs, parse_size_range(args.size),
+                             args.noise_ratio, args.seed)
+    print(f"[INFO] Árbol listo: {expected[0]} archivos INBOUND, {expected[1] / 1024 / 1024:.1f} MB")
+
+    sftp = LocalSftp(sftp_root)
+    s3 = None
+    results: Dict[str, BenchResult] = {}
+    try:
+        s3 = LocalS3(args.s3, args.minio_bin, args.s3_endpoint, workdir)
+        s3.ensure_bucket(BUCKET)
+        print(f"[INFO] SFTP 127.0.0.1:{sftp.port} | S3 {args.s3} {s3.endpoint}")
+
+        for mode in modes:
+            runs = []
+            for i in range(max(1, args.repeat)):
+                r = run_mode(mode, i, sftp, s3, args, expected, workdir)
+                status = "OK" if r.ok else "FALLÓ"
+                print(f"[INFO] {mode:<16} corrida {i + 1}: {r.seconds:.2f}s {r.files_per_s:.1f} archivos/s "
+                      f"{r.mb_per_s:.1f} MB/s [{status}] {r.note}")
+                runs.append(r)
+            results[mode] = best_of(runs)
+    finally:
+        sftp.close()
+        if s3 is not None:
+            s3.close()
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print("")
+    print(f"{'MODO':<18} {'ARCHIVOS':>9} {'MB':>9} {'SEG':>8} {'ARCH/S':>9} {'MB/S':>8}  ESTADO")
+    for r in results.values():
+        print(f"{r.mode:<18} {r.files:>9} {r.bytes / 1024 / 1024:>9.1f} {r.seconds:>8.2f} "
+              f"{r.files_per_s:>9.1f} {r.mb_per_s:>8.1f}  {'OK' if r.ok else 'FALLÓ ' + r.note}")
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "params": {"files": args.files, "size": args.size, "dirs": args.dirs, "seed": args.seed,
+                           "s3": args.s3, "list_workers": args.list_workers,
+                           "seq_copier": seq_source[0] if seq_source is not None else args.seq_copier},
+                "results": [asdict(r) for r in results.values()],
+            }, f, indent=2, ensure_ascii=False)
+        print(f"[INFO] Resultados en {args.json_out}")
+
+    rc = 0 if all(r.ok for r in results.values()) else 2
+    if args.baseline:
+        problems = compare_baseline(args.baseline, results, args.max_regression)
+        for p in problems:
+            print(f"[REGRESIÓN] {p}")
+        if problems:
+            rc = rc or 1
+    sys.exit(rc)
+
+
+if __name__ == "__main__":
+    main()
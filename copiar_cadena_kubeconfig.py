@@ -5,11 +5,13 @@ import sys
 import json
 import time
 import re
+import uuid
 from dataclasses import dataclass, asdict
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import paramiko
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ssh_pool import SSHPool
 
 
 # ===================== CONFIG =====================
@@ -31,8 +33,20 @@ PRINT_CAT_CLIENTE = True
 # Si quieres validar conectividad de kubeconfig-cliente contra el API HA, ponlo en True.
 # OJO: requiere que el nodo tenga red hacia el HA:6443 y que kubectl exista.
 VALIDATE_WITH_KUBECTL_VERSION = False
+
+# True: todos los pasos viajan como un solo script (1 ida y vuelta por nodo) con marcas por paso.
+# False: un ssh_exec por paso (útil para depurar un paso puntual).
+BATCH_REMOTE = True
 # ==================================================
 
+# Una conexión SSH por nodo para todos los pasos (antes: una por comando)
+SSH_POOL = SSHPool(
+    user=SSH_USER,
+    password=SSH_PASSWORD,
+    port=SSH_PORT,
+    timeout=SSH_TIMEOUT_SEC,
+)
+
 
 @dataclass
 class HostResult:
@@ -125,26 +139,9 @@ def get_control_plane_nodes(kubeconfig_path: str) -> List[Tuple[str, str]]:
 def ssh_exec(ip: str, command: str) -> Tuple[int, str, str]:
     """
     Ejecuta un comando remoto por SSH y retorna (exit_status, stdout, stderr).
+    Reusa la conexión del nodo en SSH_POOL (un canal nuevo por comando).
     """
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-    client.connect(
-        hostname=ip,
-        port=SSH_PORT,
-        username=SSH_USER,
-        password=SSH_PASSWORD,
-        timeout=SSH_TIMEOUT_SEC,
-        auth_timeout=SSH_TIMEOUT_SEC,
-        banner_timeout=SSH_TIMEOUT_SEC,
-    )
-
-    stdin, stdout, stderr = client.exec_command(command)
-    exit_status = stdout.channel.recv_exit_status()
-    out = stdout.read().decode(errors="replace")
-    err = stderr.read().decode(errors="replace")
-    client.close()
-    return exit_status, out, err
+    return SSH_POOL.exec(ip, command)
 
 
 def patch_server_preserve_indent_cmd(file_path: str, ha_ip: str) -> str:
@@ -184,6 +181,85 @@ print("PATCHED", n)
     return f"python3 - '{file_path}' '{ha_ip}' <<'PY'\n{py}\nPY"
 
 
+StepResults = Dict[str, Tuple[int, str, str]]
+
+
+def batch_script(steps: List[Tuple[str, str, bool]], mark: str) -> str:
+    """
+    Arma un solo script bash con todos los pasos. Cada paso corre en un subshell y deja
+    marcas en stdout y stderr:
+        <mark> BEGIN <paso>
+        ... salida del paso ...
+        <mark> END <paso> <rc>
+    Si un paso fatal falla, el script sale ahí (igual que el modo paso a paso).
+    """
+    lines = ["set +e"]
+    for name, cmd, fatal in steps:
+        lines += [
+            f"printf '%s\\n' '{mark} BEGIN {name}'; printf '%s\\n' '{mark} BEGIN {name}' >&2",
+            "(",
+            cmd,
+            ")",
+            "rc=$?",
+            f"printf '\\n%s %s\\n' '{mark} END {name}' \"$rc\"; printf '\\n%s\\n' '{mark} END {name}' >&2",
+        ]
+        if fatal:
+            lines.append('[ "$rc" -eq 0 ] || exit 0')
+    return "\n".join(lines) + "\n"
+
+
+def parse_batch_output(out: str, err: str, mark: str) -> StepResults:
+    """
+    Separa stdout/stderr del script batch por paso usando las marcas.
+    Solo aparecen los pasos que terminaron (tienen marca END en stdout).
+    """
+    def split(text: str) -> Tuple[Dict[str, List[str]], Dict[str, int]]:
+        chunks: Dict[str, List[str]] = {}
+        rcs: Dict[str, int] = {}
+        current = None
+        for ln in text.splitlines():
+            if ln.startswith(mark + " "):
+                parts = ln.split()
+                if parts[1] == "BEGIN":
+                    current = parts[2]
+                    chunks[current] = []
+                elif parts[1] == "END":
+                    if len(parts) > 3:
+                        rcs[parts[2]] = int(parts[3])
+                    current = None
+                continue
+            if current is not None:
+                chunks[current].append(ln)
+        return chunks, rcs
+
+    out_chunks, rcs = split(out)
+    err_chunks, _ = split(err)
+
+    return {
+        name: (rc, "\n".join(out_chunks.get(name, [])), "\n".join(err_chunks.get(name, [])))
+        for name, rc in rcs.items()
+    }
+
+
+def run_steps(ip: str, steps: List[Tuple[str, str, bool]]) -> StepResults:
+    """
+    Ejecuta los pasos (nombre, comando, fatal) en el nodo y retorna {paso: (rc, stdout, stderr)}.
+    Con BATCH_REMOTE va todo en un solo ssh_exec; si no, un ssh_exec por paso.
+    En ambos casos se corta en el primer paso fatal que falle.
+    """
+    if BATCH_REMOTE:
+        mark = f"@@STEP-{uuid.uuid4().hex[:12]}"
+        _, out, err = ssh_exec(ip, batch_script(steps, mark))
+        return parse_batch_output(out, err, mark)
+
+    results: StepResults = {}
+    for name, cmd, fatal in steps:
+        results[name] = ssh_exec(ip, cmd)
+        if fatal and results[name][0] != 0:
+            break
+    return results
+
+
 def copy_and_build_client_config(node: str, ip: str, ha_ip: str) -> HostResult:
     """
     En cada nodo:
@@ -192,60 +268,68 @@ def copy_and_build_client_config(node: str, ip: str, ha_ip: str) -> HostResult:
     3) cp /root/.kube/config -> /root/.kube/config-cliente
     4) reemplaza server en config-cliente preservando indentación
     5) cat config-cliente e imprimir
+
+    Con BATCH_REMOTE los pasos viajan en un solo script; el error se sigue reportando por paso.
     """
     start = time.time()
     printed = False
 
-    try:
-        # 1) mkdir
-        rc, out, err = ssh_exec(ip, f"mkdir -p {REMOTE_DIR}")
-        if rc != 0:
-            return HostResult(node, ip, False, "mkdir", err.strip() or out.strip(), time.time() - start, printed)
+    steps = [
+        ("mkdir", f"mkdir -p {REMOTE_DIR}", True),
+        ("cp_rke2_to_config", f"cp -f {REMOTE_SRC} {REMOTE_CONFIG} && chmod 600 {REMOTE_CONFIG}", True),
+        ("cp_config_to_cliente", f"cp -f {REMOTE_CONFIG} {REMOTE_CONFIG_CLIENTE} && chmod 600 {REMOTE_CONFIG_CLIENTE}", True),
+        ("patch_server_in_cliente", patch_server_preserve_indent_cmd(REMOTE_CONFIG_CLIENTE, ha_ip), True),
+        ("validate_non_empty", f"test -s {REMOTE_CONFIG_CLIENTE} && echo OK || echo FAIL", False),
+        ("server_line", f"grep -n '^\\s*server:' {REMOTE_CONFIG_CLIENTE} || true", False),
+    ]
+    if VALIDATE_WITH_KUBECTL_VERSION:
+        steps.append(("kubectl_version", f"kubectl --kubeconfig {REMOTE_CONFIG_CLIENTE} version --short 2>&1 || true", False))
+    if PRINT_CAT_CLIENTE:
+        steps.append(("cat_cliente", f"cat {REMOTE_CONFIG_CLIENTE}", True))
+
+    def fail(step: str, msg: str) -> HostResult:
+        return HostResult(node, ip, False, step, msg, time.time() - start, printed)
 
-        # 2) cp rke2.yaml -> config
-        rc, out, err = ssh_exec(ip, f"cp -f {REMOTE_SRC} {REMOTE_CONFIG} && chmod 600 {REMOTE_CONFIG}")
-        if rc != 0:
-            return HostResult(node, ip, False, "cp_rke2_to_config", err.strip() or out.strip(), time.time() - start, printed)
+    try:
+        results = run_steps(ip, steps)
 
-        # 3) cp config -> config-cliente
-        rc, out, err = ssh_exec(ip, f"cp -f {REMOTE_CONFIG} {REMOTE_CONFIG_CLIENTE} && chmod 600 {REMOTE_CONFIG_CLIENTE}")
-        if rc != 0:
-            return HostResult(node, ip, False, "cp_config_to_cliente", err.strip() or out.strip(), time.time() - start, printed)
+        # 1-3) mkdir + copias
+        for name in ("mkdir", "cp_rke2_to_config", "cp_config_to_cliente"):
+            if name not in results:
+                return fail(name, "El paso no terminó (la ejecución remota se cortó)")
+            rc, out, err = results[name]
+            if rc != 0:
+                return fail(name, err.strip() or out.strip())
 
         # 4) patch server manteniendo indentación
-        cmd_patch = patch_server_preserve_indent_cmd(REMOTE_CONFIG_CLIENTE, ha_ip)
-        rc, out, err = ssh_exec(ip, cmd_patch)
+        if "patch_server_in_cliente" not in results:
+            return fail("patch_server_in_cliente", "El paso no terminó (la ejecución remota se cortó)")
+        rc, out, err = results["patch_server_in_cliente"]
         if rc != 0:
-            msg = (err.strip() or out.strip() or "Error parchando server")
-            return HostResult(node, ip, False, "patch_server_in_cliente", msg, time.time() - start, printed)
+            return fail("patch_server_in_cliente", err.strip() or out.strip() or "Error parchando server")
 
         if "NO_MATCH" in out:
-            return HostResult(
-                node, ip, False, "patch_server_in_cliente",
-                "No encontré línea server: ...:6443 para reemplazar en config-cliente",
-                time.time() - start, printed
-            )
+            return fail("patch_server_in_cliente", "No encontré línea server: ...:6443 para reemplazar en config-cliente")
 
         # Validación rápida: archivo no vacío
-        rc, out2, err2 = ssh_exec(ip, f"test -s {REMOTE_CONFIG_CLIENTE} && echo OK || echo FAIL")
+        rc, out2, err2 = results.get("validate_non_empty", (255, "", "El paso no terminó (la ejecución remota se cortó)"))
         if "OK" not in out2:
-            return HostResult(node, ip, False, "validate_non_empty", err2.strip() or out2.strip(), time.time() - start, printed)
+            return fail("validate_non_empty", err2.strip() or out2.strip())
 
         # Mostrar línea server (para confirmar)
-        rc, srv_out, srv_err = ssh_exec(ip, f"grep -n '^\\s*server:' {REMOTE_CONFIG_CLIENTE} || true")
+        srv_out = results.get("server_line", (0, "", ""))[1]
         server_line = srv_out.strip() if srv_out.strip() else "No encontré línea server:"
 
-        # (Opcional) validar que kubectl parsea ese kubeconfig y puede leer version (si hay red y kubectl)
+        # (Opcional) kubectl version: no es fatal si no hay conectividad; solo lo reportamos
         if VALIDATE_WITH_KUBECTL_VERSION:
-            rc, vout, verr = ssh_exec(ip, f"kubectl --kubeconfig {REMOTE_CONFIG_CLIENTE} version --short 2>&1 || true")
-            # no lo hacemos fatal si no hay conectividad; solo lo reportamos
+            vout = results.get("kubectl_version", (0, "", ""))[1]
             server_line += f" | kubectl version output: {vout.strip()[:160]}"
 
         # 5) cat e imprimir
         if PRINT_CAT_CLIENTE:
-            rc3, cat_out, cat_err = ssh_exec(ip, f"cat {REMOTE_CONFIG_CLIENTE}")
+            rc3, cat_out, cat_err = results.get("cat_cliente", (255, "", "El paso no terminó (la ejecución remota se cortó)"))
             if rc3 != 0:
-                return HostResult(node, ip, False, "cat_cliente", cat_err.strip() or cat_out.strip(), time.time() - start, printed)
+                return fail("cat_cliente", cat_err.strip() or cat_out.strip())
 
             print("\n" + "=" * 90)
             print(f"NODE: {node} | IP: {ip} | /root/.kube/config-cliente (server => https://{ha_ip}:6443)")
@@ -294,13 +378,17 @@ def main() -> int:
     print("\nIniciando acciones por SSH en cada control-plane...\n")
 
     results: List[HostResult] = []
-    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(nodes))) as ex:
-        futs = [ex.submit(copy_and_build_client_config, n, ip, ha_ip) for n, ip in nodes]
-        for f in as_completed(futs):
-            r = f.result()
-            results.append(r)
-            status = "✅ OK" if r.ok else "❌ FAIL"
-            print(f"{status} | {r.node} ({r.ip}) | paso={r.step} | {r.message} | {r.duration_sec:.2f}s")
+    try:
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(nodes))) as ex:
+            futs = [ex.submit(copy_and_build_client_config, n, ip, ha_ip) for n, ip in nodes]
+            for f in as_completed(futs):
+                r = f.result()
+                results.append(r)
+                status = "✅ OK" if r.ok else "❌ FAIL"
+                print(f"{status} | {r.node} ({r.ip}) | paso={r.step} | {r.message} | {r.duration_sec:.2f}s")
+    finally:
+        pool_stats = SSH_POOL.stats()
+        SSH_POOL.cerrar_todo()
 
     ok_count = sum(1 for r in results if r.ok)
     fail_count = len(results) - ok_count
@@ -308,6 +396,7 @@ def main() -> int:
     print("\nResumen final:")
     print(f"  OK:   {ok_count}")
     print(f"  FAIL: {fail_count}")
+    print(f"  SSH:  {pool_stats['conexiones']} conexiones, {pool_stats['canales']} comandos")
 
     if WRITE_REPORT_JSON:
         payload = {
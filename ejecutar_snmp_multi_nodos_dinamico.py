@@ -2,25 +2,96 @@ cat > /root/ejecutar_snmp_multi_nodos_dinamico.py <<'PY'
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
+import codecs
+import collections
 import getpass
+import hashlib
+import importlib.util
 import ipaddress
+import os
 import re
+import selectors
 import shlex
-import socket
+import stat
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 
-try:
-    import paramiko
-except ImportError:
+# paramiko lo usa ssh_pool.py; se revisa acá para dar la instrucción de instalación
+if importlib.util.find_spec("paramiko") is None:
     print("[ERROR] Falta paramiko.")
     print("Instala con:")
     print("  apt-get update && apt-get install -y python3-paramiko")
     sys.exit(1)
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    from ssh_pool import SSHPool, barrido
+    from inventario import agregar_argumentos, nodos_desde_args
+    from flota import Bitacora, Despliegue, agregar_argumentos_despliegue, aplicar_resume, despliegue_desde_args
+except ImportError as e:
+    print(f"[ERROR] Falta {e.name}.py.")
+    print("El instalador (este mismo archivo, pegado o con bash) deja ssh_pool.py, inventario.py y flota.py")
+    print("junto al script; si no pudo bajarlos, cópialos a mano en:")
+    print(f"  {os.path.dirname(os.path.abspath(__file__))}/")
+    sys.exit(1)
+
 
 SCRIPT_URL = "https://raw.githubusercontent.com/dlvargas123/preparar_nodos_k8s_v2/refs/heads/main/configurar_snmp.py"
 
+# De dónde sale configurar_snmp.py:
+#   local = se sube por SFTP desde esta máquina (no necesita internet en los nodos)
+#   url   = cada nodo hace curl a SCRIPT_URL (comportamiento original)
+#   auto  = local si existe SCRIPT_LOCAL, si no url
+ORIGEN_SCRIPT = "auto"
+
+SCRIPT_LOCAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "configurar_snmp.py")
+
+# Archivos extra que viajan junto al script (opcional). Todo lo que haya en esta carpeta
+# queda en el mismo directorio remoto; si hay .deb se instalan con dpkg antes de correr
+# el script (snmpd sin apt/internet).
+PAYLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "snmp_payload")
+
+# En el nodo: /var/tmp/snmp_push-<hash>/ . Si ya está con el mismo hash no se vuelve a subir.
+# Solo se usa si es del usuario SSH y nadie más puede escribir; root copia el paquete a un
+# directorio temporal propio (mktemp -d) y verifica y ejecuta desde ahí.
+CACHE_REMOTO_PREFIJO = "/var/tmp/snmp_push-"
+
+# Nodos a la vez (se puede cambiar al arrancar)
+MAX_PARALELO = 10
+
+# Salida en pantalla:
+#   tabla   = tabla de estado en vivo; la salida de cada nodo va a su log
+#   prefijo = salida de todos los nodos línea por línea con [ip] adelante
+#   buffer  = la salida completa de cada nodo en bloque al terminar ese nodo
+#   auto    = tabla si la terminal es interactiva, prefijo si no (cron, pipe, nohup)
+MODO_SALIDA = "auto"
+
+# Un log por nodo, siempre (snmp_logs_YYYYMMDD_HHMMSS/<ip>.log)
+LOG_DIR_PREFIJO = "snmp_logs"
+
+# Precheck de toda la flota a la vez (TCP/22 + banner + login) antes de ejecutar
+PLAZO_BARRIDO = 15
+
+# Despliegue por olas: CANARY nodos primero, luego olas de LOTE_PCT% de la flota.
+# Si fallan más de MAX_FALLAS (N o "N%"; "" = sin límite) no se lanzan más nodos y
+# se pausa: con terminal se pregunta si seguir, sin terminal se detiene (--resume).
+CANARY = 0
+LOTE_PCT = 100
+MAX_FALLAS = ""
+
+# Journal por nodo: con --resume solo se ejecuta en los que fallaron o no terminaron.
+# El paso lleva la huella del script (hash del paquete o URL): un OK con otro script
+# no cuenta como hecho y el nodo se vuelve a ejecutar.
+JOURNAL = "snmp.journal.jsonl"
+
+# Salida que se guarda en memoria por nodo para el resumen (el log tiene todo)
+MAX_COLA_BYTES = 64 * 1024
+
 
 def pedir_ips():
     print("Pega las IPs objetivo.")
@@ -71,109 +142,562 @@ def pedir_ips():
     return ips
 
 
-def check_ssh(ip, port=22, timeout=5):
-    try:
-        with socket.create_connection((ip, port), timeout=timeout):
+class LectorCanales:
+    """
+    Un solo hilo con un selector para TODOS los canales SSH abiertos (uno por nodo en curso).
+    paramiko expone en channel.fileno() un pipe que se marca legible cuando llega stdout,
+    stderr o EOF: la salida se entrega apenas llega, sin sleep ni polling por nodo.
+    De cada canal se guarda solo la cola (últimos max_cola bytes) para el resumen.
+    """
+
+    def __init__(self, max_cola=MAX_COLA_BYTES):
+        self.max_cola = max_cola
+        self.sel = selectors.DefaultSelector()
+        self.lock = threading.Lock()
+        self.pendientes = []
+        self.despertar_r, self.despertar_w = os.pipe()
+        os.set_blocking(self.despertar_r, False)
+        self.sel.register(self.despertar_r, selectors.EVENT_READ, None)
+        threading.Thread(target=self._loop, name="lector-canales", daemon=True).start()
+
+    def _avisar(self):
+        try:
+            os.write(self.despertar_w, b"x")
+        except BlockingIOError:
+            pass
+
+    def leer(self, channel, on_output, timeout):
+        """
+        Bloquea al hilo del nodo hasta EOF o timeout. Retorna (terminó, cola_de_salida).
+        """
+        ctx = {
+            "channel": channel,
+            "on_output": on_output,
+            "fin": threading.Event(),
+            "cola": collections.deque(),
+            "cola_bytes": 0,
+            "dec_out": codecs.getincrementaldecoder("utf-8")(errors="replace"),
+            "dec_err": codecs.getincrementaldecoder("utf-8")(errors="replace"),
+        }
+
+        with self.lock:
+            self.pendientes.append(("alta", ctx))
+        self._avisar()
+
+        termino = ctx["fin"].wait(timeout)
+
+        if not termino:
+            with self.lock:
+                self.pendientes.append(("baja", ctx))
+            self._avisar()
+
+        return termino, "".join(ctx["cola"])
+
+    def _entregar(self, ctx, texto):
+        if not texto:
+            return
+
+        ctx["on_output"](texto)
+        ctx["cola"].append(texto)
+        ctx["cola_bytes"] += len(texto)
+
+        while ctx["cola_bytes"] > self.max_cola and len(ctx["cola"]) > 1:
+            ctx["cola_bytes"] -= len(ctx["cola"].popleft())
+
+    def _drenar(self, ctx):
+        ch = ctx["channel"]
+
+        # EOF se mira ANTES de drenar: si llegó junto con el último bloque, ese bloque ya
+        # está en el buffer y se lee abajo (mirarlo después podía perderlo)
+        fin = ch.eof_received or ch.closed
+
+        while ch.recv_ready():
+            self._entregar(ctx, ctx["dec_out"].decode(ch.recv(32768)))
+
+        while ch.recv_stderr_ready():
+            self._entregar(ctx, ctx["dec_err"].decode(ch.recv_stderr(32768)))
+
+        # EOF: el pipe queda legible para siempre; se da de baja y el hilo del nodo
+        # espera el exit status (llega junto o inmediatamente después)
+        if fin:
+            self._entregar(ctx, ctx["dec_out"].decode(b"", final=True))
+            self._entregar(ctx, ctx["dec_err"].decode(b"", final=True))
             return True
-    except OSError:
-        return False
-
 
-def ejecutar_en_nodo(ip, ssh_user, ssh_password, sudo_password, timeout=900):
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        return False
 
-    try:
-        print(f"[INFO] Conectando por SSH a {ssh_user}@{ip} ...")
-
-        client.connect(
-            hostname=ip,
-            username=ssh_user,
-            password=ssh_password,
-            timeout=15,
-            banner_timeout=15,
-            auth_timeout=15,
-            look_for_keys=False,
-            allow_agent=False,
+    def _loop(self):
+        while True:
+            for key, _ in self.sel.select():
+                if key.data is None:
+                    try:
+                        while os.read(self.despertar_r, 4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+
+                    with self.lock:
+                        pendientes, self.pendientes = self.pendientes, []
+
+                    for accion, ctx in pendientes:
+                        if accion == "alta":
+                            self.sel.register(ctx["channel"], selectors.EVENT_READ, ctx)
+                            # por si ya había datos antes de registrar
+                            if self._drenar(ctx):
+                                self.sel.unregister(ctx["channel"])
+                                ctx["fin"].set()
+                        elif ctx["channel"] in self.sel.get_map():
+                            self.sel.unregister(ctx["channel"])
+                    continue
+
+                ctx = key.data
+                try:
+                    terminado = self._drenar(ctx)
+                except Exception as e:
+                    self._entregar(ctx, f"\n[ERROR] Leyendo canal: {e}\n")
+                    terminado = True
+
+                if terminado:
+                    self.sel.unregister(ctx["channel"])
+                    ctx["fin"].set()
+
+
+_lector = None
+_lector_lock = threading.Lock()
+
+
+def lector_canales():
+    global _lector
+
+    with _lector_lock:
+        if _lector is None:
+            _lector = LectorCanales()
+        return _lector
+
+
+def sha256_hex(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def armar_paquete(script_path, payload_dir):
+    """
+    Lee una sola vez configurar_snmp.py + payload y arma el paquete que se sube a los nodos.
+    El hash del paquete es el sha256 del SHA256SUMS, así cualquier cambio en cualquier
+    archivo da otro directorio remoto.
+    """
+    with open(script_path, "rb") as f:
+        archivos = [("configurar_snmp.py", f.read())]
+
+    if os.path.isdir(payload_dir):
+        for nombre in sorted(os.listdir(payload_dir)):
+            ruta = os.path.join(payload_dir, nombre)
+
+            if not os.path.isfile(ruta) or nombre in ("configurar_snmp.py", "SHA256SUMS"):
+                continue
+
+            with open(ruta, "rb") as f:
+                archivos.append((nombre, f.read()))
+
+    sums = "".join(f"{sha256_hex(data)}  {nombre}\n" for nombre, data in archivos).encode()
+    paquete_hash = sha256_hex(sums)
+
+    return {
+        "hash": paquete_hash,
+        "dir": CACHE_REMOTO_PREFIJO + paquete_hash[:16],
+        "archivos": archivos,
+        "sums": sums,
+        "bytes": sum(len(data) for _, data in archivos),
+    }
+
+
+def uid_remoto(client):
+    _, stdout, _ = client.exec_command("id -u", timeout=15)
+    return int(stdout.read().decode().strip())
+
+
+def revisar_cache(sftp, remoto, uid):
+    """
+    El nombre del directorio de caché es predecible: cualquier usuario del nodo podría
+    crearlo antes. Solo se usa si es un directorio (no symlink) del usuario SSH y sin
+    escritura para grupo/otros; si no, se corta el nodo.
+    """
+    st = sftp.lstat(remoto)
+
+    if not stat.S_ISDIR(st.st_mode):
+        raise RuntimeError(f"{remoto} existe en el nodo y no es un directorio; bórralo a mano")
+
+    if st.st_uid != uid or st.st_mode & 0o022:
+        raise RuntimeError(
+            f"{remoto} es de uid {st.st_uid} (modo {stat.S_IMODE(st.st_mode):o}); se esperaba uid {uid} "
+            f"sin escritura para grupo/otros. No se usa: bórralo a mano"
         )
 
-        print(f"[INFO] SSH conectado en {ip}")
-        print(f"[INFO] Ejecutando sudo su y configurar_snmp.py en {ip}")
 
-        comando_root = (
-            "export DEBIAN_FRONTEND=noninteractive "
-            "NEEDRESTART_MODE=a "
-            "NEEDRESTART_SUSPEND=1 "
-            "APT_LISTCHANGES_FRONTEND=none "
-            "TERM=dumb; "
-            f"curl -fsSL {shlex.quote(SCRIPT_URL)} | python3 -"
-        )
+def subir_paquete(client, paquete, on_output):
+    """
+    Sube el paquete por SFTP si no está ya en el nodo. SHA256SUMS se escribe al final,
+    así que si existe el directorio está completo. Devuelve True si hubo transferencia.
+    Lo que haya en el directorio no se ejecuta tal cual: ver comando_paquete().
+    """
+    remoto = paquete["dir"]
+    uid = uid_remoto(client)
+    sftp = client.open_sftp()
 
-        if ssh_user == "root":
-            comando_final = f"bash -lc {shlex.quote(comando_root)}"
-        else:
-            comando_final = f"sudo -S -p '' su - root -c {shlex.quote(comando_root)}"
+    try:
+        try:
+            sftp.mkdir(remoto, mode=0o700)
+        except IOError:
+            # ya existe (corrida anterior): se usa solo si es nuestro
+            pass
 
-        stdin, stdout, stderr = client.exec_command(
-            comando_final,
-            get_pty=False,
-            timeout=timeout,
-        )
+        revisar_cache(sftp, remoto, uid)
 
-        if ssh_user != "root":
-            stdin.write(sudo_password + "\n")
-            stdin.flush()
+        try:
+            sftp.stat(f"{remoto}/SHA256SUMS")
+            on_output(f"[INFO] Paquete {paquete['hash'][:16]} ya está en el nodo, no se sube.\n")
+            return False
+        except IOError:
+            pass
 
-        salida = []
-        inicio = time.time()
+        on_output(f"[INFO] Subiendo paquete {paquete['hash'][:16]} ({paquete['bytes']} bytes) a {remoto}\n")
 
-        while not stdout.channel.exit_status_ready():
-            if stdout.channel.recv_ready():
-                texto = stdout.channel.recv(4096).decode("utf-8", errors="replace")
-                salida.append(texto)
-                print(texto, end="")
+        for nombre, data in paquete["archivos"] + [("SHA256SUMS", paquete["sums"])]:
+            # nombre único: dos corridas a la vez contra el mismo nodo no se pisan
+            tmp = f"{remoto}/.{nombre}.{os.urandom(4).hex()}.part"
 
-            if stdout.channel.recv_stderr_ready():
-                texto = stderr.channel.recv_stderr(4096).decode("utf-8", errors="replace")
-                salida.append(texto)
-                print(texto, end="")
+            try:
+                with sftp.open(tmp, "wb") as f:
+                    f.set_pipelined(True)
+                    f.write(data)
 
-            if time.time() - inicio > timeout:
-                stdout.channel.close()
-                return False, 124, "Timeout ejecutando comando remoto."
+                sftp.posix_rename(tmp, f"{remoto}/{nombre}")
+            except Exception:
+                try:
+                    sftp.remove(tmp)
+                except IOError:
+                    pass
+                raise
 
-            time.sleep(0.5)
+        return True
 
-        while stdout.channel.recv_ready():
-            texto = stdout.channel.recv(4096).decode("utf-8", errors="replace")
-            salida.append(texto)
+    finally:
+        sftp.close()
+
+
+def comando_paquete(paquete):
+    """
+    Ya como root: copia los archivos del paquete (solo los nombres conocidos) a un
+    directorio nuevo de mktemp -d, verifica ahí que SHA256SUMS tenga el hash esperado y
+    que cada archivo coincida, instala solo los .deb del paquete y corre el script desde
+    esa copia. Así nadie con acceso al directorio de caché puede cambiar lo que ejecuta
+    root. Si la verificación falla se borra la caché para que la próxima corrida la vuelva
+    a subir.
+    """
+    remoto = shlex.quote(paquete["dir"])
+    nombres = [nombre for nombre, _ in paquete["archivos"]] + ["SHA256SUMS"]
+    debs = [nombre for nombre in nombres if nombre.endswith(".deb")]
+
+    comando = (
+        "run=$(mktemp -d /tmp/snmp_run.XXXXXXXX) || exit 97; "
+        "trap 'rm -rf \"$run\"' EXIT; "
+        f"for f in {' '.join(shlex.quote(n) for n in nombres)}; do "
+        f"cp -- {remoto}/\"$f\" \"$run/$f\" || exit 97; done; "
+        "cd \"$run\" || exit 97; "
+        f"if [ \"$(sha256sum < SHA256SUMS | cut -d' ' -f1)\" != {shlex.quote(paquete['hash'])} ] "
+        f"|| ! sha256sum -c --quiet SHA256SUMS; then "
+        f"echo '[ERROR] paquete corrupto en el nodo, se borra para resubir'; rm -rf {remoto}; exit 97; fi; "
+    )
+
+    if debs:
+        comando += f"dpkg -i {' '.join('./' + shlex.quote(n) for n in debs)} || exit 98; "
+
+    return comando + "python3 configurar_snmp.py"
+
+
+def nuevo_pool(ssh_user, ssh_password):
+    # usuario/contraseña ingresados al arrancar, sin llaves ni agente (igual que antes)
+    return SSHPool(user=ssh_user, password=ssh_password, timeout=15, usar_ssh_config=False)
+
+
+def ejecutar_en_nodo(ip, ssh_user, ssh_password, sudo_password, timeout=900, on_output=None, on_estado=None, paquete=None, pool=None):
+    """
+    on_output(texto): recibe la salida remota a medida que llega (por defecto print).
+    on_estado(estado): CONECTANDO / SUBIENDO / EJECUTANDO, para la tabla de estado.
+    paquete: resultado de armar_paquete() para subir el script por SFTP; None = curl a SCRIPT_URL.
+    pool: SSHPool compartido (una conexión por nodo para subida + ejecución); None = uno propio.
+    """
+    if on_output is None:
+        def on_output(texto):
             print(texto, end="")
 
-        while stdout.channel.recv_stderr_ready():
-            texto = stderr.channel.recv_stderr(4096).decode("utf-8", errors="replace")
-            salida.append(texto)
-            print(texto, end="")
+    if on_estado is None:
+        def on_estado(estado):
+            pass
+
+    pool_propio = pool is None
+    if pool_propio:
+        pool = nuevo_pool(ssh_user, ssh_password)
+
+    try:
+        on_estado("CONECTANDO")
+        on_output(f"[INFO] Conectando por SSH a {ssh_user}@{ip} ...\n")
+
+        with pool.canal(ip) as client:
+            on_output(f"[INFO] SSH conectado en {ip}\n")
+
+            if paquete is not None:
+                on_estado("SUBIENDO")
+                subir_paquete(client, paquete, on_output)
+                comando_script = comando_paquete(paquete)
+            else:
+                comando_script = f"curl -fsSL {shlex.quote(SCRIPT_URL)} | python3 -"
+
+            on_estado("EJECUTANDO")
+            on_output(f"[INFO] Ejecutando sudo su y configurar_snmp.py en {ip}\n")
+
+            comando_root = (
+                "export DEBIAN_FRONTEND=noninteractive "
+                "NEEDRESTART_MODE=a "
+                "NEEDRESTART_SUSPEND=1 "
+                "APT_LISTCHANGES_FRONTEND=none "
+                "TERM=dumb; "
+                f"{comando_script}"
+            )
+
+            if ssh_user == "root":
+                comando_final = f"bash -lc {shlex.quote(comando_root)}"
+            else:
+                comando_final = f"sudo -S -p '' su - root -c {shlex.quote(comando_root)}"
+
+            stdin, stdout, stderr = client.exec_command(
+                comando_final,
+                get_pty=False,
+                timeout=timeout,
+            )
+
+            if ssh_user != "root":
+                stdin.write(sudo_password + "\n")
+                stdin.flush()
+
+            termino, cola = lector_canales().leer(stdout.channel, on_output, timeout)
+
+            if not termino:
+                stdout.channel.close()
+                return False, 124, (cola.strip() + "\nTimeout ejecutando comando remoto.").strip()
 
-        rc = stdout.channel.recv_exit_status()
-        salida_texto = "".join(salida).strip()
+            rc = stdout.channel.recv_exit_status()
+            salida_texto = cola.strip()
 
-        if rc == 0:
-            return True, rc, salida_texto
+            if rc == 0:
+                return True, rc, salida_texto
 
-        return False, rc, salida_texto
+            return False, rc, salida_texto
 
     except Exception as e:
         return False, 255, str(e)
 
     finally:
-        client.close()
+        if pool_propio:
+            pool.cerrar_todo()
+
+
+class SalidaNodo:
+    """
+    Recibe la salida de UN nodo: la escribe a su log y, según el modo, la muestra con
+    prefijo [ip] por líneas completas (sin mezclarse con otros nodos) o la guarda para
+    mostrarla en bloque al final del nodo.
+    """
+
+    def __init__(self, ip, modo, log_dir, print_lock, estado):
+        self.ip = ip
+        self.modo = modo
+        self.print_lock = print_lock
+        self.estado = estado
+        self.pendiente = ""
+        self.bloque = []
+        self.log = open(os.path.join(log_dir, f"{ip}.log"), "w", encoding="utf-8")
+
+    def __call__(self, texto):
+        self.log.write(texto)
+        self.log.flush()
+
+        self.pendiente += texto.replace("\r", "\n")
+        *lineas, self.pendiente = self.pendiente.split("\n")
+        lineas = [ln for ln in lineas if ln.strip()]
+
+        if lineas:
+            self.estado.ultima_linea(self.ip, lineas[-1])
+
+        if self.modo == "prefijo" and lineas:
+            with self.print_lock:
+                for ln in lineas:
+                    print(f"[{self.ip}] {ln}")
+        elif self.modo == "buffer":
+            self.bloque.append(texto)
+
+    def cerrar(self):
+        if self.pendiente.strip():
+            self.estado.ultima_linea(self.ip, self.pendiente)
+            if self.modo == "prefijo":
+                with self.print_lock:
+                    print(f"[{self.ip}] {self.pendiente}")
+        self.pendiente = ""
+
+        if self.modo == "buffer" and self.bloque:
+            with self.print_lock:
+                print("")
+                print(f"========== {self.ip} ==========")
+                print("".join(self.bloque).rstrip())
+
+        self.log.close()
+
+
+class EstadoNodos:
+    """
+    Estado de cada nodo para la tabla en vivo (thread-safe).
+    """
+
+    def __init__(self, ips):
+        self.lock = threading.Lock()
+        self.nodos = {ip: {"estado": "PENDIENTE", "inicio": None, "fin": None, "ultima": ""} for ip in ips}
+
+    def cambiar(self, ip, estado):
+        with self.lock:
+            nodo = self.nodos[ip]
+            nodo["estado"] = estado
+            if nodo["inicio"] is None and estado != "OMITIDO":
+                nodo["inicio"] = time.time()
+            if estado in ("OK", "FAIL"):
+                nodo["fin"] = time.time()
+
+    def ultima_linea(self, ip, linea):
+        with self.lock:
+            self.nodos[ip]["ultima"] = linea.strip()
+
+    def conteo(self):
+        with self.lock:
+            cuenta = {}
+            for nodo in self.nodos.values():
+                cuenta[nodo["estado"]] = cuenta.get(nodo["estado"], 0) + 1
+            return cuenta
+
+    def render(self, ancho):
+        ahora = time.time()
+        filas = []
+        with self.lock:
+            for ip, nodo in self.nodos.items():
+                dur = "" if nodo["inicio"] is None else f"{int((nodo['fin'] or ahora) - nodo['inicio'])}s"
+                fila = f"{ip:<16} {nodo['estado']:<11} {dur:>6}  {nodo['ultima']}"
+                filas.append(fila[:ancho - 1])
+        return filas
+
+
+def ancho_terminal():
+    try:
+        return os.get_terminal_size().columns
+    except OSError:
+        return 120
+
+
+def dibujar_tabla(estado, total, stop, print_lock, reiniciar=None):
+    """
+    Redibuja la tabla cada segundo (ANSI: subir el cursor y borrar líneas) hasta que stop se active.
+    Si reiniciar está activo se dibuja debajo de lo último impreso (p. ej. después de una pregunta).
+    """
+    lineas_previas = 0
+
+    while True:
+        cuenta = estado.conteo()
+        en_curso = sum(cuenta.get(e, 0) for e in ("CONECTANDO", "SUBIENDO", "EJECUTANDO"))
+        filas = [
+            f"Nodos: {total} | en curso: {en_curso} | OK: {cuenta.get('OK', 0)} | "
+            f"FAIL: {cuenta.get('FAIL', 0)} | pendientes: {cuenta.get('PENDIENTE', 0) + cuenta.get('OMITIDO', 0)}",
+            f"{'IP':<16} {'ESTADO':<11} {'TIEMPO':>6}  ÚLTIMA LÍNEA",
+        ] + estado.render(ancho_terminal())
+
+        with print_lock:
+            if reiniciar is not None and reiniciar.is_set():
+                reiniciar.clear()
+                lineas_previas = 0
+            if lineas_previas:
+                sys.stdout.write(f"\x1b[{lineas_previas}F")
+            for fila in filas:
+                sys.stdout.write("\x1b[2K" + fila + "\n")
+            sys.stdout.flush()
+
+        lineas_previas = len(filas)
+
+        if stop.is_set():
+            return
+
+        stop.wait(1.0)
+
+
+def procesar_nodo(ip, ssh_user, ssh_password, sudo_password, modo, log_dir, print_lock, estado, paquete=None, pool=None, alcance=None):
+    salida = SalidaNodo(ip, modo, log_dir, print_lock, estado)
+
+    try:
+        estado.cambiar(ip, "CONECTANDO")
+
+        if alcance is not None and not alcance.ok:
+            salida(f"[FAIL] precheck SSH: {alcance.mensaje}\n")
+            return False, 255, f"precheck SSH: {alcance.mensaje}"
+
+        return ejecutar_en_nodo(
+            ip=ip,
+            ssh_user=ssh_user,
+            ssh_password=ssh_password,
+            sudo_password=sudo_password,
+            on_output=salida,
+            on_estado=lambda e: estado.cambiar(ip, e),
+            paquete=paquete,
+            pool=pool,
+        )
+
+    finally:
+        if pool is not None:
+            pool.cerrar(ip)
+        salida.cerrar()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Ejecuta configurar_snmp.py en varios nodos por SSH + sudo su",
+        epilog=(
+            "Sin --inventario/--selector se piden las IPs por pantalla. "
+            "Contraseñas: $SSH_PASSWORD y $SUDO_PASSWORD (si no están, se piden; "
+            "sin terminal, sudo usa la misma del SSH). Sin terminal --usuario es obligatorio "
+            f"y --paralelo vale {MAX_PARALELO} si no viene."
+        ),
+    )
+    agregar_argumentos(parser)
+    parser.add_argument("--usuario", help="Usuario SSH (si no viene, se pide; sin terminal es obligatorio)")
+    parser.add_argument("--paralelo", type=int, help=f"Nodos en paralelo (si no viene, se pide; sin terminal o vacío: {MAX_PARALELO})")
+    parser.add_argument("--salida", choices=["auto", "tabla", "prefijo", "buffer"], default=MODO_SALIDA)
+    parser.add_argument("--journal", default=JOURNAL, help=f"Journal de la corrida (default: {JOURNAL})")
+    parser.add_argument("--resume", action="store_true", help="Reanudar: solo nodos que fallaron o no terminaron según el journal")
+    agregar_argumentos_despliegue(parser, canary=CANARY, porcentaje=LOTE_PCT, max_fallas=MAX_FALLAS)
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
+    interactivo = sys.stdin.isatty()
+
     print("=== Ejecutar configurar_snmp.py por SSH + sudo su ===")
     print("")
 
-    ips = pedir_ips()
+    try:
+        ips = nodos_desde_args(args)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+    if ips is None:
+        ips = pedir_ips()
+    elif not ips:
+        print("[ERROR] El inventario / selector no devolvió ningún nodo.")
+        sys.exit(1)
 
     print("")
     print("IPs cargadas:")
@@ -182,16 +706,29 @@ def main():
     print(f"Total: {len(ips)}")
     print("")
 
-    ssh_user = input("Usuario SSH: ").strip()
+    # sin terminal (cron, pipeline) no se pregunta nada: lo que falte es error o default
+    if not interactivo and not args.usuario:
+        print("[ERROR] Sin terminal: indica el usuario SSH con --usuario.")
+        sys.exit(1)
+
+    if not interactivo and not os.environ.get("SSH_PASSWORD"):
+        print("[ERROR] Sin terminal: exporta la contraseña SSH en $SSH_PASSWORD.")
+        sys.exit(1)
+
+    ssh_user = (args.usuario or input("Usuario SSH: ")).strip()
 
     if not ssh_user:
         print("[ERROR] Usuario SSH vacío.")
         sys.exit(1)
 
-    ssh_password = getpass.getpass("Contraseña SSH: ")
+    ssh_password = os.environ.get("SSH_PASSWORD") or getpass.getpass("Contraseña SSH: ")
 
     if ssh_user == "root":
         sudo_password = ""
+    elif os.environ.get("SUDO_PASSWORD"):
+        sudo_password = os.environ["SUDO_PASSWORD"]
+    elif not interactivo:
+        sudo_password = ssh_password
     else:
         mismo_pass = input("¿La contraseña de sudo su es la misma del SSH? [S/n]: ").strip().lower()
 
@@ -200,38 +737,180 @@ def main():
         else:
             sudo_password = getpass.getpass("Contraseña sudo su: ")
 
+    if args.paralelo is not None:
+        paralelo = args.paralelo
+    elif not interactivo:
+        paralelo = MAX_PARALELO
+    else:
+        paralelo_txt = input(f"Nodos en paralelo [{MAX_PARALELO}]: ").strip()
+
+        try:
+            paralelo = int(paralelo_txt) if paralelo_txt else MAX_PARALELO
+        except ValueError:
+            print(f"[ERROR] Valor inválido para nodos en paralelo: {paralelo_txt}")
+            sys.exit(1)
+
+    paralelo = max(1, min(paralelo, len(ips)))
+
+    modo = args.salida
+    if modo == "auto":
+        modo = "tabla" if sys.stdout.isatty() else "prefijo"
+
+    origen = ORIGEN_SCRIPT
+    if origen == "auto":
+        origen = "local" if os.path.isfile(SCRIPT_LOCAL) else "url"
+
+    paquete = None
+
+    if origen == "local":
+        try:
+            paquete = armar_paquete(SCRIPT_LOCAL, PAYLOAD_DIR)
+        except OSError as e:
+            print(f"[ERROR] No se pudo leer {SCRIPT_LOCAL}: {e}")
+            sys.exit(1)
+
+        nombres = ", ".join(nombre for nombre, _ in paquete["archivos"])
+        print(f"[INFO] Script local por SFTP: {nombres} (hash {paquete['hash'][:16]}, {paquete['bytes']} bytes)")
+    else:
+        print(f"[INFO] Script desde {SCRIPT_URL} (curl en cada nodo)")
+
+    huella = paquete["hash"][:16] if paquete else SCRIPT_URL
+    paso = f"snmp@{huella}"
+    parametros = {"script": paquete["hash"] if paquete else SCRIPT_URL, "usuario": ssh_user}
+    bitacora = Bitacora(args.journal, "snmp", parametros, reanudar=args.resume)
+    ya_ok = []
+
+    if args.resume:
+        if bitacora.parametros_cambiaron():
+            print(f"[INFO] Cambió el script ({huella}): los nodos OK con el script anterior se vuelven a ejecutar.")
+
+        pendientes = aplicar_resume(bitacora, ips, paso)
+        ya_ok = [ip for ip in ips if ip not in pendientes]
+        ips = pendientes
+
+        if not ips:
+            print("[INFO] No hay nodos pendientes.")
+            bitacora.cerrar()
+            return
+
+        paralelo = max(1, min(paralelo, len(ips)))
+
+    log_dir = f"{LOG_DIR_PREFIJO}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    os.makedirs(log_dir, exist_ok=True)
+
     ok_nodes = []
     fail_nodes = []
+    no_lanzados = []
+    errores = {}
+
+    print_lock = threading.Lock()
+    estado = EstadoNodos(ips)
+    pool = nuevo_pool(ssh_user, ssh_password)
+
+    stop_tabla = threading.Event()
+    reiniciar_tabla = threading.Event()
+    hilo_tabla = None
+
+    def avisar(texto):
+        if modo != "tabla":
+            with print_lock:
+                print(texto)
+
+    def preguntar(mensaje):
+        with print_lock:
+            seguir = Despliegue.preguntar_consola(mensaje)
+            reiniciar_tabla.set()
+            return seguir
+
+    despliegue = despliegue_desde_args(args, ips, preguntar=preguntar, avisar=avisar)
 
     print("")
-    print("[INFO] Iniciando ejecución nodo por nodo...")
+    print(f"[INFO] Iniciando ejecución: {paralelo} nodos en paralelo ({despliegue.describir()}; salida: {modo}, logs en {log_dir}/)")
     print("")
 
-    for ip in ips:
-        print("")
-        print(f"========== {ip} ==========")
-
-        if not check_ssh(ip):
-            print(f"[FAIL] {ip}: puerto 22 no responde.")
-            fail_nodes.append(ip)
-            continue
+    inicio_barrido = time.time()
+    alcance = barrido(ips, pool=pool, plazo=PLAZO_BARRIDO)
+    alcanzables = sum(1 for a in alcance.values() if a.ok)
+    print(f"[INFO] Precheck SSH: {alcanzables}/{len(ips)} nodos OK en {time.time() - inicio_barrido:.1f}s")
+    for ip, a in alcance.items():
+        if not a.ok:
+            print(f"  - {ip}: {a.mensaje}")
+    print("")
 
-        ok, rc, output = ejecutar_en_nodo(
-            ip=ip,
-            ssh_user=ssh_user,
-            ssh_password=ssh_password,
-            sudo_password=sudo_password,
+    if modo == "tabla":
+        hilo_tabla = threading.Thread(
+            target=dibujar_tabla,
+            args=(estado, len(ips), stop_tabla, print_lock, reiniciar_tabla),
+            daemon=True,
         )
+        hilo_tabla.start()
 
-        if ok:
-            print(f"\n[OK] {ip}: SNMP configurado correctamente.")
-            ok_nodes.append(ip)
-        else:
-            print(f"\n[FAIL] {ip}: error rc={rc}")
-            if output:
-                print("--- Última salida/error ---")
-                print(output[-2000:])
-            fail_nodes.append(ip)
+    def lanzar(ip):
+        # si el despliegue se pausó mientras este nodo esperaba turno, no se toca
+        # (pasa a la ola siguiente si se sigue, o queda en despliegue.pendientes)
+        if not despliegue.tomar(ip):
+            return None
+
+        try:
+            resultado = procesar_nodo(ip, ssh_user, ssh_password, sudo_password, modo, log_dir, print_lock, estado, paquete, pool, alcance[ip])
+        except Exception as e:
+            resultado = (False, 255, str(e))
+
+        despliegue.anotar(ip, resultado[0])
+        return resultado
+
+    try:
+        for ola in despliegue.olas():
+            with ThreadPoolExecutor(max_workers=min(paralelo, len(ola))) as ex:
+                futuros = {ex.submit(lanzar, ip): ip for ip in ola}
+
+                for futuro in as_completed(futuros):
+                    ip = futuros[futuro]
+                    resultado = futuro.result()
+
+                    if resultado is None:
+                        continue
+
+                    ok, rc, output = resultado
+                    estado.cambiar(ip, "OK" if ok else "FAIL")
+                    bitacora.marcar(ip, paso, "ok" if ok else "fail", f"rc={rc}" if not ok else "")
+
+                    if ok:
+                        ok_nodes.append(ip)
+                    else:
+                        fail_nodes.append(ip)
+                        errores[ip] = (rc, output)
+
+                    if modo != "tabla":
+                        with print_lock:
+                            if ok:
+                                print(f"\n[OK] {ip}: SNMP configurado correctamente.")
+                            else:
+                                print(f"\n[FAIL] {ip}: error rc={rc}")
+
+        no_lanzados.extend(despliegue.pendientes)
+        for ip in no_lanzados:
+            estado.cambiar(ip, "OMITIDO")
+
+    finally:
+        stop_tabla.set()
+        if hilo_tabla is not None:
+            hilo_tabla.join()
+        pool.cerrar_todo()
+        bitacora.cerrar()
+
+    # resumen en el mismo orden en que se pegaron las IPs
+    ok_nodes = [ip for ip in ips if ip in ok_nodes]
+    fail_nodes = [ip for ip in ips if ip in fail_nodes]
+    no_lanzados = [ip for ip in ips if ip in no_lanzados]
+
+    for ip in fail_nodes:
+        rc, output = errores[ip]
+        print("")
+        print(f"[FAIL] {ip}: error rc={rc}")
+        if output:
+            print("--- Última salida/error ---")
+            print(output[-2000:])
 
     print("")
     print("========== RESUMEN ==========")
@@ -244,7 +923,20 @@ def main():
     for ip in fail_nodes:
         print(f"  - {ip}")
 
-    if fail_nodes:
+    if no_lanzados:
+        print(f"NO EJECUTADOS (despliegue detenido: {despliegue.motivo}): {len(no_lanzados)}")
+        for ip in no_lanzados:
+            print(f"  - {ip}")
+
+    if ya_ok:
+        print(f"Ya OK en corridas anteriores (omitidos): {len(ya_ok)}")
+
+    print(f"Logs por nodo: {log_dir}/")
+
+    if fail_nodes or no_lanzados:
+        print(f"Para reintentar solo los pendientes: mismo comando + --resume (journal: {args.journal})")
+
+    if fail_nodes or no_lanzados:
         sys.exit(2)
 
 
@@ -253,3 +945,22 @@ if __name__ == "__main__":
 PY
 
 chmod +x /root/ejecutar_snmp_multi_nodos_dinamico.py
+
+# Módulos compartidos que importa el script: de la carpeta actual si se corre desde el repo
+# (bash ejecutar_snmp_multi_nodos_dinamico.py), si no del mismo repo que configurar_snmp.py
+REPO_RAW="https://raw.githubusercontent.com/dlvargas123/preparar_nodos_k8s_v2/refs/heads/main"
+ORIGEN_MODULOS="$(cd "$(dirname "${BASH_SOURCE[0]:-$0}")" 2>/dev/null && pwd)"
+
+for m in ssh_pool.py inventario.py flota.py; do
+  if [ -f "$ORIGEN_MODULOS/$m" ] && [ "$ORIGEN_MODULOS" != /root ]; then
+    cp "$ORIGEN_MODULOS/$m" "/root/$m"
+  elif curl -fsSL "$REPO_RAW/$m" -o "/root/.$m.tmp"; then
+    mv "/root/.$m.tmp" "/root/$m"
+  elif [ -f "/root/$m" ]; then
+    rm -f "/root/.$m.tmp"
+    echo "[WARN] No pude bajar $m; queda la copia que ya estaba en /root/"
+  else
+    rm -f "/root/.$m.tmp"
+    echo "[ERROR] Falta /root/$m: cópialo a mano junto a /root/ejecutar_snmp_multi_nodos_dinamico.py"
+  fi
+done
@@ -0,0 +1,650 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Operaciones de flota compartidas por registro_worker_nodes.py y registro_control_plane.py.
+
+- validar_ssh: barrido de toda la flota a la vez (ssh_pool.barrido) y hostname de cada nodo.
+- registrar_nodos: corre el Registration Command en paralelo (workers, de a `lote`)
+  o de a uno (control plane: un join de etcd a la vez), y no da un nodo por terminado
+  hasta que el API lo muestra Ready.
+- VigiaReady: un solo hilo consulta `kubectl get nodes -o json` y todos los nodos
+  que están esperando leen de ahí (no un kubectl por nodo).
+- Bitacora: journal por host y paso (JSONL, una línea por evento, fsync) para que
+  --resume solo toque los nodos que fallaron o quedaron a medias.
+- Despliegue: canary primero, luego olas de X% con presupuesto de fallas; si se pasa
+  del presupuesto no se lanzan más nodos y se pausa (pregunta o se detiene).
+"""
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from inventario import pick_kubeconfig_local
+from ssh_pool import SSHPool, barrido
+
+
+_print_lock = threading.Lock()
+
+
+def log(msg: str) -> None:
+    # una línea completa por print, para que los nodos en paralelo no se mezclen
+    with _print_lock:
+        print(msg, flush=True)
+
+
+@dataclass
+class ResultadoNodo:
+    nodo: str
+    ok: bool
+    paso: str
+    mensaje: str
+    duracion: float
+
+
+# =========================
+# Journal de la corrida
+# =========================
+class Bitacora:
+    """
+    Journal append-only: cada línea es {"ts", "host", "paso", "estado", "mensaje"}.
+    Una corrida nueva escribe una cabecera {"run": ..., "nueva": true}; con reanudar=True
+    se lee el journal desde la última corrida nueva y se sigue escribiendo en el mismo.
+    Se hace fsync por línea: si se corta la VPN o se duerme el equipo, lo anotado queda.
+    """
+
+    def __init__(self, ruta: str, operacion: str, parametros: Optional[dict] = None, reanudar: bool = False):
+        self.ruta = ruta
+        self.operacion = operacion
+        self.parametros = parametros or {}
+        self._lock = threading.Lock()
+        self.estado: Dict[str, Dict[str, Tuple[str, str]]] = {}
+        self.parametros_previos: Optional[dict] = None
+
+        if reanudar and os.path.exists(ruta):
+            self._cargar()
+
+        self._f = open(ruta, "a", encoding="utf-8")
+        self._escribir({
+            "run": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "operacion": operacion,
+            "parametros": self.parametros,
+            "nueva": not reanudar,
+        })
+
+    def _cargar(self) -> None:
+        with open(self.ruta, "r", encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    ev = json.loads(linea)
+                except ValueError:
+                    # última línea cortada a la mitad: se ignora
+                    continue
+
+                if "run" in ev:
+                    if ev.get("nueva"):
+                        self.estado = {}
+                        self.parametros_previos = ev.get("parametros")
+                    continue
+
+                self.estado.setdefault(ev["host"], {})[ev["paso"]] = (ev["estado"], ev.get("mensaje", ""))
+
+    def _escribir(self, ev: dict) -> None:
+        self._f.write(json.dumps(ev, ensure_ascii=False) + "\n")
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def marcar(self, host: str, paso: str, estado: str, mensaje: str = "") -> None:
+        """estado: inicio / ok / fail"""
+        with self._lock:
+            self.estado.setdefault(host, {})[paso] = (estado, mensaje)
+            self._escribir({
+                "ts": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "host": host,
+                "paso": paso,
+                "estado": estado,
+                "mensaje": mensaje[-500:],
+            })
+
+    def ok(self, host: str, paso: str) -> bool:
+        with self._lock:
+            return self.estado.get(host, {}).get(paso, ("", ""))[0] == "ok"
+
+    def pendientes(self, hosts: List[str], paso_final: str) -> Tuple[List[str], List[str]]:
+        """(pendientes, ya_completos) según si paso_final quedó ok."""
+        hechos = [h for h in hosts if self.ok(h, paso_final)]
+        return [h for h in hosts if h not in hechos], hechos
+
+    def parametros_cambiaron(self) -> bool:
+        return self.parametros_previos is not None and self.parametros_previos != self.parametros
+
+    def cerrar(self) -> None:
+        with self._lock:
+            self._f.close()
+
+
+def aplicar_resume(bitacora: Bitacora, nodos: List[str], paso_final: str) -> List[str]:
+    """
+    Con --resume: deja solo los nodos que no terminaron `paso_final` y lo informa.
+    """
+    if bitacora.parametros_cambiaron():
+        print(f"⚠️  La corrida anterior usó otros parámetros ({bitacora.parametros_previos}); se reanuda igual.")
+
+    pendientes, hechos = bitacora.pendientes(nodos, paso_final)
+    print(f"↩️  Reanudando desde {bitacora.ruta}: {len(hechos)} ya completos (se omiten), {len(pendientes)} pendientes.")
+    for h in hechos:
+        print(f"  - {h} (ya OK)")
+    return pendientes
+
+
+# =========================
+# Despliegue por olas
+# =========================
+class Despliegue:
+    """
+    Reparte los nodos en olas: primero `canary` nodos, después olas de `porcentaje`% del total.
+
+    max_fallas: "" = sin límite, "3" = hasta 3 nodos fallidos, "10%" = hasta el 10% del total.
+    El canary no tiene presupuesto: si falla cualquier nodo del canary se pausa.
+
+    Los que ejecutan cada ola llaman tomar(nodo) antes de arrancar un nodo (False = no se
+    lanza) y anotar(nodo, ok) al terminarlo; si se pasa el presupuesto se activa `detener`
+    y al cerrar la ola se pausa:
+      - con terminal: se pregunta si seguir (las fallas hasta ahí quedan aceptadas) y los
+        nodos de la ola que no se lanzaron pasan a la ola siguiente;
+      - sin terminal: se detiene. Los nodos no lanzados quedan en `pendientes` (--resume).
+    """
+
+    def __init__(
+        self,
+        nodos: List[str],
+        canary: int = 0,
+        porcentaje: float = 100,
+        max_fallas: str = "",
+        preguntar: Optional[Callable[[str], bool]] = None,
+        avisar: Optional[Callable[[str], None]] = None,
+    ):
+        self.nodos = list(nodos)
+        self.canary = max(0, min(canary, len(self.nodos)))
+        self.porcentaje = min(100.0, max(1.0, porcentaje))
+        self.presupuesto = self._presupuesto(max_fallas, len(self.nodos))
+        self.preguntar = preguntar if preguntar is not None else self.preguntar_consola
+        self.avisar = avisar if avisar is not None else log
+
+        self.detener = threading.Event()
+        self._lock = threading.Lock()
+        self.fallas = 0
+        self._fallas_aceptadas = 0
+        self._en_canary = False
+        self._lanzados: set = set()
+        self.motivo = ""
+        self.pendientes: List[str] = []
+
+    @staticmethod
+    def _presupuesto(max_fallas: str, total: int) -> Optional[int]:
+        max_fallas = (max_fallas or "").strip()
+        if not max_fallas:
+            return None
+        if max_fallas.endswith("%"):
+            return int(total * float(max_fallas[:-1]) / 100)
+        return int(max_fallas)
+
+    @staticmethod
+    def preguntar_consola(mensaje: str) -> bool:
+        if not sys.stdin.isatty():
+            print(f"\n⏸️  {mensaje}\n   Sin terminal interactiva: se detiene el despliegue.")
+            return False
+        resp = input(f"\n⏸️  {mensaje}\n   ¿Seguir con la próxima ola? [s/N]: ").strip().lower()
+        return resp in ("s", "si", "sí", "y", "yes")
+
+    def plan(self) -> List[List[str]]:
+        olas = []
+        resto = self.nodos[self.canary:]
+        if self.canary:
+            olas.append(self.nodos[:self.canary])
+        tam = max(1, math.ceil(len(self.nodos) * self.porcentaje / 100))
+        for i in range(0, len(resto), tam):
+            olas.append(resto[i:i + tam])
+        return olas
+
+    def describir(self) -> str:
+        olas = self.plan()
+        partes = []
+        if self.canary:
+            partes.append(f"canary {self.canary}")
+        if self.porcentaje < 100:
+            partes.append(f"olas de {self.porcentaje:g}% ({len(olas) - (1 if self.canary else 0)})")
+        partes.append("sin límite de fallas" if self.presupuesto is None else f"máx. {self.presupuesto} fallas")
+        return ", ".join(partes)
+
+    def tomar(self, nodo: str) -> bool:
+        with self._lock:
+            if self.detener.is_set():
+                return False
+            self._lanzados.add(nodo)
+            return True
+
+    def anotar(self, nodo: str, ok: bool) -> None:
+        if ok:
+            return
+        with self._lock:
+            self.fallas += 1
+            nuevas = self.fallas - self._fallas_aceptadas
+            if self._en_canary:
+                self.motivo = f"falló el canary ({nodo})"
+                self.detener.set()
+            elif self.presupuesto is not None and nuevas > self.presupuesto:
+                self.motivo = f"{nuevas} fallas superan el presupuesto de {self.presupuesto}"
+                self.detener.set()
+
+    def olas(self) -> Iterator[List[str]]:
+        plan = self.plan()
+        i = 0
+
+        while i < len(plan):
+            ola = plan[i]
+            self._en_canary = bool(self.canary) and i == 0
+            nombre = "canary" if self._en_canary else f"ola {i if self.canary else i + 1}"
+            if len(plan) > 1:
+                self.avisar(f"\n🌊 {nombre}: {len(ola)} nodo(s) — {', '.join(ola)}")
+
+            yield ola
+
+            if self.detener.is_set():
+                no_lanzados = [n for n in ola if n not in self._lanzados]
+                restantes = no_lanzados + [n for o in plan[i + 1:] for n in o]
+
+                if restantes:
+                    if not self.preguntar(f"Despliegue en pausa: {self.motivo}. Quedan {len(restantes)} nodo(s) sin tocar."):
+                        self.pendientes = restantes
+                        return
+
+                    if no_lanzados:
+                        if i + 1 < len(plan):
+                            plan[i + 1] = no_lanzados + plan[i + 1]
+                        else:
+                            plan.append(no_lanzados)
+
+                with self._lock:
+                    self._fallas_aceptadas = self.fallas
+                    self.detener.clear()
+
+            i += 1
+
+
+def _max_fallas(valor: str) -> str:
+    try:
+        Despliegue._presupuesto(valor, 100)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"esperaba un número o un porcentaje (ej. 3 o 10%), no {valor!r}")
+    return valor
+
+
+def agregar_argumentos_despliegue(parser, canary: int = 0, porcentaje: float = 100, max_fallas: str = "") -> None:
+    """--canary / --lote-pct / --max-fallas, comunes a los scripts de flota."""
+    parser.add_argument("--canary", type=int, default=canary,
+                        help=f"Nodos que se hacen primero, solos; si alguno falla se pausa (default: {canary})")
+    parser.add_argument("--lote-pct", type=float, default=porcentaje,
+                        help=f"Después del canary, olas de este %% de la flota (default: {porcentaje:g})")
+    parser.add_argument("--max-fallas", type=_max_fallas, default=max_fallas,
+                        help="Presupuesto de fallas: N nodos o N%% de la flota; si se supera no se lanzan "
+                             "más nodos y se pausa (default: sin límite)")
+
+
+def despliegue_desde_args(
+    args,
+    nodos: List[str],
+    preguntar: Optional[Callable[[str], bool]] = None,
+    avisar: Optional[Callable[[str], None]] = None,
+) -> Despliegue:
+    return Despliegue(
+        nodos,
+        canary=args.canary,
+        porcentaje=args.lote_pct,
+        max_fallas=args.max_fallas,
+        preguntar=preguntar,
+        avisar=avisar,
+    )
+
+
+# =========================
+# Conectividad
+# =========================
+def validar_ssh(pool: SSHPool, nodos: List[str], paralelo: int = 32, plazo: float = 15.0) -> Dict[str, Tuple[bool, str]]:
+    """
+    Barrido de toda la flota a la vez (TCP/22 + banner + login, plazo global) y luego
+    hostname de los que respondieron (sirve para reconocer el nodo en el API).
+    Retorna {nodo: (ok, hostname o error)}.
+    """
+    inicio = time.time()
+    alcance = barrido(nodos, pool=pool, plazo=plazo)
+
+    def probar(nodo):
+        if not alcance[nodo].ok:
+            return False, alcance[nodo].mensaje
+        try:
+            rc, out, err = pool.exec(nodo, "hostname", timeout=pool.timeout)
+        except Exception as e:
+            return False, str(e)
+        if rc != 0:
+            return False, (err or out).strip()
+        return True, out.strip()
+
+    res = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(paralelo, len(nodos)))) as ex:
+        futs = {ex.submit(probar, n): n for n in nodos}
+        for f in as_completed(futs):
+            nodo = futs[f]
+            ok, info = f.result()
+            res[nodo] = (ok, info)
+            if ok:
+                log(f"➡️  SSH {nodo} ... ✅ ({info})")
+            else:
+                log(f"➡️  SSH {nodo} ... ❌")
+                if info:
+                    log(f"   🔻 {nodo}: {info}")
+
+    ok = sum(1 for v in res.values() if v[0])
+    log(f"\n   {ok}/{len(nodos)} nodos con SSH OK en {time.time() - inicio:.1f}s")
+    return res
+
+
+# =========================
+# Espera de Ready en el API
+# =========================
+class VigiaReady:
+    """
+    Consulta el API cada `intervalo` segundos mientras haya alguien esperando.
+    Un nodo se reconoce por cualquiera de sus direcciones (InternalIP, Hostname) o su nombre.
+    """
+
+    def __init__(self, kubeconfig: str, intervalo: float = 5.0):
+        self.kubeconfig = kubeconfig
+        self.intervalo = intervalo
+        self._cond = threading.Condition()
+        self._ready: Dict[str, bool] = {}
+        self._leido_desde = 0.0
+        self._error = ""
+        self._esperando = 0
+        self._hilo = None
+
+    @classmethod
+    def desde_entorno(cls, intervalo: float = 5.0, kubeconfig: Optional[str] = None) -> Optional["VigiaReady"]:
+        kc = kubeconfig or pick_kubeconfig_local()
+        return cls(kc, intervalo) if kc else None
+
+    def contexto(self) -> str:
+        p = subprocess.run(
+            ["kubectl", "--kubeconfig", self.kubeconfig, "config", "current-context"],
+            capture_output=True,
+            text=True,
+            timeout=15,
+        )
+        return p.stdout.strip() or "?"
+
+    def verificar(self) -> int:
+        """
+        Una lectura del API antes de registrar nada: si kubectl no está o el API no responde
+        es mejor saberlo ahora que tras TIMEOUT_READY por nodo. Devuelve los nodos que ve.
+        """
+        try:
+            return len(self._leer_nodos())
+        except FileNotFoundError:
+            raise RuntimeError("kubectl no está en el PATH: no se puede esperar Ready")
+        except (RuntimeError, ValueError, subprocess.TimeoutExpired) as e:
+            raise RuntimeError(f"el API no responde con {self.kubeconfig}: {e}")
+
+
+    def _leer_nodos(self) -> List[dict]:
+        p = subprocess.run(
+            ["kubectl", "--kubeconfig", self.kubeconfig, "get", "nodes", "-o", "json"],
+            capture_output=True,
+            text=True,
+            timeout=30,
+        )
+        if p.returncode != 0:
+            raise RuntimeError(p.stderr.strip() or p.stdout.strip() or f"kubectl rc={p.returncode}")
+        return json.loads(p.stdout).get("items", [])
+
+    def leer_api(self) -> Dict[str, bool]:
+        estado = {}
+        for item in self._leer_nodos():
+            ready = any(
+                c.get("type") == "Ready" and c.get("status") == "True"
+                for c in item.get("status", {}).get("conditions", [])
+            )
+            claves = [item.get("metadata", {}).get("name", "")]
+            claves += [a.get("address", "") for a in item.get("status", {}).get("addresses", [])]
+            for clave in claves:
+                if clave:
+                    estado[clave] = ready
+        return estado
+
+    def ready_ahora(self, claves: List[str]) -> bool:
+        """Consulta directa al API (sin esperar): ¿alguna de las claves está Ready?"""
+        try:
+            estado = self.leer_api()
+        except Exception:
+            return False
+        return any(estado.get(c) for c in claves if c)
+
+    def _loop(self):
+        while True:
+            desde = time.time()
+            try:
+                estado, error = self.leer_api(), ""
+            except Exception as e:
+                estado, error = None, str(e)
+
+            with self._cond:
+                if estado is not None:
+                    self._ready = estado
+                    self._leido_desde = desde
+                self._error = error
+                self._cond.notify_all()
+
+                if self._esperando == 0:
+                    self._hilo = None
+                    return
+
+            time.sleep(self.intervalo)
+
+    def esperar(self, claves: List[str], timeout: float) -> Tuple[bool, str]:
+        """
+        Bloquea hasta que alguna de las claves (IP, hostname) aparezca Ready o se cumpla el timeout.
+        Solo cuentan lecturas del API empezadas después de llamar a esperar (no un Ready viejo).
+        """
+        claves = [c for c in claves if c]
+        inicio = time.time()
+        limite = inicio + timeout
+
+        with self._cond:
+            self._esperando += 1
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._loop, daemon=True)
+                self._hilo.start()
+
+            try:
+                while True:
+                    if self._leido_desde >= inicio and any(self._ready.get(c) for c in claves):
+                        return True, "Ready"
+
+                    restante = limite - time.time()
+                    if restante <= 0:
+                        visto = [c for c in claves if c in self._ready]
+                        if visto:
+                            return False, f"registrado en el API como {visto[0]} pero no Ready tras {int(timeout)}s"
+                        detalle = f" (último error kubectl: {self._error})" if self._error else ""
+                        return False, f"no apareció en el API tras {int(timeout)}s{detalle}"
+
+                    self._cond.wait(min(restante, self.intervalo * 2))
+            finally:
+                self._esperando -= 1
+
+
+def preparar_vigia(kubeconfig: Optional[str] = None, intervalo: float = 5.0) -> Optional[VigiaReady]:
+    """
+    VigiaReady ya probado contra el API (kubeconfig explícito o el local de siempre).
+    None si no hay kubeconfig: se avisa y no se espera Ready, como antes.
+    RuntimeError si el kubeconfig pedido no existe, falta kubectl o el API no responde.
+    """
+    if kubeconfig and not os.path.isfile(kubeconfig):
+        raise RuntimeError(f"el kubeconfig {kubeconfig} no existe")
+
+    vigia = VigiaReady.desde_entorno(intervalo, kubeconfig=kubeconfig)
+    if vigia is None:
+        log("\n⚠️  No encontré kubeconfig local: no se espera Ready, solo el fin del comando.")
+        return None
+
+    nodos = vigia.verificar()
+    log(f"\n✅ API OK para esperar Ready: {vigia.kubeconfig} (contexto {vigia.contexto()}, {nodos} nodos)")
+    return vigia
+
+
+# =========================
+# Registro
+# =========================
+def registrar_nodos(
+    pool: SSHPool,
+    nodos: List[str],
+    comando: str,
+    lote: int = 10,
+    serial: bool = False,
+    vigia: Optional[VigiaReady] = None,
+    timeout_ready: float = 900,
+    hostnames: Optional[Dict[str, str]] = None,
+    bitacora: Optional[Bitacora] = None,
+    despliegue: Optional[Despliegue] = None,
+) -> List[ResultadoNodo]:
+    """
+    Corre `comando` en cada nodo y (si hay vigia) espera a que quede Ready en el API.
+    Con bitacora se anotan los pasos "registro" y "ready" por nodo; si el registro ya
+    había quedado OK en una corrida anterior y el nodo ya está Ready, no se repite.
+    Con despliegue los nodos van por olas; si el despliegue pidió detenerse, los nodos que
+    aún no arrancaron no se tocan y quedan para la ola siguiente o como "omitido".
+
+    serial=True (control plane + etcd): un nodo a la vez, el siguiente recién cuando el
+    anterior está Ready, y se detiene en el primer fallo para no dejar etcd sin quórum.
+    serial=False (workers): hasta `lote` nodos a la vez.
+    """
+    hostnames = hostnames or {}
+
+    def marcar(nodo: str, paso: str, estado: str, mensaje: str = "") -> None:
+        if bitacora is not None:
+            bitacora.marcar(nodo, paso, estado, mensaje)
+
+    def uno(nodo: str) -> Optional[ResultadoNodo]:
+        if despliegue is not None and not despliegue.tomar(nodo):
+            return None
+
+        r = _uno(nodo)
+        if despliegue is not None:
+            despliegue.anotar(nodo, r.ok)
+        return r
+
+    def _uno(nodo: str) -> ResultadoNodo:
+        inicio = time.time()
+        claves = [nodo, hostnames.get(nodo, "")]
+
+        if bitacora is not None and vigia is not None and bitacora.ok(nodo, "registro") and vigia.ready_ahora(claves):
+            log(f"➡️  REG {nodo} ... ✅ ya registrado y Ready (no se repite)")
+            marcar(nodo, "ready", "ok", "ya estaba Ready")
+            return ResultadoNodo(nodo, True, "ready", "ya estaba Ready", 0.0)
+
+        log(f"➡️  REG {nodo} ... ejecutando")
+        marcar(nodo, "registro", "inicio")
+
+        try:
+            rc, out, err = pool.exec(nodo, comando)
+        except Exception as e:
+            rc, out, err = 255, "", str(e)
+
+        if rc != 0:
+            msg = (err or out).strip() or f"rc={rc}"
+            marcar(nodo, "registro", "fail", msg)
+            log(f"➡️  REG {nodo} ... ❌")
+            log(f"   🔻 {nodo}: {msg}")
+            return ResultadoNodo(nodo, False, "registro", msg, time.time() - inicio)
+
+        marcar(nodo, "registro", "ok")
+
+        if vigia is None:
+            log(f"➡️  REG {nodo} ... ✅")
+            return ResultadoNodo(nodo, True, "registro", "comando OK (sin espera de Ready)", time.time() - inicio)
+
+        log(f"➡️  REG {nodo} ... comando OK, esperando Ready en el API")
+        ok, msg = vigia.esperar(claves, timeout_ready)
+        dur = time.time() - inicio
+        marcar(nodo, "ready", "ok" if ok else "fail", msg)
+
+        if ok:
+            log(f"➡️  REG {nodo} ... ✅ Ready ({dur:.0f}s)")
+        else:
+            log(f"➡️  REG {nodo} ... ❌")
+            log(f"   🔻 {nodo}: {msg}")
+
+        return ResultadoNodo(nodo, ok, "ready", msg, dur)
+
+    def correr(grupo: List[str]) -> List[ResultadoNodo]:
+        resultados: List[ResultadoNodo] = []
+
+        if serial:
+            for nodo in grupo:
+                r = uno(nodo)
+                if r is None:
+                    continue
+                resultados.append(r)
+                if not r.ok:
+                    break
+            return resultados
+
+        with ThreadPoolExecutor(max_workers=max(1, min(lote, len(grupo)))) as ex:
+            futs = [ex.submit(uno, n) for n in grupo]
+            for f in as_completed(futs):
+                r = f.result()
+                if r is not None:
+                    resultados.append(r)
+        return resultados
+
+    resultados: List[ResultadoNodo] = []
+    olas = despliegue.olas() if despliegue is not None else iter([nodos])
+
+    for ola in olas:
+        resultados.extend(correr(ola))
+        if serial and resultados and not resultados[-1].ok:
+            fallado = resultados[-1].nodo
+            hechos = {r.nodo for r in resultados}
+            pendientes = [n for n in nodos if n not in hechos]
+            if pendientes:
+                log(f"\n⚠️  {fallado} falló: no se registran los siguientes ({', '.join(pendientes)}).")
+            for p in pendientes:
+                resultados.append(ResultadoNodo(p, False, "omitido", f"no se intentó porque {fallado} falló", 0.0))
+            break
+
+    if despliegue is not None:
+        for p in despliegue.pendientes:
+            resultados.append(ResultadoNodo(p, False, "omitido", f"despliegue detenido: {despliegue.motivo}", 0.0))
+
+    orden = {n: i for i, n in enumerate(nodos)}
+    return sorted(resultados, key=lambda r: orden[r.nodo])
+
+
+def imprimir_resumen(resultados: List[ResultadoNodo]) -> None:
+    ok = [r for r in resultados if r.ok]
+    fail = [r for r in resultados if not r.ok]
+
+    print("\n========== RESUMEN ==========")
+    print(f"OK: {len(ok)}")
+    for r in ok:
+        print(f"  - {r.nodo} ({r.duracion:.0f}s)")
+    print(f"FAIL: {len(fail)}")
+    for r in fail:
+        print(f"  - {r.nodo} [{r.paso}] {r.mensaje}")
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Inventario compartido por los scripts de flota (registro_*.py, ejecutar_snmp_multi_nodos_dinamico.py).
+
+De dónde salen los nodos:
+  1) Archivo de inventario YAML o INI (formato Ansible, con grupos e hijos):
+
+       # hosts.yml                          # hosts.ini
+       all:                                 [control_plane]
+         children:                          10.0.0.11
+           control_plane:                   10.0.0.12
+             hosts:                         10.0.0.13
+               10.0.0.11:
+               10.0.0.12:                   [workers]
+               10.0.0.13:                   w1 ansible_host=10.0.0.14
+           workers:                         w2 ansible_host=10.0.0.15
+             hosts:
+               w1: {ansible_host: 10.0.0.14}  [k8s:children]
+               w2: {ansible_host: 10.0.0.15}  control_plane
+                                            workers
+     También vale un YAML simple:  workers: [10.0.0.14, 10.0.0.15]
+
+  2) Descubrimiento en el API de Kubernetes con label selector
+     (kubectl get nodes -l <selector>), guardado en caché por unos minutos.
+     Si el API no responde se usa la última caché que haya, avisando.
+
+Uso desde línea de comandos (lista los nodos, uno por línea):
+    python3 inventario.py --inventario hosts.yml --grupo workers
+    python3 inventario.py --selector node-role.kubernetes.io/control-plane=true
+"""
+
+import argparse
+import configparser
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+
+KUBECONFIG_CANDIDATOS = ["/root/.kube/config", "/etc/rancher/rke2/rke2.yaml"]
+
+CACHE_DIR = os.path.expanduser("~/.cache/flota")
+CACHE_TTL_SEC = 300
+
+
+def pick_kubeconfig_local() -> Optional[str]:
+    """
+    kubeconfig para consultar el API desde donde corre el script:
+    1) $KUBECONFIG (primer path si viene con :)
+    2) /root/.kube/config
+    3) /etc/rancher/rke2/rke2.yaml
+    None si no hay ninguno.
+    """
+    kc_env = os.environ.get("KUBECONFIG", "").strip()
+    candidatos = ([kc_env.split(":")[0]] if kc_env else []) + KUBECONFIG_CANDIDATOS
+
+    for c in candidatos:
+        if os.path.exists(c) and os.path.getsize(c) > 0:
+            return c
+
+    return None
+
+
+# =========================
+# Archivos de inventario
+# =========================
+class Inventario:
+    """
+    grupos: {grupo: [host, ...]}, hijos: {grupo: [subgrupo, ...]}, direccion: {host: ansible_host}
+    """
+
+    def __init__(self):
+        self.grupos: Dict[str, List[str]] = {}
+        self.hijos: Dict[str, List[str]] = {}
+        self.direccion: Dict[str, str] = {}
+
+    def _agregar_host(self, grupo: str, host: str, variables: Optional[dict] = None) -> None:
+        hosts = self.grupos.setdefault(grupo, [])
+        if host not in hosts:
+            hosts.append(host)
+        variables = variables or {}
+        if variables.get("ansible_host"):
+            self.direccion[host] = str(variables["ansible_host"])
+
+    def _agregar_hijo(self, grupo: str, hijo: str) -> None:
+        self.grupos.setdefault(grupo, [])
+        self.grupos.setdefault(hijo, [])
+        hijos = self.hijos.setdefault(grupo, [])
+        if hijo not in hijos:
+            hijos.append(hijo)
+
+    def hosts(self, grupo: str, _vistos=None) -> List[str]:
+        if grupo == "all":
+            todos = []
+            for g in self.grupos:
+                for h in self.grupos[g]:
+                    if h not in todos:
+                        todos.append(h)
+            return todos
+
+        if grupo not in self.grupos:
+            raise KeyError(grupo)
+
+        vistos = _vistos if _vistos is not None else set()
+        if grupo in vistos:
+            return []
+        vistos.add(grupo)
+
+        res = list(self.grupos[grupo])
+        for hijo in self.hijos.get(grupo, []):
+            for h in self.hosts(hijo, vistos):
+                if h not in res:
+                    res.append(h)
+        return res
+
+    def nodos(self, grupos: str = "all") -> List[str]:
+        """
+        Direcciones (ansible_host o el nombre) de uno o varios grupos separados por coma.
+        """
+        res = []
+        for grupo in [g.strip() for g in grupos.split(",") if g.strip()]:
+            try:
+                hosts = self.hosts(grupo)
+            except KeyError:
+                disponibles = ", ".join(sorted(self.grupos)) or "(ninguno)"
+                raise ValueError(f"El grupo '{grupo}' no existe en el inventario. Grupos: {disponibles}")
+            for h in hosts:
+                d = self.direccion.get(h, h)
+                if d not in res:
+                    res.append(d)
+        return res
+
+
+def _cargar_yaml(ruta: str) -> Inventario:
+    try:
+        import yaml
+    except ImportError:
+        raise RuntimeError(
+            "Falta PyYAML para leer inventarios .yml. Instala con:\n"
+            "  apt-get install -y python3-yaml   (o: pip install pyyaml)\n"
+            "o usa un inventario .ini"
+        )
+
+    with open(ruta, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+
+    if not isinstance(data, dict):
+        raise ValueError(f"{ruta}: el inventario debe ser un diccionario de grupos")
+
+    inv = Inventario()
+
+    def grupo(nombre: str, cuerpo) -> None:
+        inv.grupos.setdefault(nombre, [])
+
+        # YAML simple: grupo: [host, host]
+        if isinstance(cuerpo, list):
+            for h in cuerpo:
+                inv._agregar_host(nombre, str(h))
+            return
+
+        if not isinstance(cuerpo, dict):
+            return
+
+        for host, variables in (cuerpo.get("hosts") or {}).items():
+            inv._agregar_host(nombre, str(host), variables if isinstance(variables, dict) else None)
+
+        for hijo, cuerpo_hijo in (cuerpo.get("children") or {}).items():
+            inv._agregar_hijo(nombre, str(hijo))
+            grupo(str(hijo), cuerpo_hijo)
+
+    for nombre, cuerpo in data.items():
+        grupo(str(nombre), cuerpo)
+
+    return inv
+
+
+def _cargar_ini(ruta: str) -> Inventario:
+    inv = Inventario()
+    cp = configparser.ConfigParser(allow_no_value=True, delimiters=("\x00",), interpolation=None, strict=False)
+    cp.optionxform = str
+
+    with open(ruta, "r", encoding="utf-8") as f:
+        texto = f.read()
+
+    # hosts sueltos antes de la primera sección van a "ungrouped", como en Ansible
+    cp.read_string("[ungrouped]\n" + texto)
+
+    for seccion in cp.sections():
+        if seccion.endswith(":vars"):
+            continue
+
+        if seccion.endswith(":children"):
+            padre = seccion[: -len(":children")]
+            for hijo in cp[seccion]:
+                inv._agregar_hijo(padre, hijo.strip())
+            continue
+
+        inv.grupos.setdefault(seccion, [])
+        for linea in cp[seccion]:
+            partes = linea.split()
+            if not partes:
+                continue
+            variables = dict(p.split("=", 1) for p in partes[1:] if "=" in p)
+            inv._agregar_host(seccion, partes[0], variables)
+
+    if not inv.grupos.get("ungrouped"):
+        inv.grupos.pop("ungrouped", None)
+
+    return inv
+
+
+def cargar_inventario(ruta: str) -> Inventario:
+    if not os.path.isfile(ruta):
+        raise FileNotFoundError(f"No existe el inventario: {ruta}")
+
+    if ruta.endswith((".yml", ".yaml")):
+        return _cargar_yaml(ruta)
+
+    if ruta.endswith((".ini", ".cfg")):
+        return _cargar_ini(ruta)
+
+    # sin extensión conocida (ej: "hosts"): INI si alguna línea es una [sección]
+    with open(ruta, "r", encoding="utf-8") as f:
+        if any(re.match(r"^\[[^\]\s]+\]$", linea.strip()) for linea in f):
+            return _cargar_ini(ruta)
+
+    return _cargar_yaml(ruta)
+
+
+# =========================
+# Descubrimiento en Kubernetes
+# =========================
+def _ruta_cache(selector: str, kubeconfig: str) -> str:
+    clave = hashlib.sha1(f"{kubeconfig}|{selector}".encode()).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"nodos-{clave}.json")
+
+
+def descubrir_k8s(
+    selector: str,
+    kubeconfig: Optional[str] = None,
+    ttl: float = CACHE_TTL_SEC,
+    refrescar: bool = False,
+    solo_ready: bool = False,
+) -> List[str]:
+    """
+    InternalIP de los nodos que matchean el label selector, ordenados por nombre.
+    Se guarda en caché `ttl` segundos; si el API falla se usa la caché vieja (con aviso).
+    """
+    kubeconfig = kubeconfig or pick_kubeconfig_local()
+    if not kubeconfig:
+        raise RuntimeError("No encontré kubeconfig en $KUBECONFIG, /root/.kube/config o /etc/rancher/rke2/rke2.yaml")
+
+    ruta = _ruta_cache(f"{selector}|ready={solo_ready}", kubeconfig)
+    cache = None
+
+    if os.path.exists(ruta):
+        try:
+            with open(ruta, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = None
+
+    if cache and not refrescar and time.time() - cache.get("ts", 0) < ttl:
+        return cache["nodos"]
+
+    cmd = ["kubectl", "--kubeconfig", kubeconfig, "get", "nodes", "-o", "json"]
+    if selector:
+        cmd += ["-l", selector]
+
+    try:
+        p = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        if p.returncode != 0:
+            raise RuntimeError(p.stderr.strip() or p.stdout.strip() or f"kubectl rc={p.returncode}")
+        items = json.loads(p.stdout).get("items", [])
+    except (OSError, ValueError, RuntimeError, subprocess.TimeoutExpired) as e:
+        if cache:
+            edad = int(time.time() - cache.get("ts", 0))
+            print(f"⚠️  No pude consultar el API ({e}); uso la caché de hace {edad}s", file=sys.stderr)
+            return cache["nodos"]
+        raise RuntimeError(f"kubectl get nodes falló: {e}")
+
+    encontrados = []
+    for item in sorted(items, key=lambda i: i.get("metadata", {}).get("name", "")):
+        status = item.get("status", {})
+        if solo_ready and not any(
+            c.get("type") == "Ready" and c.get("status") == "True" for c in status.get("conditions", [])
+        ):
+            continue
+        ips = [a["address"] for a in status.get("addresses", []) if a.get("type") == "InternalIP"]
+        if ips:
+            encontrados.append(ips[0])
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = ruta + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"ts": time.time(), "selector": selector, "nodos": encontrados}, f)
+    os.replace(tmp, ruta)
+
+    return encontrados
+
+
+# =========================
+# Para los scripts
+# =========================
+def agregar_argumentos(parser: argparse.ArgumentParser, grupo_default: str = "all") -> None:
+    g = parser.add_argument_group("inventario")
+    g.add_argument("--inventario", help="Archivo de inventario YAML o INI (formato Ansible)")
+    g.add_argument("--grupo", default=grupo_default, help=f"Grupo(s) del inventario, separados por coma (default: {grupo_default})")
+    g.add_argument("--selector", help="Descubrir nodos en Kubernetes con este label selector (ej: node-role.kubernetes.io/worker=true)")
+    g.add_argument("--kubeconfig", help="kubeconfig del cluster: --selector y, en los registros, la espera de Ready "
+                                        "(default: $KUBECONFIG, /root/.kube/config, rke2.yaml)")
+    g.add_argument("--refrescar-inventario", action="store_true", help="Ignorar la caché del descubrimiento en Kubernetes")
+
+
+def nodos_desde_args(args: argparse.Namespace) -> Optional[List[str]]:
+    """
+    Nodos según --inventario / --selector (si vienen los dos, la unión en orden).
+    None si no se pasó ninguno: el script sigue con su lista fija o la pregunta interactiva.
+    """
+    if not args.inventario and not args.selector:
+        return None
+
+    nodos: List[str] = []
+
+    if args.inventario:
+        nodos += cargar_inventario(args.inventario).nodos(args.grupo)
+
+    if args.selector:
+        for n in descubrir_k8s(args.selector, args.kubeconfig, refrescar=args.refrescar_inventario):
+            if n not in nodos:
+                nodos.append(n)
+
+    return nodos
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Lista los nodos de un inventario o de Kubernetes")
+    agregar_argumentos(parser)
+    args = parser.parse_args()
+
+    if not args.inventario and not args.selector:
+        parser.error("indica --inventario y/o --selector")
+
+    try:
+        nodos = nodos_desde_args(args)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+
+    for n in nodos:
+        print(n)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
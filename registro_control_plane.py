@@ -1,61 +1,106 @@
 #!/usr/bin/env python3
-import subprocess
+import argparse
+import os
 import sys
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ssh_pool import SSHPool
+from flota import Bitacora, aplicar_resume, imprimir_resumen, preparar_vigia, registrar_nodos, validar_ssh
+from inventario import agregar_argumentos, nodos_desde_args
+
 # =========================
 # Nodos destino (Control Plane + ETCD)
 # =========================
+# Se usan si no se pasa --inventario ni --selector
 NODES = ["10.0.0.11", "10.0.0.12", "10.0.0.13"]
 
 # =========================
-# SSH runner (salida liviana)
+# Registro
 # =========================
-def run_ssh_cmd(node, cmd, label=None):
-    tag = f"{label} " if label else ""
-    print(f"➡️  {tag}{node} ...", end=" ", flush=True)
-    try:
-        subprocess.run(
-            ["ssh", f"root@{node}", cmd],
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        print("✅")
-        return True
-    except subprocess.CalledProcessError as e:
-        print("❌")
-        err = (e.stderr or "").strip()
-        if err:
-            print(f"   🔻 {node}: {err}")
-        return False
+# Control plane + etcd van de a UNO: el siguiente nodo recién se une cuando el anterior
+# está Ready, y si uno falla no se sigue (nunca dos joins de etcd a la vez).
+# Esperar Ready usa --kubeconfig o el kubeconfig local ($KUBECONFIG, /root/.kube/config o
+# /etc/rancher/rke2/rke2.yaml), probado contra el API antes de registrar. Sin kubeconfig
+# se avisa y se da por terminado al salir el comando, como antes.
+ESPERAR_READY = True
+TIMEOUT_READY = 900
+
+# Journal por nodo/paso; con --resume solo se toca lo que falló o quedó a medias
+JOURNAL = "registro_control_plane.journal.jsonl"
+
+# =========================
+# SSH (salida liviana)
+# =========================
+# Igual que `ssh root@nodo`: llaves / agente / ~/.ssh/config, pero una sola conexión
+# por nodo para la validación y el registro.
+SSH_POOL = SSHPool(user="root")
 
 # =========================
 # Validar conectividad SSH
 # =========================
 def validate_ssh_connections(nodes):
     print("\n🟣 Verificando conectividad SSH...\n")
-    all_ok = True
-    for node in nodes:
-        ok = run_ssh_cmd(node, "echo OK", label="SSH")
-        if not ok:
-            all_ok = False
-    return all_ok
+    res = validar_ssh(SSH_POOL, nodes)
+    hostnames = {n: info for n, (ok, info) in res.items() if ok}
+    return all(ok for ok, _ in res.values()), hostnames
 
 # =========================
 # PROGRAMA PRINCIPAL
 # =========================
+parser = argparse.ArgumentParser(description="Registro de Control Plane + ETCD")
+agregar_argumentos(parser, grupo_default="control_plane")
+parser.add_argument("--comando", help="Registration Command (si no viene, se usa $REGISTRATION_COMMAND o se pide por pantalla; sin terminal es obligatorio)")
+parser.add_argument("--journal", default=JOURNAL, help=f"Journal de la corrida (default: {JOURNAL})")
+parser.add_argument("--resume", action="store_true", help="Reanudar: solo nodos que fallaron o no terminaron según el journal")
+parser.add_argument("--sin-ready", action="store_true", help="No esperar Ready en el API (solo el fin del comando)")
+args = parser.parse_args()
+
+try:
+    nodes = nodos_desde_args(args)
+except (OSError, ValueError, RuntimeError) as e:
+    print(f"\n❌ ERROR: {e}\n")
+    sys.exit(1)
+
+if nodes is None:
+    nodes = NODES
+elif not nodes:
+    print("\n❌ ERROR: El inventario / selector no devolvió ningún nodo. Abortando.\n")
+    sys.exit(1)
+
 print("\n📌 Instalador de nodos (modo LITE) — Control Plane + ETCD\n")
+print(f"Nodos ({len(nodes)}): {', '.join(nodes)}")
+
+vigia = None
+if ESPERAR_READY and not args.sin_ready:
+    try:
+        vigia = preparar_vigia(args.kubeconfig)
+    except RuntimeError as e:
+        print(f"\n❌ ERROR: {e}")
+        print("   Indica el cluster con --kubeconfig o corre con --sin-ready (sin esperar Ready). Abortando.\n")
+        sys.exit(1)
+
+bitacora = Bitacora(args.journal, "registro_control_plane", {"nodos": nodes}, reanudar=args.resume)
+if args.resume:
+    nodes = aplicar_resume(bitacora, nodes, "ready" if vigia is not None else "registro")
+    if not nodes:
+        print("\n✅ No hay nodos pendientes.\n")
+        sys.exit(0)
+
+# Sin terminal (cron, pipeline) no hay dónde pegar el comando: se corta antes de tocar los nodos
+if not sys.stdin.isatty() and not (args.comando or os.environ.get("REGISTRATION_COMMAND", "")).strip():
+    print("\n❌ ERROR: Sin terminal: indica el Registration Command con --comando o $REGISTRATION_COMMAND. Abortando.\n")
+    sys.exit(1)
 
 # 1) Validar SSH
-if not validate_ssh_connections(NODES):
+ssh_ok, hostnames = validate_ssh_connections(nodes)
+if not ssh_ok:
     print("\n❌ ERROR: No todos los nodos tienen SSH accesible. Abortando.\n")
     sys.exit(1)
 
 print("\n✅ SSH OK en todos los nodos.\n")
 
 # 2) Pedir Registration Command (texto ajustado)
-registration_command = input(
+registration_command = (args.comando or os.environ.get("REGISTRATION_COMMAND", "")).strip() or input(
     "🟣 Ingresa tu Registration Command_cluster_k8s EXACTO para Control Plane + ETCD (pégalo completo):\n\n> "
 ).strip()
 
@@ -63,18 +108,28 @@ if not registration_command:
     print("\n❌ ERROR: No ingresaste ningún comando. Abortando.\n")
     sys.exit(1)
 
-# 3) Ejecutar registration command
-print("\n🟣 Ejecutando Registration Command en nodos...\n")
-success_registration = True
-for node in NODES:
-    if not run_ssh_cmd(node, registration_command, label="REG"):
-        success_registration = False
+# 3) Ejecutar registration command (de a uno)
+print("\n🟣 Ejecutando Registration Command en nodos (uno a la vez)...\n")
+resultados = registrar_nodos(
+    SSH_POOL,
+    nodes,
+    registration_command,
+    serial=True,
+    vigia=vigia,
+    timeout_ready=TIMEOUT_READY,
+    hostnames=hostnames,
+    bitacora=bitacora,
+)
+SSH_POOL.cerrar_todo()
+bitacora.cerrar()
+imprimir_resumen(resultados)
 
-if not success_registration:
+if not all(r.ok for r in resultados):
     print("\n⚠️  Hubo errores registrando uno o más nodos. Abortando.\n")
+    print(f"↩️  Para reintentar solo los pendientes: mismo comando + --resume (journal: {args.journal})\n")
     sys.exit(1)
 
-# 4) Mensaje final y finalizar (sin esperas ni copias)
+# 4) Mensaje final y finalizar
 print("\n✅ Registro de Control Plane + ETCD completado con éxito.\n")
 print("➡️  Por favor continúe con el registro de los Worker Nodes.\n")
 sys.exit(0)
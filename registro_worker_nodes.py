@@ -1,61 +1,125 @@
 #!/usr/bin/env python3
-import subprocess
+import argparse
+import os
 import sys
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ssh_pool import SSHPool
+from flota import (
+    Bitacora,
+    agregar_argumentos_despliegue,
+    aplicar_resume,
+    despliegue_desde_args,
+    imprimir_resumen,
+    preparar_vigia,
+    registrar_nodos,
+    validar_ssh,
+)
+from inventario import agregar_argumentos, nodos_desde_args
+
 # =========================
 # Nodos destino (Worker Nodes)
 # =========================
+# Se usan si no se pasa --inventario ni --selector
 NODES = ["10.0.0.14", "10.0.0.15", "10.0.0.16"]
 
 # =========================
-# SSH runner (salida liviana)
+# Registro en paralelo
 # =========================
-def run_ssh_cmd(node, cmd, label=None):
-    tag = f"{label} " if label else ""
-    print(f"➡️  {tag}{node} ...", end=" ", flush=True)
-    try:
-        subprocess.run(
-            ["ssh", f"root@{node}", cmd],
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        print("✅")
-        return True
-    except subprocess.CalledProcessError as e:
-        print("❌")
-        err = (e.stderr or "").strip()
-        if err:
-            print(f"   🔻 {node}: {err}")
-        return False
+# Workers que se registran a la vez
+LOTE = 10
+
+# Esperar a que cada nodo quede Ready en el API (kubeconfig: --kubeconfig, $KUBECONFIG,
+# /root/.kube/config o /etc/rancher/rke2/rke2.yaml). El API se prueba antes de registrar;
+# sin kubeconfig se avisa y se da por terminado al salir el comando, como antes.
+ESPERAR_READY = True
+TIMEOUT_READY = 900
+
+# Despliegue por olas: CANARY nodos primero, luego olas de LOTE_PCT% de la flota.
+# Si fallan más de MAX_FALLAS (N o "N%"; "" = sin límite) no se lanzan más nodos y
+# se pausa: con terminal se pregunta si seguir, sin terminal se detiene (--resume).
+CANARY = 0
+LOTE_PCT = 100
+MAX_FALLAS = ""
+
+# Journal por nodo/paso; con --resume solo se toca lo que falló o quedó a medias
+JOURNAL = "registro_workers.journal.jsonl"
+
+# =========================
+# SSH (salida liviana)
+# =========================
+# Igual que `ssh root@nodo`: llaves / agente / ~/.ssh/config, pero una sola conexión
+# por nodo para la validación y el registro.
+SSH_POOL = SSHPool(user="root")
 
 # =========================
 # Validar conectividad SSH
 # =========================
 def validate_ssh_connections(nodes):
     print("\n🟣 Verificando conectividad SSH...\n")
-    all_ok = True
-    for node in nodes:
-        ok = run_ssh_cmd(node, "echo OK", label="SSH")
-        if not ok:
-            all_ok = False
-    return all_ok
+    res = validar_ssh(SSH_POOL, nodes)
+    hostnames = {n: info for n, (ok, info) in res.items() if ok}
+    return all(ok for ok, _ in res.values()), hostnames
 
 # =========================
 # PROGRAMA PRINCIPAL
 # =========================
+parser = argparse.ArgumentParser(description="Registro de Worker Nodes")
+agregar_argumentos(parser, grupo_default="workers")
+parser.add_argument("--comando", help="Registration Command (si no viene, se usa $REGISTRATION_COMMAND o se pide por pantalla; sin terminal es obligatorio)")
+parser.add_argument("--journal", default=JOURNAL, help=f"Journal de la corrida (default: {JOURNAL})")
+parser.add_argument("--resume", action="store_true", help="Reanudar: solo nodos que fallaron o no terminaron según el journal")
+parser.add_argument("--sin-ready", action="store_true", help="No esperar Ready en el API (solo el fin del comando)")
+parser.add_argument("--lote", type=int, default=LOTE, help=f"Workers que se registran a la vez (default: {LOTE})")
+agregar_argumentos_despliegue(parser, canary=CANARY, porcentaje=LOTE_PCT, max_fallas=MAX_FALLAS)
+args = parser.parse_args()
+
+try:
+    nodes = nodos_desde_args(args)
+except (OSError, ValueError, RuntimeError) as e:
+    print(f"\n❌ ERROR: {e}\n")
+    sys.exit(1)
+
+if nodes is None:
+    nodes = NODES
+elif not nodes:
+    print("\n❌ ERROR: El inventario / selector no devolvió ningún nodo. Abortando.\n")
+    sys.exit(1)
+
 print("\n📌 Instalador de nodos (modo LITE) — Worker Nodes\n")
+print(f"Nodos ({len(nodes)}): {', '.join(nodes)}")
+
+vigia = None
+if ESPERAR_READY and not args.sin_ready:
+    try:
+        vigia = preparar_vigia(args.kubeconfig)
+    except RuntimeError as e:
+        print(f"\n❌ ERROR: {e}")
+        print("   Indica el cluster con --kubeconfig o corre con --sin-ready (sin esperar Ready). Abortando.\n")
+        sys.exit(1)
+
+bitacora = Bitacora(args.journal, "registro_workers", {"nodos": nodes}, reanudar=args.resume)
+if args.resume:
+    nodes = aplicar_resume(bitacora, nodes, "ready" if vigia is not None else "registro")
+    if not nodes:
+        print("\n✅ No hay nodos pendientes.\n")
+        sys.exit(0)
+
+# Sin terminal (cron, pipeline) no hay dónde pegar el comando: se corta antes de tocar los nodos
+if not sys.stdin.isatty() and not (args.comando or os.environ.get("REGISTRATION_COMMAND", "")).strip():
+    print("\n❌ ERROR: Sin terminal: indica el Registration Command con --comando o $REGISTRATION_COMMAND. Abortando.\n")
+    sys.exit(1)
 
 # 1) Validar SSH
-if not validate_ssh_connections(NODES):
+ssh_ok, hostnames = validate_ssh_connections(nodes)
+if not ssh_ok:
     print("\n❌ ERROR: No todos los nodos tienen SSH accesible. Abortando.\n")
     sys.exit(1)
 
 print("\n✅ SSH OK en todos los nodos.\n")
 
 # 2) Pedir Registration Command (texto ajustado)
-registration_command = input(
+registration_command = (args.comando or os.environ.get("REGISTRATION_COMMAND", "")).strip() or input(
     "🟣 Ingresa tu Registration Command_cluster_k8s EXACTO para Worker Nodes (pégalo completo):\n\n> "
 ).strip()
 
@@ -64,14 +128,26 @@ if not registration_command:
     sys.exit(1)
 
 # 3) Ejecutar registration command
-print("\n🟣 Ejecutando Registration Command en nodos workers...\n")
-success_registration = True
-for node in NODES:
-    if not run_ssh_cmd(node, registration_command, label="REG"):
-        success_registration = False
+despliegue = despliegue_desde_args(args, nodes)
+print(f"\n🟣 Ejecutando Registration Command en nodos workers ({args.lote} a la vez; {despliegue.describir()})...\n")
+resultados = registrar_nodos(
+    SSH_POOL,
+    nodes,
+    registration_command,
+    lote=args.lote,
+    vigia=vigia,
+    timeout_ready=TIMEOUT_READY,
+    hostnames=hostnames,
+    bitacora=bitacora,
+    despliegue=despliegue,
+)
+SSH_POOL.cerrar_todo()
+bitacora.cerrar()
+imprimir_resumen(resultados)
 
-if not success_registration:
+if not all(r.ok for r in resultados):
     print("\n⚠️  Hubo errores registrando uno o más nodos. Abortando.\n")
+    print(f"↩️  Para reintentar solo los pendientes: mismo comando + --resume (journal: {args.journal})\n")
     sys.exit(1)
 
 # 4) Mensaje final
@@ -9,6 +9,7 @@ sftpgo_folderdate_to_minio_flat_inbound_robust_report.py
 - Dentro de la carpeta objetivo:
   - Solo archivos regulares
   - Solo si el nombre contiene INBOUND (configurable; ignore-case opcional)
+  - o reglas --include/--exclude (contains, glob, regex, ext, size, mtime, age) compiladas una vez
 - Sube a MinIO/S3:
   - SIN estructura (aplanado)
   - Anti-colisión: agrega hash corto basado en rel_path
@@ -17,8 +18,31 @@ sftpgo_folderdate_to_minio_flat_inbound_robust_report.py
   - reconexión SFTP en fallos
   - keepalive
   - upload streaming (sin archivo temporal)
-  - verificación por tamaño (ContentLength)
+  - verificación por tamaño (ContentLength) o checksum MD5/SHA-256 en streaming (--checksum)
   - state-file para reanudar sin repetir
+  - manifest (rel_path, size, mtime) -> key: salta sin red lo que no cambió y re-sube lo que cambió
+- Concurrencia:
+  - listado recursivo en paralelo (varios canales SFTP sobre un transporte SSH)
+  - cola acotada hacia N workers de subida (las subidas empiezan mientras se lista)
+- Throttling compartido por todos los workers (token bucket bytes/s y requests/s),
+  con horario por franja y ajuste en caliente (archivo de control o SIGHUP).
+- Métricas Prometheus (textfile-collector y/o endpoint HTTP /metrics).
+- Modo daemon (--daemon): sondea la carpeta de HOY cada N segundos, sube archivos estables
+  (mismo size/mtime en dos sondeos) y mantiene abiertas las sesiones SSH/S3 entre sondeos.
+- Circuit breaker compartido (SFTP y S3): ante una caída los workers pausan en vez de
+  reintentar cada archivo por su cuenta; se reanuda tras un único request canario.
+- Spool local opcional (--spool-dir): lectores SFTP llenan disco, uploaders S3 lo vacían,
+  con tope de tamaño (back-pressure), .part reanudables y recuperación tras reinicio.
+- Motor asyncio opcional (--engine async, requiere asyncssh): cientos de archivos en vuelo sobre
+  una conexión SFTP, con boto3 en un pool de hilos acotado y tope de memoria (--inflight-mb).
+- Transformación opcional antes de subir (--transform zstd|gzip|cmd, requiere --spool-dir): compresión
+  de WAV/raw o transcodificador externo en un pool de procesos; metadata con tamaño original y codec.
+- Deduplicación por contenido opcional (--dedup pointer|copy|skip): índice sha256 -> key canónico;
+  el re-envío del mismo audio bajo otra ruta no se vuelve a subir (pre-hash solo si coincide el tamaño).
+- Ledger SQLite opcional (--ledger-db): una fila por archivo por ejecución (origen, key, size,
+  digest, duraciones, resultado) con índices por key/día/estado y consultas (--ledger-query-*).
+- Sharding determinístico (--shard i/N): varias instancias reparten la misma carpeta por
+  sha1(rel_path) mod N, cada una con su state/manifest/spool/índice propios.
 - Reporte en texto en cada ejecución (resumen + top ejemplos).
 """
 
@@ -30,6 +54,27 @@ import json
 import time
 import logging
 import hashlib
+import base64
+import posixpath
+import random
+import socket
+import re
+import fnmatch
+import sqlite3
+import uuid
+import asyncio
+import gzip
+import shlex
+import subprocess
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import itertools
+import queue
+import threading
+import signal
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
@@ -38,7 +83,17 @@ from typing import Optional, Tuple, Dict, Any, List
 import paramiko
 import boto3
 from botocore.client import Config
-from botocore.exceptions import ClientError, EndpointConnectionError, ConnectionClosedError
+from botocore.exceptions import BotoCoreError, ClientError
+
+try:
+    import asyncssh  # opcional: solo para --engine async
+except ImportError:
+    asyncssh = None
+
+try:
+    import zstandard  # opcional: solo para --transform zstd
+except ImportError:
+    zstandard = None
 
 
 # =========================
@@ -89,6 +144,165 @@ def setup_logger(verbose: bool, log_file: Optional[str]) -> logging.Logger:
     return logger
 
 
+# =========================
+# Métricas (formato texto Prometheus)
+# =========================
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+METRIC_HELP = {
+    "phase_seconds": ("histogram", "Latencia por fase (list, head, upload, verify)."),
+    "retries_total": ("counter", "Reintentos hechos por retry(), por operación."),
+    "reconnects_total": ("counter", "Reconexiones SFTP."),
+    "events_total": ("counter", "Eventos por archivo (uploaded, skipped_*, failed_uploads, ...)."),
+    "bytes_uploaded_total": ("counter", "Bytes subidos a S3."),
+    "throughput_bytes_per_second": ("gauge", "Bytes subidos / segundos desde el inicio."),
+    "queue_depth": ("gauge", "Elementos en cola (list = directorios, upload = archivos)."),
+    "spool_bytes": ("gauge", "Bytes reservados en el spool local."),
+    "dedup_bytes_saved_total": ("counter", "Bytes que no se subieron por ser contenido duplicado."),
+    "transform_bytes_in_total": ("counter", "Bytes originales que pasaron por --transform."),
+    "transform_bytes_out_total": ("counter", "Bytes resultantes de --transform (lo que se sube)."),
+    "circuit_state": ("gauge", "Circuit breaker por endpoint: 0 cerrado, 1 semi-abierto, 2 abierto."),
+    "circuit_opens_total": ("counter", "Veces que se abrió el circuit breaker, por endpoint."),
+    "start_time_seconds": ("gauge", "Inicio de la ejecución (epoch)."),
+    "last_update_seconds": ("gauge", "Último render de métricas (epoch)."),
+}
+
+
+def _label_str(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    inner = ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels)
+    return "{" + inner + "}"
+
+
+def _num(v: float) -> str:
+    v = float(v)
+    return str(int(v)) if v.is_integer() else repr(v)
+
+
+class Metrics:
+    """
+    Registro mínimo de counters / gauges / histogramas, thread-safe, sin dependencias.
+    render() devuelve el formato de exposición de Prometheus.
+    """
+
+    def __init__(self, prefix: str = "sftp_minio_copier"):
+        self.prefix = prefix
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, tuple], float] = defaultdict(float)
+        self._gauges: Dict[Tuple[str, tuple], float] = {}
+        self._hist: Dict[Tuple[str, tuple], List[float]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name: str, value: float, **labels):
+        k = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self._hist.get(k)
+            if h is None:
+                # [bucket_0..bucket_n, +Inf, sum]
+                h = self._hist[k] = [0.0] * (len(LATENCY_BUCKETS) + 2)
+            for i, le in enumerate(LATENCY_BUCKETS):
+                if value <= le:
+                    h[i] += 1
+            h[-2] += 1
+            h[-1] += value
+
+    @contextmanager
+    def timer(self, phase: str):
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe("phase_seconds", time.monotonic() - t0, phase=phase)
+
+    def render(self) -> str:
+        now = time.time()
+        with self._lock:
+            up = sum(v for (n, _), v in self._counters.items() if n == "bytes_uploaded_total")
+            self._gauges[("throughput_bytes_per_second", ())] = up / max(1e-6, now - self.started)
+            self._gauges[("start_time_seconds", ())] = self.started
+            self._gauges[("last_update_seconds", ())] = now
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            hist = {k: list(v) for k, v in self._hist.items()}
+
+        out: List[str] = []
+        names = sorted({n for n, _ in counters} | {n for n, _ in gauges} | {n for n, _ in hist})
+        for name in names:
+            full = f"{self.prefix}_{name}"
+            mtype, mhelp = METRIC_HELP.get(name, ("untyped", name))
+            out.append(f"# HELP {full} {mhelp}")
+            out.append(f"# TYPE {full} {mtype}")
+            for (n, labels), v in sorted(counters.items()):
+                if n == name:
+                    out.append(f"{full}{_label_str(labels)} {_num(v)}")
+            for (n, labels), v in sorted(gauges.items()):
+                if n == name:
+                    out.append(f"{full}{_label_str(labels)} {_num(v)}")
+            for (n, labels), h in sorted(hist.items()):
+                if n != name:
+                    continue
+                for i, le in enumerate(LATENCY_BUCKETS):
+                    out.append(f"{full}_bucket{_label_str(labels + (('le', f'{le:g}'),))} {_num(h[i])}")
+                out.append(f"{full}_bucket{_label_str(labels + (('le', '+Inf'),))} {_num(h[-2])}")
+                out.append(f"{full}_sum{_label_str(labels)} {h[-1]:.6f}")
+                out.append(f"{full}_count{_label_str(labels)} {_num(h[-2])}")
+        return "\n".join(out) + "\n"
+
+    def write_textfile(self, path: str):
+        # atómico: node_exporter nunca lee un archivo a medio escribir
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    def serve(self, port: int, logger: logging.Logger) -> ThreadingHTTPServer:
+        metrics = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_):
+                pass
+
+        srv = ThreadingHTTPServer(("0.0.0.0", port), _Handler)
+        threading.Thread(target=srv.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info(f"Métricas en http://0.0.0.0:{port}/metrics")
+        return srv
+
+
+METRICS = Metrics()
+
+
+def start_textfile_writer(path: str, interval_s: float, stop: threading.Event, logger: logging.Logger):
+    def _loop():
+        while not stop.wait(interval_s):
+            try:
+                METRICS.write_textfile(path)
+            except Exception as e:
+                logger.warning(f"No pude escribir métricas en {path}: {e}")
+
+    threading.Thread(target=_loop, name="metrics-textfile", daemon=True).start()
+
+
 # =========================
 # S3 helpers
 # =========================
@@ -99,14 +313,16 @@ def parse_endpoint(endpoint: str, secure: bool) -> str:
     return ("https://" if secure else "http://") + endpoint
 
 
-def s3_client(cfg: S3Config):
+def s3_client(cfg: S3Config, max_pool_connections: int = 10):
     # retries nativos de botocore + los nuestros alrededor
+    # (el cliente boto3 es thread-safe; el pool de conexiones se dimensiona según workers)
     return boto3.client(
         "s3",
         endpoint_url=parse_endpoint(cfg.endpoint, cfg.secure),
         aws_access_key_id=cfg.access_key,
         aws_secret_access_key=cfg.secret_key,
-        config=Config(signature_version="s3v4", retries={"max_attempts": 10, "mode": "standard"}),
+        config=Config(signature_version="s3v4", retries={"max_attempts": 10, "mode": "standard"},
+                      max_pool_connections=max_pool_connections),
         verify=cfg.verify_tls,
     )
 
@@ -122,6 +338,20 @@ def object_exists(s3, bucket: str, key: str) -> bool:
         raise
 
 
+def head_content_length(s3, bucket: str, key: str) -> Optional[int]:
+    """
+    ContentLength del objeto, o None si no existe.
+    """
+    try:
+        head = s3.head_object(Bucket=bucket, Key=key)
+        return int(head.get("ContentLength", -1))
+    except ClientError as e:
+        code = e.response.get("Error", {}).get("Code", "")
+        if code in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+
+
 def verify_uploaded_size(s3, bucket: str, key: str, expected_size: int) -> bool:
     try:
         head = s3.head_object(Bucket=bucket, Key=key)
@@ -130,22 +360,539 @@ def verify_uploaded_size(s3, bucket: str, key: str, expected_size: int) -> bool:
         return False
 
 
+# =========================
+# Checksum en streaming
+# =========================
+CHECKSUM_MODES = ("none", "md5", "sha256")
+DEFAULT_PART_SIZE_MB = 8
+
+
+def read_block(fobj, size: int) -> bytes:
+    """
+    Lee hasta 'size' bytes (menos solo en EOF).
+    """
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = fobj.read(size - len(buf))
+        if not chunk:
+            break
+        buf += chunk
+    return bytes(buf)
+
+
+def iter_blocks(fobj, size: int):
+    while True:
+        block = read_block(fobj, size)
+        if not block:
+            return
+        yield block
+        if len(block) < size:
+            return
+
+
+def checksum_kwargs(algo: str, block: bytes) -> Dict[str, str]:
+    """
+    Headers de integridad por request: MinIO/S3 rechaza el bloque si no coincide.
+    """
+    if algo == "md5":
+        return {"ContentMD5": base64.b64encode(hashlib.md5(block).digest()).decode("ascii")}
+    if algo == "sha256":
+        return {"ChecksumSHA256": base64.b64encode(hashlib.sha256(block).digest()).decode("ascii")}
+    return {}
+
+
+def upload_blocks_with_checksum(s3, bucket: str, key: str, blocks, algo: str,
+                                extra: Optional[Dict[str, Any]] = None) -> Tuple[str, int]:
+    """
+    Sube un iterable de bloques (todos de part_size salvo el último) calculando el digest en el camino.
+    - 1 bloque: put_object
+    - 2+ bloques: multipart (create / upload_part / complete), abort si algo falla
+    extra: argumentos del objeto (Metadata, ContentType).
+    Retorna (digest_hex_del_archivo, bytes_totales).
+    """
+    extra = extra or {}
+    whole = hashlib.new(algo)
+    total = 0
+
+    blocks = iter(blocks)
+    first = next(blocks, b"")
+    second = next(blocks, None)
+
+    if second is None:
+        whole.update(first)
+        s3.put_object(Bucket=bucket, Key=key, Body=first, **checksum_kwargs(algo, first), **extra)
+        return whole.hexdigest(), len(first)
+
+    create_kwargs = {"ChecksumAlgorithm": "SHA256"} if algo == "sha256" else {}
+    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, **create_kwargs, **extra)["UploadId"]
+    parts = []
+    try:
+        for n, block in enumerate(itertools.chain([first, second], blocks), start=1):
+            whole.update(block)
+            total += len(block)
+            kw = checksum_kwargs(algo, block)
+            resp = s3.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=n, Body=block, **kw)
+            part = {"ETag": resp["ETag"], "PartNumber": n}
+            if algo == "sha256":
+                part["ChecksumSHA256"] = resp.get("ChecksumSHA256") or kw["ChecksumSHA256"]
+            parts.append(part)
+
+        s3.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id,
+                                     MultipartUpload={"Parts": parts})
+    except Exception:
+        try:
+            s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        except Exception:
+            pass
+        raise
+
+    return whole.hexdigest(), total
+
+
+# =========================
+# Throttling (token bucket compartido)
+# =========================
+_RATE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+_RATE_RE = re.compile(r"^(\d+(?:\.\d*)?|\.\d+)(?:([KMG])(?:I?B|I)?|B)?(?:/S)?$")
+
+
+def parse_rate(value: Any) -> float:
+    """
+    '5M' -> 5 MiB/s, '800K', '1500', 0 / '' -> 0 (sin límite).
+    También '5MB', '5MiB', '5MiB/s' (siempre en base 1024). ValueError si no se entiende.
+    """
+    txt = str(value).strip().upper().replace(" ", "")
+    if not txt:
+        return 0.0
+    m = _RATE_RE.match(txt)
+    if not m:
+        raise ValueError(f"valor inválido {value!r} (ej: 1500, 800K, 5M, 5MiB/s)")
+    return float(m.group(1)) * _RATE_UNITS[m.group(2) or ""]
+
+
+def parse_schedule(spec: str) -> List[Tuple[int, int, float, float]]:
+    """
+    'HH:MM-HH:MM=BW[/RPS],...' -> [(inicio_min, fin_min, bytes_s, req_s)]
+    Ej: '08:00-18:00=2M/20,18:00-08:00=0' (0 = sin límite; la franja puede cruzar medianoche).
+    """
+    windows = []
+    for item in [x.strip() for x in (spec or "").split(",") if x.strip()]:
+        span, _, limits = item.partition("=")
+        start, _, end = span.partition("-")
+        bw, _, rps = limits.partition("/")
+        if rps.strip()[:1] in ("s", "S"):
+            # '5MiB/s[/RPS]': el /s es parte de la tasa
+            _, _, rps = rps.partition("/")
+
+        def _minutes(hhmm: str) -> int:
+            hh, _, mm = hhmm.strip().partition(":")
+            return int(hh) * 60 + int(mm or 0)
+
+        try:
+            windows.append((_minutes(start), _minutes(end), parse_rate(bw), float(rps) if rps.strip() else 0.0))
+        except ValueError as e:
+            raise ValueError(f"franja inválida {item!r}: {e}") from None
+    return windows
+
+
+class TokenBucket:
+    """
+    Token bucket thread-safe. rate <= 0 = sin límite.
+    reserve(n) descuenta y devuelve cuántos segundos esperar (sirve para sync y async).
+    """
+
+    def __init__(self, rate: float, burst_s: float = 1.0):
+        self._lock = threading.Lock()
+        self.burst_s = burst_s
+        self.rate = 0.0
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self.rate = max(0.0, float(rate))
+            self._tokens = min(self._tokens, self.rate * self.burst_s)
+
+    def reserve(self, n: float) -> float:
+        with self._lock:
+            if self.rate <= 0:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(self.rate * self.burst_s, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= n
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self, n: float):
+        wait = self.reserve(n)
+        if wait > 0:
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """
+    Límites compartidos por todos los workers: bytes/s (lectura SFTP -> S3) y requests/s.
+    Prioridad: archivo de control > franja del horario > valores por CLI.
+    El archivo de control (JSON: {"bandwidth": "2M", "rps": 20, "schedule": "..."}) se relee
+    si cambia su mtime o al recibir SIGHUP.
+    """
+
+    def __init__(self, bandwidth: float, rps: float, schedule: str, control_file: str, tz: ZoneInfo,
+                 logger: logging.Logger, check_every_s: float = 5.0):
+        self.default_bandwidth = bandwidth
+        self.default_rps = rps
+        self.schedule = parse_schedule(schedule)
+        self.control_file = control_file
+        self.tz = tz
+        self.logger = logger
+        self.check_every_s = check_every_s
+        self.bytes_bucket = TokenBucket(0)
+        self.req_bucket = TokenBucket(0)
+        self._control: Dict[str, Any] = {}
+        self._control_mtime = None
+        self._reload = threading.Event()
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.current: Tuple[float, float] = (-1.0, -1.0)
+        self.refresh(force=True)
+
+    def request_reload(self, *_):
+        # seguro para handler de señal: solo marca
+        self._reload.set()
+
+    def _read_control(self):
+        if not self.control_file:
+            return
+        try:
+            mtime = os.path.getmtime(self.control_file)
+        except OSError:
+            if self._control:
+                self.logger.info("Throttle: archivo de control ausente, vuelvo a CLI/horario.")
+            self._control, self._control_mtime = {}, None
+            return
+        if mtime == self._control_mtime and not self._reload.is_set():
+            return
+        try:
+            with open(self.control_file, "r", encoding="utf-8") as f:
+                control = json.load(f) or {}
+            # se valida antes de aplicar: un valor malo deja los límites que había
+            parse_rate(control.get("bandwidth", 0))
+            float(control.get("rps", 0) or 0)
+            schedule = parse_schedule(control["schedule"]) if "schedule" in control else None
+        except Exception as e:
+            self.logger.warning(f"Throttle: no pude leer {self.control_file}: {e}. Sigo con los límites actuales.")
+            self._control_mtime = mtime
+            return
+        self._control, self._control_mtime = control, mtime
+        if schedule is not None:
+            self.schedule = schedule
+
+    def _limits_now(self) -> Tuple[float, float]:
+        if "bandwidth" in self._control or "rps" in self._control:
+            return (parse_rate(self._control.get("bandwidth", self.default_bandwidth)),
+                    float(self._control.get("rps", self.default_rps) or 0))
+        now = datetime.now(tz=self.tz)
+        minute = now.hour * 60 + now.minute
+        for start, end, bw, rps in self.schedule:
+            inside = start <= minute < end if start <= end else (minute >= start or minute < end)
+            if inside:
+                return bw, rps
+        return self.default_bandwidth, self.default_rps
+
+    def refresh(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now < self._next_check and not self._reload.is_set():
+            return
+        with self._lock:
+            self._next_check = now + self.check_every_s
+            self._read_control()
+            self._reload.clear()
+            limits = self._limits_now()
+            if limits != self.current:
+                self.current = limits
+                self.bytes_bucket.set_rate(limits[0])
+                self.req_bucket.set_rate(limits[1])
+                self.logger.info(f"Throttle: bandwidth={limits[0] / 1024 / 1024:.2f} MiB/s rps={limits[1]:g} (0 = sin límite)")
+
+    def throttle_bytes(self, n: int):
+        self.refresh()
+        self.bytes_bucket.acquire(n)
+
+    def throttle_request(self, n: int = 1):
+        self.refresh()
+        self.req_bucket.acquire(n)
+
+    async def athrottle_bytes(self, n: int):
+        self.refresh()
+        wait = self.bytes_bucket.reserve(n)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def athrottle_request(self, n: int = 1):
+        self.refresh()
+        wait = self.req_bucket.reserve(n)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class ThrottledReader:
+    """
+    Envuelve un file-like y consume tokens de bytes en cada read().
+    """
+
+    def __init__(self, fobj, limiter: "RateLimiter"):
+        self._f = fobj
+        self._limiter = limiter
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._f.read(size)
+        if data:
+            self._limiter.throttle_bytes(len(data))
+        return data
+
+
+def maybe_throttled(fobj, limiter: Optional[RateLimiter]):
+    return ThrottledReader(fobj, limiter) if limiter is not None else fobj
+
+
+# =========================
+# Circuit breaker (compartido por todos los workers)
+# =========================
+def is_sftp_outage(e: BaseException) -> bool:
+    """
+    Caída de SFTP/SSH (no errores por archivo como 'No such file').
+    """
+    if isinstance(e, (EOFError, paramiko.SSHException, ConnectionError, socket.timeout, TimeoutError)):
+        return True
+    if asyncssh is not None and isinstance(e, (asyncssh.DisconnectError, asyncssh.SFTPConnectionLost)):
+        return True
+    return isinstance(e, OSError) and "socket is closed" in str(e).lower()
+
+
+def is_s3_outage(e: BaseException) -> bool:
+    if isinstance(e, BotoCoreError):
+        return True
+    if isinstance(e, ClientError):
+        err = e.response.get("Error", {})
+        status = int(e.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0) or 0)
+        return status >= 500 or err.get("Code", "") in ("SlowDown", "ServiceUnavailable", "RequestTimeout",
+                                                         "XMinioServerNotInitialized")
+    return False
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    closed --(N fallos de caída seguidos)--> open: todos los workers esperan el cooldown
+    open --(vence cooldown)--> half_open: UN solo hilo pasa como canario, el resto sigue esperando
+    canario OK -> closed | canario falla -> open con cooldown mayor (exponencial + jitter, con tope)
+
+    El canario se identifica por 'owner' (por defecto el hilo); el motor async pasa su tarea,
+    porque todas sus corutinas comparten el hilo del loop.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, name: str, is_outage, failure_threshold: int = 5,
+                 base_cooldown: float = 5.0, max_cooldown: float = 300.0):
+        self.name = name
+        self.is_outage = is_outage
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.logger = logging.getLogger("sftp_folderdate_to_s3_flat_filter_robust")
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opens = 0
+        self.open_until = 0.0
+        self._canary = False
+        self._canary_owner = None
+        self._cancelled = False
+        self._cond = threading.Condition()
+
+    def configure(self, failure_threshold: int, base_cooldown: float, max_cooldown: float):
+        with self._cond:
+            self.failure_threshold = max(1, failure_threshold)
+            self.base_cooldown = base_cooldown
+            self.max_cooldown = max(base_cooldown, max_cooldown)
+
+    def pressure(self) -> float:
+        """
+        1.0 sin fallos recientes; crece con los fallos seguidos (escala el backoff de todos).
+        """
+        with self._cond:
+            return 1.0 + min(self.failures, self.failure_threshold) / float(self.failure_threshold)
+
+    def _enter_locked(self, owner) -> float:
+        """
+        0 = puede pasar; si no, segundos a esperar antes de volver a mirar.
+        """
+        if self._cancelled:
+            raise CircuitOpenError(f"{self.name}: circuito abierto y ejecución cancelada")
+        if self.state == self.CLOSED:
+            return 0.0
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now < self.open_until:
+                return min(5.0, self.open_until - now)
+            self.state = self.HALF_OPEN
+            self._canary = False
+            METRICS.set("circuit_state", self.state, endpoint=self.name)
+        if self._canary_owner == owner:
+            # llamada anidada del propio canario (p.ej. reconexión dentro del listado)
+            return 0.0
+        if not self._canary:
+            self._canary = True
+            self._canary_owner = owner
+            self.logger.info(f"{self.name}: circuito semi-abierto, probando con un request canario...")
+            return 0.0
+        return 1.0
+
+    def before_call(self, owner=None):
+        """
+        Bloquea mientras el circuito esté abierto. En half_open deja pasar solo al canario.
+        """
+        owner = threading.get_ident() if owner is None else owner
+        with self._cond:
+            while True:
+                wait = self._enter_locked(owner)
+                if wait <= 0:
+                    return
+                self._cond.wait(wait)
+
+    async def abefore_call(self, owner):
+        """
+        Igual que before_call para el motor async: espera con asyncio.sleep sin bloquear el loop.
+        """
+        while True:
+            with self._cond:
+                wait = self._enter_locked(owner)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def record_success(self):
+        with self._cond:
+            self.failures = 0
+            if self.state != self.CLOSED:
+                self.logger.info(f"{self.name}: canario OK, circuito cerrado. Se reanudan los workers.")
+                self.state = self.CLOSED
+                self.opens = 0
+                self._canary = False
+                self._canary_owner = None
+                METRICS.set("circuit_state", self.state, endpoint=self.name)
+                self._cond.notify_all()
+
+    def release(self, owner=None):
+        """
+        El canario terminó sin decir nada de este endpoint (error propio del archivo o
+        del otro endpoint): el estado no cambia, pero otro hilo puede probar.
+        """
+        owner = threading.get_ident() if owner is None else owner
+        with self._cond:
+            if self.state == self.HALF_OPEN and self._canary_owner == owner:
+                self._canary = False
+                self._canary_owner = None
+                self._cond.notify_all()
+
+    def record_failure(self, e: BaseException, owner=None):
+        if not self.is_outage(e):
+            # error propio del archivo: no cierra ni abre el circuito
+            self.release(owner)
+            return
+        with self._cond:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.opens += 1
+                cooldown = min(self.max_cooldown, self.base_cooldown * (2 ** (self.opens - 1)))
+                cooldown = random.uniform(cooldown / 2, cooldown)
+                self.open_until = time.monotonic() + cooldown
+                self.state = self.OPEN
+                self._canary = False
+                self._canary_owner = None
+                METRICS.inc("circuit_opens_total", endpoint=self.name)
+                METRICS.set("circuit_state", self.state, endpoint=self.name)
+                self.logger.warning(f"{self.name}: circuito ABIERTO tras {self.failures} fallos ({e}). "
+                                    f"Workers en pausa {cooldown:.1f}s.")
+                self._cond.notify_all()
+
+    def cancel(self):
+        with self._cond:
+            self._cancelled = True
+            self._cond.notify_all()
+
+
+BREAKER_SFTP = CircuitBreaker("sftp", is_sftp_outage)
+BREAKER_S3 = CircuitBreaker("s3", is_s3_outage)
+
+
+def cancel_breakers():
+    for b in (BREAKER_SFTP, BREAKER_S3):
+        b.cancel()
+
+
+def guarded_call(fn, breakers: Tuple[CircuitBreaker, ...] = ()):
+    """
+    Ejecuta fn() respetando los breakers: espera si están abiertos y les informa el resultado.
+    Un fallo se informa solo al breaker del endpoint que lo causó (el primero que lo
+    reconoce como caída); los demás no cambian de estado.
+    """
+    for b in breakers:
+        b.before_call()
+    try:
+        result = fn()
+    except Exception as e:
+        culpable = next((b for b in breakers if b.is_outage(e)), None)
+        for b in breakers:
+            if b is culpable:
+                b.record_failure(e)
+            else:
+                b.release()
+        raise
+    for b in breakers:
+        b.record_success()
+    return result
+
+
 # =========================
 # Generic retry
 # =========================
+# segundos de backoff dormidos por retry() en cada hilo (Copier.phase los descuenta)
+_RETRY_WAIT = threading.local()
+
+
+def retry_wait_s() -> float:
+    return getattr(_RETRY_WAIT, "s", 0.0)
+
+
 def retry(op_name: str, fn, logger: logging.Logger, attempts: int = 5, base_sleep: float = 0.8,
-          retry_exceptions: Tuple[type, ...] = (Exception,)):
+          retry_exceptions: Tuple[type, ...] = (Exception,), breakers: Tuple[CircuitBreaker, ...] = (),
+          max_sleep: float = 60.0):
+    """
+    Backoff exponencial con jitter completo; la base crece con la presión de los breakers
+    (si todos los workers fallan contra el mismo endpoint, todos se espacian más).
+    """
     last_exc = None
     for i in range(1, attempts + 1):
         try:
-            return fn()
+            return guarded_call(fn, breakers)
+        except CircuitOpenError:
+            raise
         except retry_exceptions as e:
             last_exc = e
             if i == attempts:
                 logger.error(f"{op_name} falló tras {attempts} intentos: {e}")
                 raise
-            sleep_s = base_sleep * (2 ** (i - 1))
+            pressure = max([b.pressure() for b in breakers] or [1.0])
+            cap = min(max_sleep, base_sleep * pressure * (2 ** (i - 1)))
+            sleep_s = random.uniform(cap / 2, cap)
+            METRICS.inc("retries_total", op=op_name.split(" ", 1)[0].lower())
             logger.warning(f"{op_name} falló (intento {i}/{attempts}): {e} | reintento en {sleep_s:.1f}s")
+            _RETRY_WAIT.s = retry_wait_s() + sleep_s
             time.sleep(sleep_s)
     raise last_exc  # pragma: no cover
 
@@ -172,7 +919,8 @@ def connect_sftp(cfg: SftpConfig, logger: logging.Logger) -> Tuple[paramiko.SSHC
             transport.set_keepalive(cfg.keepalive)
         return ssh.open_sftp()
 
-    sftp = retry("Conexión SFTP", _do_connect, logger, attempts=5, base_sleep=1.0, retry_exceptions=(Exception,))
+    sftp = retry("Conexión SFTP", _do_connect, logger, attempts=5, base_sleep=1.0, retry_exceptions=(Exception,),
+                 breakers=(BREAKER_SFTP,))
     return ssh, sftp
 
 
@@ -183,6 +931,91 @@ def safe_close(obj):
         pass
 
 
+class SftpChannels:
+    """
+    Un transporte SSH compartido + un canal SFTP por hilo (SFTPClient no es thread-safe).
+    reconnect() cambia solo el canal del hilo que falló; el transporte se rehace (nueva
+    generación: los demás hilos abren canal nuevo en su próximo get()) solo si está caído.
+    """
+
+    def __init__(self, cfg: SftpConfig, logger: logging.Logger):
+        self.cfg = cfg
+        self.logger = logger
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._clients: List[paramiko.SFTPClient] = []
+        self.ssh, first = connect_sftp(cfg, logger)
+        self._adopt(first)
+
+    def _adopt(self, sftp):
+        self._clients.append(sftp)
+        self._local.sftp = sftp
+        self._local.gen = self.generation
+
+    def get(self) -> paramiko.SFTPClient:
+        if getattr(self._local, "gen", -1) == self.generation:
+            return self._local.sftp
+        with self._lock:
+            self._adopt(self.ssh.open_sftp())
+            return self._local.sftp
+
+    def release(self):
+        """
+        Cierra el canal del hilo actual (los hilos de cada sondeo no dejan canales colgando).
+        """
+        sftp = getattr(self._local, "sftp", None)
+        if sftp is None:
+            return
+        with self._lock:
+            if sftp in self._clients:
+                self._clients.remove(sftp)
+        safe_close(sftp)
+        self._local.sftp = None
+        self._local.gen = -1
+
+    def reconnect(self):
+        """
+        Repara el canal SFTP del hilo actual. El transporte compartido (y con él los canales
+        de los demás hilos) solo se rehace si está caído: un EOF en un canal no corta las
+        subidas que van por los otros.
+        """
+        mine = getattr(self._local, "sftp", None)
+        with self._lock:
+            if mine is not None:
+                if mine in self._clients:
+                    self._clients.remove(mine)
+                safe_close(mine)
+                self._local.sftp = None
+                self._local.gen = -1
+
+            transport = self.ssh.get_transport()
+            if transport is not None and transport.is_active():
+                try:
+                    self._adopt(self.ssh.open_sftp())
+                    self.logger.warning("Canal SFTP caído: abro uno nuevo para este hilo.")
+                    return
+                except (paramiko.SSHException, EOFError, OSError):
+                    pass  # el transporte cayó justo ahora: se rehace abajo
+
+            self.logger.warning("Reconectando SFTP...")
+            METRICS.inc("reconnects_total")
+            for c in self._clients:
+                safe_close(c)
+            safe_close(self.ssh)
+            self._clients = []
+            self.ssh, first = connect_sftp(self.cfg, self.logger)
+            self.generation += 1
+            self._adopt(first)
+
+    def close(self):
+        with self._lock:
+            for c in self._clients:
+                safe_close(c)
+            safe_close(self.ssh)
+            self._clients = []
+
+
 # =========================
 # State file (resume)
 # =========================
@@ -207,6 +1040,338 @@ def save_state(path: str, state: Dict[str, Any]):
     os.replace(tmp, path)
 
 
+# =========================
+# Manifest (detección de cambios)
+# =========================
+class Manifest:
+    """
+    rel_path -> {size, mtime, key} de lo último subido/verificado.
+    - unchanged: mismo size+mtime -> se salta sin HEAD ni nada en S3
+    - changed:   existe pero cambió size o mtime -> se re-sube
+    - new:       nunca visto
+    """
+
+    def __init__(self, path: str, save_every_s: float = 5.0):
+        self.path = path
+        self.save_every_s = save_every_s
+        data = load_state(path)
+        self.entries: Dict[str, Dict[str, Any]] = data.get("entries", {})
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = time.time()
+
+    def check(self, rel_path: str, size: int, mtime: int, key: str) -> str:
+        with self._lock:
+            ent = self.entries.get(rel_path)
+        if ent is None:
+            return "new"
+        if ent.get("size") == size and ent.get("mtime") == mtime and ent.get("key") == key:
+            return "unchanged"
+        return "changed"
+
+    def previous(self, rel_path: str) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.entries.get(rel_path, {}))
+
+    def record(self, rel_path: str, size: int, mtime: int, key: str):
+        with self._lock:
+            self.entries[rel_path] = {"size": size, "mtime": mtime, "key": key}
+            self._dirty = True
+            if time.time() - self._last_save >= self.save_every_s:
+                self._save_locked()
+
+    def _save_locked(self):
+        save_state(self.path, {"version": 1, "entries": self.entries})
+        self._dirty = False
+        self._last_save = time.time()
+
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                self._save_locked()
+
+
+class DedupIndex:
+    """
+    sha256 del contenido -> key canónico (el primer objeto subido con ese contenido).
+    size es el tamaño del original; stored, el del objeto en el bucket (difiere con --transform).
+    sizes cuenta cuántos digests hay por tamaño: si un archivo no coincide en tamaño con nada
+    conocido no puede ser duplicado y se sube directo (sin leerlo dos veces).
+
+    Las subidas en curso se anotan por tamaño (con su digest, o None si van sin pre-hash): un
+    archivo con el mismo contenido que otro que se está subiendo espera a que termine y queda
+    como puntero, en vez de subirse entero dos veces en la misma ejecución.
+    """
+
+    def __init__(self, path: str, save_every_s: float = 5.0):
+        self.path = path
+        self.save_every_s = save_every_s
+        data = load_state(path)
+        self.entries: Dict[str, Dict[str, Any]] = data.get("entries", {})
+        self.sizes: Dict[int, int] = defaultdict(int)
+        for ent in self.entries.values():
+            self.sizes[int(ent["size"])] += 1
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._inflight: Dict[int, List[Optional[str]]] = defaultdict(list)
+        self._dirty = False
+        self._last_save = time.time()
+
+    def begin_unhashed(self, size: int) -> bool:
+        """
+        Anota una subida sin pre-hash si el tamaño no coincide con nada conocido ni en curso
+        (chequeo y anotación atómicos). False = no se anotó: hay que hashear y usar begin().
+        """
+        with self._lock:
+            if self.sizes.get(size, 0) > 0 or self._inflight.get(size):
+                return False
+            self._inflight[size].append(None)
+            return True
+
+    def _try_begin_locked(self, size: int, digest: Optional[str]) -> bool:
+        if digest is not None and any(d is None or d == digest for d in self._inflight.get(size, ())):
+            return False
+        self._inflight[size].append(digest)
+        return True
+
+    def try_begin(self, size: int, digest: Optional[str]) -> bool:
+        """
+        Anota una subida en curso. False (sin anotar) si otra en curso puede tener el mismo
+        contenido (mismo digest, o mismo tamaño todavía sin hash): hay que reintentar después.
+        """
+        with self._lock:
+            return self._try_begin_locked(size, digest)
+
+    def begin(self, size: int, digest: Optional[str]):
+        """
+        Como try_begin pero espera. Al volver, lookup() ya ve lo que subió la otra.
+        Siempre emparejar con end().
+        """
+        with self._cond:
+            while not self._try_begin_locked(size, digest):
+                self._cond.wait()
+
+    def end(self, size: int, digest: Optional[str]):
+        with self._cond:
+            inflight = self._inflight.get(size)
+            if inflight is not None and digest in inflight:
+                inflight.remove(digest)
+                if not inflight:
+                    del self._inflight[size]
+            self._cond.notify_all()
+
+    def lookup(self, digest: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            ent = self.entries.get(digest)
+            return dict(ent) if ent else None
+
+    def record(self, digest: str, size: int, key: str, stored: Optional[int] = None):
+        with self._lock:
+            if digest in self.entries:
+                return
+            self.entries[digest] = {"key": key, "size": size, "stored": size if stored is None else stored}
+            self.sizes[size] += 1
+            self._dirty = True
+            if time.time() - self._last_save >= self.save_every_s:
+                self._save_locked()
+
+    def forget(self, digest: str):
+        with self._lock:
+            ent = self.entries.pop(digest, None)
+            if ent is not None:
+                self.sizes[int(ent["size"])] -= 1
+                self._dirty = True
+
+    def _save_locked(self):
+        save_state(self.path, {"version": 1, "algo": "sha256", "entries": self.entries})
+        self._dirty = False
+        self._last_save = time.time()
+
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                self._save_locked()
+
+
+# =========================
+# Ledger por archivo (SQLite)
+# =========================
+LEDGER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      TEXT PRIMARY KEY,
+    started_at  TEXT NOT NULL,
+    finished_at TEXT,
+    folder      TEXT,
+    mode        TEXT,
+    summary     TEXT
+);
+CREATE TABLE IF NOT EXISTS transfers (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id      TEXT NOT NULL,
+    ts          TEXT NOT NULL,
+    day         TEXT NOT NULL,
+    source_path TEXT NOT NULL,
+    rel_path    TEXT,
+    key         TEXT,
+    size        INTEGER,
+    mtime       INTEGER,
+    digest      TEXT,
+    outcome     TEXT NOT NULL,
+    detail      TEXT,
+    head_ms     REAL,
+    upload_ms   REAL,
+    verify_ms   REAL,
+    total_ms    REAL
+);
+CREATE INDEX IF NOT EXISTS ix_transfers_key ON transfers(key);
+CREATE INDEX IF NOT EXISTS ix_transfers_day ON transfers(day, outcome);
+CREATE INDEX IF NOT EXISTS ix_transfers_outcome ON transfers(outcome);
+CREATE INDEX IF NOT EXISTS ix_transfers_run ON transfers(run_id);
+"""
+
+LEDGER_COLUMNS = ("run_id", "ts", "day", "source_path", "rel_path", "key", "size", "mtime", "digest",
+                  "outcome", "detail", "head_ms", "upload_ms", "verify_ms", "total_ms")
+
+
+class Ledger:
+    """
+    Registro por archivo en SQLite. record() solo encola; un hilo escritor inserta en
+    transacciones de hasta batch_size filas (o cada flush_s segundos), en modo WAL.
+    """
+
+    def __init__(self, path: str, tz: ZoneInfo, logger: logging.Logger, batch_size: int = 500,
+                 flush_s: float = 2.0):
+        self.path = path
+        self.tz = tz
+        self.logger = logger
+        self.batch_size = max(1, batch_size)
+        self.flush_s = flush_s
+        self.run_id = datetime.now(tz=tz).strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6]
+        self._q: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._ready = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._writer, name="ledger", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    @staticmethod
+    def connect(path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(path, timeout=30)  # varias instancias (--shard) pueden compartir el ledger
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(LEDGER_SCHEMA)
+        return conn
+
+    def _writer(self):
+        try:
+            conn = self.connect(self.path)
+            with conn:
+                conn.execute("INSERT INTO runs(run_id, started_at) VALUES (?, ?)",
+                             (self.run_id, datetime.now(tz=self.tz).isoformat()))
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+
+        sql = f"INSERT INTO transfers({', '.join(LEDGER_COLUMNS)}) VALUES ({', '.join('?' * len(LEDGER_COLUMNS))})"
+        batch: List[tuple] = []
+        finished: Optional[tuple] = None
+        deadline = time.monotonic() + self.flush_s
+        while True:
+            try:
+                item = self._q.get(timeout=max(0.05, deadline - time.monotonic()))
+            except queue.Empty:
+                item = ()
+            if item and item[0] == "__end__":
+                finished = item
+            elif item:
+                batch.append(item)
+            if batch and (finished or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                try:
+                    with conn:
+                        conn.executemany(sql, batch)
+                except Exception as e:
+                    self.logger.warning(f"Ledger: no pude escribir {len(batch)} filas: {e}")
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_s
+            if finished:
+                try:
+                    with conn:
+                        conn.execute("UPDATE runs SET finished_at=?, folder=?, mode=?, summary=? WHERE run_id=?",
+                                     finished[1:] + (self.run_id,))
+                except Exception as e:
+                    self.logger.warning(f"Ledger: no pude cerrar la ejecución: {e}")
+                conn.close()
+                return
+
+    def record(self, outcome: str, source_path: str, rel_path: str = "", key: str = "", size: int = 0,
+               mtime: int = 0, digest: str = "", detail: str = "", head_ms: float = 0.0,
+               upload_ms: float = 0.0, verify_ms: float = 0.0, total_ms: float = 0.0, **_ignored):
+        now = datetime.now(tz=self.tz)
+        self._q.put((self.run_id, now.isoformat(), now.strftime("%Y%m%d"), source_path, rel_path, key, size, mtime,
+                     digest, outcome, detail, round(head_ms, 3), round(upload_ms, 3), round(verify_ms, 3),
+                     round(total_ms, 3)))
+
+    def close(self, folder: str, mode: str, summary: Dict[str, Any]):
+        self._q.put(("__end__", datetime.now(tz=self.tz).isoformat(), folder, mode,
+                     json.dumps(summary, ensure_ascii=False)))
+        self._thread.join()
+
+
+def ledger_query(args) -> int:
+    """
+    Consultas de solo lectura sobre el ledger (no conecta a SFTP/S3).
+    """
+    if not os.path.exists(args.ledger_db):
+        print(f"[ERROR] No existe el ledger {args.ledger_db}", file=sys.stderr)
+        return 2
+    conn = Ledger.connect(args.ledger_db)
+    conn.row_factory = sqlite3.Row
+
+    if args.ledger_summary:
+        print("EJECUCIONES (últimas)")
+        for r in conn.execute(
+                "SELECT r.run_id, r.started_at, r.finished_at, r.folder, "
+                "SUM(t.outcome='uploaded') AS up, SUM(t.outcome='skipped') AS sk, SUM(t.outcome='failed') AS fa, "
+                "COALESCE(SUM(CASE WHEN t.outcome='uploaded' THEN t.size END), 0) AS bytes "
+                "FROM runs r LEFT JOIN transfers t ON t.run_id = r.run_id "
+                "GROUP BY r.run_id ORDER BY r.started_at DESC LIMIT ?", (args.ledger_limit,)):
+            print(f"  {r['run_id']} | {r['started_at']} -> {r['finished_at'] or '(en curso)'} | "
+                  f"{r['folder'] or ''} | subidos={r['up'] or 0} omitidos={r['sk'] or 0} "
+                  f"fallidos={r['fa'] or 0} bytes={r['bytes']}")
+        print("")
+        print("POR DÍA")
+        for r in conn.execute("SELECT day, outcome, COUNT(*) AS n, COALESCE(SUM(size), 0) AS bytes "
+                              "FROM transfers GROUP BY day, outcome ORDER BY day DESC, outcome LIMIT ?",
+                              (args.ledger_limit,)):
+            print(f"  {r['day']} | {r['outcome']:<8} | {r['n']} archivos | {r['bytes']} bytes")
+        return 0
+
+    where, params = [], []
+    if args.ledger_query_key:
+        where.append("key = ?")
+        params.append(args.ledger_query_key)
+    if args.ledger_query_day:
+        where.append("day = ?")
+        params.append(args.ledger_query_day)
+    if args.ledger_query_status:
+        where.append("outcome = ?")
+        params.append(args.ledger_query_status)
+    sql = ("SELECT ts, run_id, outcome, key, size, digest, source_path, detail, upload_ms FROM transfers"
+           + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY id DESC LIMIT ?")
+    rows = conn.execute(sql, params + [args.ledger_limit]).fetchall()
+    for r in rows:
+        print(f"{r['ts']} | {r['run_id']} | {r['outcome']:<8} | {r['key']} | {r['size']} bytes | "
+              f"{r['digest'] or '-'} | {r['source_path']} | upload={r['upload_ms']:.0f}ms"
+              + (f" | {r['detail']}" if r['detail'] else ""))
+    print(f"({len(rows)} filas)")
+    return 0 if rows else 1
+
+
 # =========================
 # Remote folder selection (YYYYMMDD)
 # =========================
@@ -233,7 +1398,7 @@ def list_date_dirs(sftp, remote_root: str, logger: logging.Logger) -> List[str]:
         return sftp.listdir_attr(remote_root)
 
     entries = retry(f"Listar {remote_root}", _list, logger, attempts=4, base_sleep=0.6,
-                    retry_exceptions=(IOError, OSError, EOFError, paramiko.SSHException))
+                    retry_exceptions=(IOError, OSError, EOFError, paramiko.SSHException), breakers=(BREAKER_SFTP,))
     dirs = []
     for ent in entries:
         if stat.S_ISDIR(ent.st_mode) and is_yyyymmdd(ent.filename):
@@ -285,7 +1450,8 @@ def list_files_in_folder(sftp, folder: str, logger: logging.Logger, max_errors:
 
         try:
             entries = retry(f"Listar {cur}", _listdir, logger, attempts=4, base_sleep=0.5,
-                            retry_exceptions=(IOError, OSError, EOFError, paramiko.SSHException))
+                            retry_exceptions=(IOError, OSError, EOFError, paramiko.SSHException),
+                            breakers=(BREAKER_SFTP,))
         except Exception as e:
             errors += 1
             logger.warning(f"No pude listar {cur}: {e}")
@@ -312,6 +1478,96 @@ def list_files_in_folder(sftp, folder: str, logger: logging.Logger, max_errors:
             yield rpath, rel, mtime, size
 
 
+def walk_files_parallel(channels: SftpChannels, folder: str, logger: logging.Logger, emit,
+                        list_workers: int = 4, max_errors: int = 50,
+                        stop: Optional[threading.Event] = None, limiter: Optional[RateLimiter] = None,
+                        descend=None, on_listed=None):
+    """
+    Igual que list_files_in_folder pero listando varios directorios a la vez
+    (un canal SFTP por hilo). Llama emit(remote_path, rel_path, mtime, size) apenas
+    vuelve cada listdir, así las subidas arrancan antes de terminar el recorrido.
+    Hooks opcionales (modo daemon):
+      descend(dir_path, dir_mtime) -> bool   decide si se lista un subdirectorio
+      on_listed(dir_path, entries)           se llama tras cada listdir exitoso
+    """
+    folder = folder.rstrip("/")
+    list_workers = max(1, list_workers)
+    dirs: "queue.Queue[Optional[str]]" = queue.Queue()
+    dirs.put(folder)
+    lock = threading.Lock()
+    pending = [1]
+    errors = [0]
+    abort = threading.Event()
+
+    def _listdir(cur: str):
+        if limiter is not None:
+            limiter.throttle_request()
+        try:
+            with METRICS.timer("list"):
+                return channels.get().listdir_attr(cur)
+        except (EOFError, paramiko.SSHException):
+            # canal/transporte caído: reintentamos sobre uno nuevo
+            channels.reconnect()
+            raise
+
+    def _worker():
+        while True:
+            cur = dirs.get()
+            if cur is None:
+                return
+            try:
+                if abort.is_set() or (stop is not None and stop.is_set()):
+                    continue
+                try:
+                    entries = retry(f"Listar {cur}", lambda: _listdir(cur), logger, attempts=4, base_sleep=0.5,
+                                    retry_exceptions=(IOError, OSError, EOFError, paramiko.SSHException),
+                                    breakers=(BREAKER_SFTP,))
+                except Exception as e:
+                    logger.warning(f"No pude listar {cur}: {e}")
+                    with lock:
+                        errors[0] += 1
+                        if errors[0] >= max_errors and not abort.is_set():
+                            logger.error("Demasiados errores listando. Corto el recorrido.")
+                            abort.set()
+                    continue
+
+                if on_listed is not None:
+                    on_listed(cur, entries)
+
+                for ent in entries:
+                    rpath = f"{cur}/{ent.filename}"
+                    mode = ent.st_mode
+
+                    if stat.S_ISDIR(mode):
+                        if descend is not None and not descend(rpath, int(ent.st_mtime)):
+                            continue
+                        with lock:
+                            pending[0] += 1
+                        dirs.put(rpath)
+                        METRICS.set("queue_depth", dirs.qsize(), queue="list")
+                        continue
+
+                    if not stat.S_ISREG(mode):
+                        continue
+
+                    rel = rpath[len(folder) + 1:] if rpath.startswith(folder + "/") else ent.filename
+                    emit(rpath, rel, int(ent.st_mtime), int(ent.st_size))
+            finally:
+                with lock:
+                    pending[0] -= 1
+                    finished = pending[0] == 0
+                if finished:
+                    for _ in range(list_workers):
+                        dirs.put(None)
+        channels.release()
+
+    threads = [threading.Thread(target=_worker, name=f"list-{i}", daemon=True) for i in range(list_workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
 # =========================
 # Core filters + upload
 # =========================
@@ -321,6 +1577,190 @@ def name_matches(filename: str, needle: str, ignore_case: bool) -> bool:
     return needle in filename
 
 
+# =========================
+# Motor de filtros (include / exclude)
+# =========================
+_AGE_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def _parse_age(txt: str) -> float:
+    txt = txt.strip().lower()
+    if txt and txt[-1] in _AGE_UNITS:
+        return float(txt[:-1]) * _AGE_UNITS[txt[-1]]
+    return float(txt)
+
+
+def _compare(op: str, limit: float):
+    return {
+        ">": lambda v: v > limit,
+        ">=": lambda v: v >= limit,
+        "<": lambda v: v < limit,
+        "<=": lambda v: v <= limit,
+        "=": lambda v: v == limit,
+    }[op]
+
+
+def _range_or_compare(value: str, parse):
+    """
+    '>=10K' / '<5M' / '10K-5M' (rango inclusive) -> predicado sobre un número.
+    """
+    m = re.match(r"^(>=|<=|>|<|=)(.+)$", value.strip())
+    if m:
+        return _compare(m.group(1), parse(m.group(2)))
+    lo, sep, hi = value.partition("..") if ".." in value else value.partition("-")
+    if not sep:
+        raise ValueError(f"rango inválido: {value}")
+    lo_v = parse(lo) if lo.strip() else float("-inf")
+    hi_v = parse(hi) if hi.strip() else float("inf")
+    return lambda v: lo_v <= v <= hi_v
+
+
+def compile_rule(spec: str, tz: ZoneInfo, clock=time.time):
+    """
+    Regla -> predicado (filename, rel_path, size, mtime) -> bool.
+      contains:TXT | icontains:TXT       subcadena en el nombre
+      glob:PATRÓN                        fnmatch (sobre rel_path si tiene '/', si no sobre el nombre)
+      regex:PATRÓN | iregex:PATRÓN       re.search sobre rel_path
+      ext:wav,mp3                        extensión (sin importar mayúsculas)
+      size:>=10K | size:10K-500M         tamaño en bytes (K/M/G)
+      mtime:2026-10-18T08:00..2026-10-18T18:00   ventana absoluta en --tz
+      age:<6h | age:>10m                 antigüedad (s/m/h/d) al evaluar (clock())
+    """
+    kind, sep, value = spec.partition(":")
+    kind = kind.strip().lower()
+    if not sep or not value:
+        raise ValueError(f"regla inválida '{spec}' (formato tipo:valor)")
+
+    if kind in ("contains", "icontains"):
+        if kind == "icontains":
+            needle = value.lower()
+            return lambda fn, rel, size, mtime: needle in fn.lower()
+        return lambda fn, rel, size, mtime: value in fn
+    if kind == "glob":
+        rx = re.compile(fnmatch.translate(value))
+        if "/" in value:
+            return lambda fn, rel, size, mtime: rx.match(rel) is not None
+        return lambda fn, rel, size, mtime: rx.match(fn) is not None
+    if kind in ("regex", "iregex"):
+        rx = re.compile(value, re.IGNORECASE if kind == "iregex" else 0)
+        return lambda fn, rel, size, mtime: rx.search(rel) is not None
+    if kind == "ext":
+        exts = tuple("." + e.strip().lower().lstrip(".") for e in value.split(",") if e.strip())
+        return lambda fn, rel, size, mtime: fn.lower().endswith(exts)
+    if kind == "size":
+        pred = _range_or_compare(value, parse_rate)
+        return lambda fn, rel, size, mtime: pred(size)
+    if kind == "mtime":
+        def _ts(txt: str) -> float:
+            dt = datetime.fromisoformat(txt.strip())
+            return (dt if dt.tzinfo else dt.replace(tzinfo=tz)).timestamp()
+        m = re.match(r"^(>=|<=|>|<)(.+)$", value.strip())
+        if m:
+            pred = _compare(m.group(1), _ts(m.group(2)))
+        else:
+            lo, _, hi = value.partition("..")
+            lo_v = _ts(lo) if lo.strip() else float("-inf")
+            hi_v = _ts(hi) if hi.strip() else float("inf")
+            pred = lambda v: lo_v <= v <= hi_v
+        return lambda fn, rel, size, mtime: pred(mtime)
+    if kind == "age":
+        pred = _range_or_compare(value, _parse_age)
+        return lambda fn, rel, size, mtime: pred(clock() - mtime)
+    raise ValueError(f"tipo de regla desconocido '{kind}' en '{spec}'")
+
+
+class FilterEngine:
+    """
+    Pasa si (no hay includes o algún include coincide) y ningún exclude coincide.
+    Las reglas se compilan una vez; se cuenta por regla cuántas entradas decidió
+    (primer include que aceptó / primer exclude que rechazó).
+    """
+
+    def __init__(self, includes: List[str], excludes: List[str], tz: ZoneInfo, clock=time.time):
+        self.includes = [(spec, compile_rule(spec, tz, clock)) for spec in includes]
+        self.excludes = [(spec, compile_rule(spec, tz, clock)) for spec in excludes]
+        self._hits = [0] * (len(self.includes) + len(self.excludes))
+        self._no_include = 0
+        self._lock = threading.Lock()
+
+    def _hit(self, idx: int):
+        with self._lock:
+            self._hits[idx] += 1
+
+    def match(self, filename: str, rel_path: str, size: int, mtime: int) -> bool:
+        if self.includes:
+            for i, (_spec, pred) in enumerate(self.includes):
+                if pred(filename, rel_path, size, mtime):
+                    break
+            else:
+                with self._lock:
+                    self._no_include += 1
+                return False
+        else:
+            i = -1
+        base = len(self.includes)
+        for j, (_spec, pred) in enumerate(self.excludes):
+            if pred(filename, rel_path, size, mtime):
+                self._hit(base + j)
+                return False
+        if i >= 0:
+            self._hit(i)
+        return True
+
+    def describe(self) -> str:
+        inc = " OR ".join(s for s, _ in self.includes) or "(todo)"
+        exc = " OR ".join(s for s, _ in self.excludes) or "(nada)"
+        return f"include: {inc} | exclude: {exc}"
+
+    def report_lines(self) -> List[str]:
+        with self._lock:
+            hits = list(self._hits)
+            no_include = self._no_include
+        lines = [f"  - include {spec}: {hits[i]}" for i, (spec, _) in enumerate(self.includes)]
+        base = len(self.includes)
+        lines += [f"  - exclude {spec}: {hits[base + j]}" for j, (spec, _) in enumerate(self.excludes)]
+        if self.includes:
+            lines.append(f"  - sin include que coincida: {no_include}")
+        return lines
+
+
+def build_filter_engine(args, tz: ZoneInfo) -> FilterEngine:
+    """
+    Compatibilidad: --name-contains (INBOUND por defecto) es un include contains/icontains
+    salvo que se pasen --include explícitos sin --name-contains.
+    """
+    includes = list(args.include or [])
+    if args.name_contains is not None or not includes:
+        needle = "INBOUND" if args.name_contains is None else args.name_contains
+        if needle:
+            includes.insert(0, f"{'icontains' if args.ignore_case else 'contains'}:{needle}")
+    return FilterEngine(includes, list(args.exclude or []), tz)
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """
+    'i/N' con 0 <= i < N (mismo índice que el ordinal de un StatefulSet).
+    """
+    m = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", spec or "")
+    if not m or int(m.group(2)) < 1 or int(m.group(1)) >= int(m.group(2)):
+        raise ValueError(f"shard inválido '{spec}' (esperado i/N con 0 <= i < N)")
+    return int(m.group(1)), int(m.group(2))
+
+
+def shard_of(rel_path: str, shards: int) -> int:
+    return int(hashlib.sha1(rel_path.encode("utf-8")).hexdigest()[:8], 16) % shards
+
+
+def shard_path(path: str, shard: Tuple[int, int]) -> str:
+    """
+    state.json -> state.shard1of4.json (cada instancia con su archivo: sin carreras).
+    """
+    if not path:
+        return path
+    root, ext = os.path.splitext(path.rstrip("/"))
+    return f"{root}.shard{shard[0]}of{shard[1]}{ext}"
+
+
 def flat_name_with_hash(remote_path: str, rel_path: str) -> str:
     base = os.path.basename(remote_path)
     name, ext = os.path.splitext(base)
@@ -329,14 +1769,1527 @@ def flat_name_with_hash(remote_path: str, rel_path: str) -> str:
 
 
 def upload_streaming_sftp_to_s3(sftp, s3, s3cfg: S3Config, remote_path: str, key: str,
-                                logger: logging.Logger, attempts: int = 5):
+                                logger: logging.Logger, attempts: int = 5, limiter: Optional[RateLimiter] = None):
     def _upload():
         with sftp.open(remote_path, "rb") as rf:
-            s3.upload_fileobj(rf, s3cfg.bucket, key)
+            s3.upload_fileobj(maybe_throttled(rf, limiter), s3cfg.bucket, key)
         return True
 
     retry(f"Upload {remote_path}", _upload, logger, attempts=attempts, base_sleep=1.0,
-          retry_exceptions=(Exception,))
+          retry_exceptions=(Exception,), breakers=(BREAKER_SFTP, BREAKER_S3))
+
+
+def upload_streaming_with_checksum(sftp, s3, s3cfg: S3Config, remote_path: str, key: str, algo: str,
+                                   part_size: int, logger: logging.Logger, attempts: int = 5,
+                                   limiter: Optional[RateLimiter] = None) -> Tuple[str, int]:
+    """
+    Igual que upload_streaming_sftp_to_s3 pero leyendo en bloques de part_size:
+    cada bloque viaja con Content-MD5 / x-amz-checksum-sha256 y el digest del archivo
+    completo se calcula al vuelo (sin releer el origen ni HEAD posterior).
+    """
+    def _upload():
+        with sftp.open(remote_path, "rb") as rf:
+            return upload_blocks_with_checksum(s3, s3cfg.bucket, key,
+                                               iter_blocks(maybe_throttled(rf, limiter), part_size), algo)
+
+    return retry(f"Upload {remote_path}", _upload, logger, attempts=attempts, base_sleep=1.0,
+                 retry_exceptions=(Exception,), breakers=(BREAKER_SFTP, BREAKER_S3))
+
+
+# =========================
+# Spool local (desacopla lectura SFTP y escritura S3)
+# =========================
+class Spool:
+    """
+    Directorio de staging con tope de bytes:
+      <id>.part       descarga en curso (se reanuda desde su tamaño)
+      <id>.src.json   size/mtime del origen del .part (si cambió, se baja de cero)
+      <id>.meta.json  metadatos (key, rel_path, size, mtime, digest, ...)
+      <id>.data       descarga completa, lista para subir
+    Lectores SFTP llaman fill(); uploaders S3 consumen 'queue'. reserve() bloquea mientras
+    el spool esté lleno (back-pressure hacia el lado SFTP). claim() marca el key como tomado
+    desde que se empieza a bajar hasta que se sube (o se reencola): un listado que lo vuelve
+    a ver no lo pisa mientras un uploader lo está leyendo.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, logger: logging.Logger):
+        self.dir = directory
+        self.max_bytes = max_bytes
+        self.logger = logger
+        self.used = 0
+        self.queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._deferred: List[Dict[str, Any]] = []
+        self._claimed: set = set()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _id(key: str) -> str:
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+
+    def paths(self, key: str) -> Tuple[str, str, str]:
+        base = os.path.join(self.dir, self._id(key))
+        return base + ".part", base + ".data", base + ".meta.json"
+
+    def src_path(self, key: str) -> str:
+        return os.path.join(self.dir, self._id(key) + ".src.json")
+
+    # ---- keys tomados ----
+    def claim(self, key: str) -> bool:
+        with self._cond:
+            if key in self._claimed:
+                return False
+            self._claimed.add(key)
+            return True
+
+    def unclaim(self, key: str):
+        with self._cond:
+            self._claimed.discard(key)
+
+    # ---- capacidad ----
+    def reserve(self, n: int, stop: Optional[threading.Event] = None) -> bool:
+        with self._cond:
+            # un archivo más grande que el tope pasa solo si el spool está vacío
+            while self.used > 0 and self.used + n > self.max_bytes:
+                if stop is not None and stop.is_set():
+                    return False
+                self._cond.wait(1.0)
+            self.used += n
+            METRICS.set("spool_bytes", self.used)
+            return True
+
+    def release(self, n: int):
+        with self._cond:
+            self.used = max(0, self.used - n)
+            METRICS.set("spool_bytes", self.used)
+            self._cond.notify_all()
+
+    # ---- lado SFTP ----
+    def fill(self, sftp, remote_path: str, meta: Dict[str, Any], algo: str,
+             limiter: Optional[RateLimiter] = None, chunk: int = 1024 * 1024) -> Dict[str, Any]:
+        """
+        Descarga remote_path al spool reanudando el .part si existe. Al terminar escribe la meta
+        y renombra a .data. Retorna la meta (con digest si algo != none).
+        """
+        part, data, meta_path = self.paths(meta["key"])
+        src_path = self.src_path(meta["key"])
+        size = int(meta["size"])
+        src = {"remote_path": remote_path, "size": size, "mtime": int(meta.get("mtime", 0))}
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        if offset > size:
+            offset = 0
+        if offset and load_state(src_path) != src:
+            # el .part es de otra versión del archivo (o no sabemos de cuál): no se empalma
+            self.logger.info(f"Spool: el .part no es de la versión actual de {remote_path}, se baja de cero")
+            offset = 0
+        if not offset:
+            save_state(src_path, src)
+        h = hashlib.new(algo) if algo != "none" else None
+
+        if h is not None and offset:
+            with open(part, "rb") as f:
+                for block in iter(lambda: f.read(chunk), b""):
+                    h.update(block)
+
+        with sftp.open(remote_path, "rb") as rf, open(part, "r+b" if offset else "wb") as out:
+            if offset:
+                self.logger.debug(f"Spool: reanudo {remote_path} desde {offset} bytes")
+                rf.seek(offset)
+                out.seek(offset)
+                out.truncate()
+            reader = maybe_throttled(rf, limiter)
+            while True:
+                block = reader.read(chunk)
+                if not block:
+                    break
+                out.write(block)
+                if h is not None:
+                    h.update(block)
+            out.flush()
+            os.fsync(out.fileno())
+
+        got = os.path.getsize(part)
+        meta = dict(meta, spooled_bytes=got, digest=h.hexdigest() if h is not None else "")
+        save_state(meta_path, meta)
+        os.replace(part, data)
+        try:
+            os.remove(src_path)
+        except FileNotFoundError:
+            pass
+        return meta
+
+    # ---- lado S3 ----
+    def discard(self, key: str, size: int):
+        for path in self.paths(key) + (self.src_path(key),):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.release(size)
+
+    def recover(self, max_part_age_s: float) -> List[Dict[str, Any]]:
+        """
+        Tras un reinicio: .data con meta vuelven a la cola (y quedan tomados, ver claim());
+        .part viejos y metas huérfanas se borran.
+        """
+        ready = []
+        now = time.time()
+        for name in os.listdir(self.dir):
+            path = os.path.join(self.dir, name)
+            if name.endswith(".data"):
+                meta = load_state(path[:-len(".data")] + ".meta.json")
+                if meta.get("key"):
+                    ready.append(meta)
+                    with self._cond:
+                        self.used += int(meta.get("size", 0))
+                        self._claimed.add(meta["key"])
+                else:
+                    self.logger.warning(f"Spool: {name} sin meta, se descarta.")
+                    os.remove(path)
+            elif name.endswith(".part") and now - os.path.getmtime(path) > max_part_age_s:
+                self.logger.info(f"Spool: borro .part viejo {name}")
+                os.remove(path)
+            elif name.endswith(".meta.json") and not os.path.exists(path[:-len(".meta.json")] + ".data"):
+                os.remove(path)
+            elif name.endswith(".src.json") and not os.path.exists(path[:-len(".src.json")] + ".part"):
+                os.remove(path)
+        METRICS.set("spool_bytes", self.used)
+        return ready
+
+    def start_uploaders(self, upload_fn, n: int, stop: threading.Event):
+        def _loop():
+            while True:
+                meta = self.queue.get()
+                METRICS.set("queue_depth", self.queue.qsize(), queue="spool")
+                if meta is None:
+                    return
+                if stop.is_set():
+                    continue  # queda en disco para la próxima ejecución
+                try:
+                    upload_fn(meta)
+                except Exception as e:
+                    self.logger.error(f"Spool: error inesperado subiendo {meta.get('key')}: {e}")
+                with self._cond:
+                    # reencolado (defer): sigue tomado hasta el próximo intento
+                    if not any(d.get("key") == meta.get("key") for d in self._deferred):
+                        self._claimed.discard(meta.get("key"))
+
+        self._threads = [threading.Thread(target=_loop, name=f"spool-up-{i}", daemon=True) for i in range(max(1, n))]
+        for t in self._threads:
+            t.start()
+
+    def put(self, meta: Dict[str, Any]):
+        self.queue.put(meta)
+        METRICS.set("queue_depth", self.queue.qsize(), queue="spool")
+
+    def defer(self, meta: Dict[str, Any]):
+        """
+        Subida fallida: el .data queda en disco y se reencola con requeue_deferred().
+        """
+        with self._cond:
+            self._deferred.append(meta)
+
+    def requeue_deferred(self) -> int:
+        with self._cond:
+            items, self._deferred = self._deferred, []
+        for meta in items:
+            self.put(meta)
+        return len(items)
+
+    def stop_uploaders(self):
+        for _ in self._threads:
+            self.queue.put(None)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def pending_files(self) -> int:
+        return sum(1 for n in os.listdir(self.dir) if n.endswith(".data"))
+
+
+def upload_local_file(s3, s3cfg: S3Config, path: str, key: str, algo: str, part_size: int,
+                      logger: logging.Logger, attempts: int = 5,
+                      extra: Optional[Dict[str, Any]] = None) -> Tuple[str, int]:
+    def _upload():
+        with open(path, "rb") as f:
+            if algo != "none":
+                return upload_blocks_with_checksum(s3, s3cfg.bucket, key, iter_blocks(f, part_size), algo, extra)
+            s3.upload_fileobj(f, s3cfg.bucket, key, ExtraArgs=extra or None)
+        return "", os.path.getsize(path)
+
+    return retry(f"Upload {key}", _upload, logger, attempts=attempts, base_sleep=1.0,
+                 retry_exceptions=(Exception,), breakers=(BREAKER_S3,))
+
+
+# =========================
+# Transformación (compresión / transcodificación) antes de subir
+# =========================
+TRANSFORM_CODECS = ("none", "zstd", "gzip", "cmd")
+TRANSFORM_SUFFIX = {"zstd": ".zst", "gzip": ".gz"}
+TRANSFORM_LEVEL = {"zstd": 3, "gzip": 6}
+
+
+def transform_file(src: str, dst: str, codec: str, level: int, cmd: str, algo: str) -> Tuple[str, int]:
+    """
+    Corre en el pool de procesos. Escribe dst a partir de src y retorna
+    (digest del ORIGINAL según algo, bytes escritos en dst).
+    """
+    h = hashlib.new(algo) if algo != "none" else None
+    chunk = 1024 * 1024
+
+    if codec == "cmd":
+        argv = [t.replace("{in}", src).replace("{out}", dst) for t in shlex.split(cmd)]
+        subprocess.run(argv, check=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.PIPE, timeout=3600)
+        if h is not None:
+            with open(src, "rb") as f:
+                for block in iter(lambda: f.read(chunk), b""):
+                    h.update(block)
+    else:
+        with open(src, "rb") as fin, open(dst, "wb") as fout:
+            if codec == "zstd":
+                writer = zstandard.ZstdCompressor(level=level).stream_writer(fout, size=os.path.getsize(src),
+                                                                            closefd=False)
+            else:
+                writer = gzip.GzipFile(fileobj=fout, mode="wb", compresslevel=level, mtime=0)
+            with writer:
+                for block in iter(lambda: fin.read(chunk), b""):
+                    if h is not None:
+                        h.update(block)
+                    writer.write(block)
+            fout.flush()
+            os.fsync(fout.fileno())
+
+    return (h.hexdigest() if h is not None else ""), os.path.getsize(dst)
+
+
+class Transformer:
+    """
+    Etapa disco -> disco entre el spool y la subida: los uploaders del spool mandan cada archivo
+    a un ProcessPoolExecutor (la compresión usa CPU y no compite con el GIL de las transferencias).
+    Solo aplica a las extensiones configuradas; el key lleva el sufijo del codec.
+    """
+
+    def __init__(self, codec: str, level: Optional[int], cmd: str, suffix: str, exts: str, workers: int):
+        self.codec = codec
+        self.level = TRANSFORM_LEVEL.get(codec, 0) if level is None else level
+        self.cmd = cmd
+        self.suffix = suffix or TRANSFORM_SUFFIX.get(codec, "")
+        self.exts = {e.strip().lower().lstrip(".") for e in exts.split(",") if e.strip()}
+        self.pool = ProcessPoolExecutor(max_workers=max(1, workers))
+
+    @property
+    def tag(self) -> str:
+        if self.codec == "cmd":
+            return os.path.basename(shlex.split(self.cmd)[0])
+        return f"{self.codec}-{self.level}"
+
+    def applies(self, filename: str) -> bool:
+        return filename.rsplit(".", 1)[-1].lower() in self.exts if "." in filename else "" in self.exts
+
+    def content_type(self) -> str:
+        if self.codec == "zstd":
+            return "application/zstd"
+        if self.codec == "gzip":
+            return "application/gzip"
+        return mimetypes.guess_type("x" + self.suffix)[0] or "application/octet-stream"
+
+    def run(self, src: str, algo: str) -> Tuple[str, str, int]:
+        """
+        Retorna (ruta transformada, digest del original, bytes transformados).
+        """
+        dst = src + self.suffix + ".tx"
+        try:
+            digest, nbytes = self.pool.submit(transform_file, src, dst, self.codec, self.level, self.cmd,
+                                              algo).result()
+        except Exception:
+            try:
+                os.remove(dst)
+            except FileNotFoundError:
+                pass
+            raise
+        return dst, digest, nbytes
+
+    def extra(self, size: int, algo: str, digest: str) -> Dict[str, Any]:
+        meta = {"original-size": str(size), "codec": self.tag}
+        if digest:
+            meta["original-digest"] = f"{algo}:{digest}"
+        return {"Metadata": meta, "ContentType": self.content_type()}
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+
+# =========================
+# Pipeline concurrente (listado -> cola -> workers de subida)
+# =========================
+class RunStats:
+    """
+    Contadores + muestras (top N) compartidos por todos los hilos.
+    """
+
+    def __init__(self, sample_limit: int = 10):
+        self.lock = threading.Lock()
+        self.sample_limit = sample_limit
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.samples: Dict[str, List[str]] = defaultdict(list)
+
+    def inc(self, name: str, n: int = 1) -> int:
+        METRICS.inc("events_total", n, event=name)
+        with self.lock:
+            self.counters[name] += n
+            return self.counters[name]
+
+    def add_bytes(self, name: str, n: int) -> int:
+        """
+        Contador de bytes: va al reporte y a su propia métrica <name>_total, no a events_total.
+        """
+        METRICS.inc(f"{name}_total", n)
+        with self.lock:
+            self.counters[name] += n
+            return self.counters[name]
+
+    def sample(self, name: str, value: str):
+        with self.lock:
+            if len(self.samples[name]) < self.sample_limit:
+                self.samples[name].append(value)
+
+    def get(self, name: str) -> int:
+        with self.lock:
+            return self.counters[name]
+
+
+class Copier:
+    """
+    Decide y ejecuta (skip / upload / verify) por archivo. process() se llama desde
+    varios workers a la vez: todo el estado compartido va bajo lock.
+    """
+
+    def __init__(self, args, s3, s3_cfg: S3Config, channels: SftpChannels, state: Dict[str, Any],
+                 stats: RunStats, logger: logging.Logger, stop: threading.Event,
+                 manifest: Optional[Manifest] = None, limiter: Optional[RateLimiter] = None,
+                 spool: Optional[Spool] = None, filters: Optional[FilterEngine] = None,
+                 ledger: Optional[Ledger] = None, dedup: Optional[DedupIndex] = None,
+                 transformer: Optional[Transformer] = None, shard: Optional[Tuple[int, int]] = None):
+        self.args = args
+        self.shard = shard
+        self.transformer = transformer
+        self.filters = filters
+        self.ledger = ledger
+        self.dedup = dedup
+        self.manifest = manifest
+        self.limiter = limiter
+        self.spool = spool
+        self.s3 = s3
+        self.s3_cfg = s3_cfg
+        self.channels = channels
+        self.state = state
+        self.stats = stats
+        self.logger = logger
+        self.stop = stop
+        self.part_size = max(5, args.part_size_mb) * 1024 * 1024
+        # key -> epoch en que quedó subido (state viejo: lista de keys, se fechan ahora)
+        saved = state.get("done_keys", {})
+        now = int(time.time())
+        self.done_keys: Dict[str, int] = dict(saved) if isinstance(saved, dict) else dict.fromkeys(saved, now)
+        self.digests: Dict[str, str] = state.get("digests", {})
+        self._state_lock = threading.Lock()
+        self._last_save = 0.0
+        self._tl = threading.local()
+
+    # ---- registro por archivo (ledger) ----
+    def _rec(self) -> Dict[str, Any]:
+        rec = getattr(self._tl, "rec", None)
+        return rec if rec is not None else {}
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Mide la fase para métricas y la acumula en el registro del archivo en curso.
+        Se descuenta el backoff de retry(): la fase mide solo los intentos.
+        """
+        t0 = time.monotonic()
+        w0 = retry_wait_s()
+        try:
+            yield
+        finally:
+            elapsed = max(0.0, time.monotonic() - t0 - (retry_wait_s() - w0))
+            METRICS.observe("phase_seconds", elapsed, phase=name)
+            rec = self._rec()
+            rec[f"{name}_ms"] = rec.get(f"{name}_ms", 0.0) + elapsed * 1000
+
+    def _ledger_row(self, outcome: str, t0: float):
+        rec = self._rec()
+        if self.ledger is not None and outcome not in ("filtered", "spooled", "other-shard"):
+            rec["total_ms"] = (time.monotonic() - t0) * 1000
+            self.ledger.record(outcome=outcome, **rec)
+        self._tl.rec = None
+
+    # ---- state ----
+    def mark_done(self, key: str, digest: str = ""):
+        with self._state_lock:
+            # con manifest el salto lo decide el manifest: done_keys no se consulta ni se guarda
+            if self.manifest is None:
+                self.done_keys[key] = int(time.time())
+            if digest:
+                self.digests[key] = f"{self.args.checksum}:{digest}"
+            if time.time() - self._last_save >= 1.0:
+                self._save_locked()
+
+    def prune_done(self, max_age_s: float) -> int:
+        """
+        Olvida los keys subidos hace más de max_age_s (y sus digests). En modo daemon la
+        carpeta de esos días ya no se vigila: sin esto done_keys crece sin límite y se
+        reescribe entero en cada guardado.
+        """
+        cutoff = time.time() - max_age_s
+        with self._state_lock:
+            old = [k for k, ts in self.done_keys.items() if ts < cutoff]
+            for k in old:
+                del self.done_keys[k]
+                self.digests.pop(k, None)
+            return len(old)
+
+    def _save_locked(self):
+        self.state["done_keys"] = self.done_keys
+        if self.digests:
+            self.state["digests"] = self.digests
+        save_state(self.args.state_file, self.state)
+        self._last_save = time.time()
+
+    def flush_state(self):
+        with self._state_lock:
+            self._save_locked()
+
+    # ---- por archivo ----
+    def transformed(self, remote_path: str) -> bool:
+        return self.transformer is not None and self.transformer.applies(os.path.basename(remote_path))
+
+    def key_for(self, remote_path: str, rel_path: str) -> str:
+        flat_name = flat_name_with_hash(remote_path, rel_path)
+        if self.transformed(remote_path):
+            flat_name += self.transformer.suffix
+        return f"{self.s3_cfg.prefix.rstrip('/') + '/' if self.s3_cfg.prefix else ''}{flat_name}"
+
+    def fail(self, remote_path: str, key: str, reason: Any, msg: str):
+        self._rec()["detail"] = str(reason)[:500]
+        self.stats.inc("failed_uploads")
+        self.stats.sample("failed", f"{remote_path} -> {key} | {reason}")
+        self.logger.error(msg)
+
+    def throttle_request(self):
+        if self.limiter is not None:
+            self.limiter.throttle_request()
+
+    def _upload_once(self, remote_path: str, key: str, size: int) -> Tuple[str, int]:
+        sftp = self.channels.get()
+        self.throttle_request()
+        with self.phase("upload"):
+            if self.args.checksum != "none":
+                return upload_streaming_with_checksum(sftp, self.s3, self.s3_cfg, remote_path, key, self.args.checksum,
+                                                      self.part_size, self.logger, attempts=5, limiter=self.limiter)
+            upload_streaming_sftp_to_s3(sftp, self.s3, self.s3_cfg, remote_path, key, self.logger, attempts=5,
+                                        limiter=self.limiter)
+            return "", size
+
+    def process(self, remote_path: str, rel_path: str, mtime: int, size: int) -> str:
+        """
+        Retorna el resultado: other-shard | filtered | skipped | dry-run | deduped | failed | spooled | uploaded.
+        """
+        self._tl.rec = {"source_path": remote_path, "rel_path": rel_path, "size": size, "mtime": mtime}
+        t0 = time.monotonic()
+        outcome = "failed"
+        try:
+            outcome = self._process(remote_path, rel_path, mtime, size)
+            return outcome
+        finally:
+            self._ledger_row(outcome, t0)
+
+    def with_rec(self, rec: Dict[str, Any], fn, *a):
+        """
+        Ejecuta fn con 'rec' como registro del archivo en curso (motor async: cada llamada
+        puede caer en un hilo distinto del pool).
+        """
+        self._tl.rec = rec
+        try:
+            return fn(*a)
+        finally:
+            self._tl.rec = None
+
+    def _process(self, remote_path: str, rel_path: str, mtime: int, size: int) -> str:
+        verdict, key, change = self.plan(remote_path, rel_path, mtime, size)
+        if verdict:
+            return verdict
+
+        if self.spool is not None:
+            return self.spool_file(remote_path, rel_path, mtime, size, key, change)
+
+        if self.dedup is None:
+            return self._upload(remote_path, rel_path, mtime, size, key, change)
+
+        digest = None
+        if not self.dedup.begin_unhashed(size):
+            digest = self.dedup_prehash(remote_path)
+            self.dedup.begin(size, digest)
+        try:
+            if digest is not None and self.dedup_hit(remote_path, rel_path, mtime, size, key, digest):
+                return "deduped"
+            return self._upload(remote_path, rel_path, mtime, size, key, change)
+        finally:
+            self.dedup.end(size, digest)
+
+    def _upload(self, remote_path: str, rel_path: str, mtime: int, size: int, key: str, change: str) -> str:
+        # Upload con reconexión si cae SFTP
+        try:
+            digest, nbytes = self._upload_once(remote_path, key, size)
+        except CircuitOpenError as e:
+            self.fail(remote_path, key, e, f"Cancelado subiendo {remote_path}: {e}")
+            return "failed"
+        except (EOFError, OSError, IOError, paramiko.SSHException) as e:
+            self.logger.warning(f"Falla SFTP durante upload: {e}")
+            self.channels.reconnect()
+            try:
+                digest, nbytes = self._upload_once(remote_path, key, size)
+            except Exception as e2:
+                self.fail(remote_path, key, e2, f"Fallo definitivo subiendo {remote_path}: {e2}")
+                return "failed"
+        except Exception as e:
+            self.fail(remote_path, key, e, f"Fallo subiendo {remote_path}: {e}")
+            return "failed"
+
+        return self.finish(remote_path, rel_path, mtime, size, key, change, digest, nbytes)
+
+    def plan(self, remote_path: str, rel_path: str, mtime: int, size: int) -> Tuple[str, str, str]:
+        """
+        Filtros + state/manifest + HEAD. Retorna (veredicto, key, change): veredicto vacío = hay que subir.
+        """
+        args = self.args
+        stats = self.stats
+        if self.shard is not None and shard_of(rel_path, self.shard[1]) != self.shard[0]:
+            stats.inc("other_shard")
+            return "other-shard", "", ""
+        stats.inc("total_files_seen")
+
+        filename = os.path.basename(remote_path)
+        if self.filters is not None:
+            accepted = self.filters.match(filename, rel_path, size, mtime)
+        else:
+            accepted = name_matches(filename, args.name_contains or "INBOUND", args.ignore_case)
+        if not accepted:
+            self.logger.debug(f"SKIP filtro: {rel_path}")
+            stats.sample("skipped_name", filename)
+            return "filtered", "", ""
+
+        stats.inc("matched_name")
+        key = self.key_for(remote_path, rel_path)
+        self._rec()["key"] = key
+
+        change = "new"
+        if self.manifest is not None:
+            change = self.manifest.check(rel_path, size, mtime, key)
+            if change == "unchanged":
+                stats.inc("skipped_manifest")
+                self._rec()["detail"] = "manifest"
+                return "skipped", key, change
+            if change == "changed":
+                prev = self.manifest.previous(rel_path)
+                stats.sample("changed", f"{rel_path} (size {prev.get('size')}->{size}, "
+                                        f"mtime {prev.get('mtime')}->{mtime})")
+                self.logger.info(f"CAMBIÓ desde la última subida: {rel_path}")
+
+        if change == "new" and self.manifest is None and key in self.done_keys:
+            stats.inc("skipped_state")
+            self._rec()["detail"] = "state"
+            return "skipped", key, change
+
+        # Exists en S3 (con manifest solo para archivos nuevos: se compara tamaño y queda como línea base)
+        if change == "new":
+            self.throttle_request()
+            try:
+                if self.manifest is None:
+                    with self.phase("head"):
+                        exists = guarded_call(lambda: object_exists(self.s3, self.s3_cfg.bucket, key), (BREAKER_S3,))
+                    if exists:
+                        self._rec()["detail"] = "exists"
+                        stats.inc("skipped_exists")
+                        stats.sample("skipped_exists", key)
+                        self.mark_done(key)
+                        return "skipped", key, change
+                else:
+                    with self.phase("head"):
+                        remote_size = guarded_call(lambda: head_content_length(self.s3, self.s3_cfg.bucket, key),
+                                                   (BREAKER_S3,))
+                    # transformado: el tamaño en S3 no es el original; basta con que exista (el manifest
+                    # ya detecta cambios por size/mtime)
+                    if remote_size == size or (remote_size is not None and self.transformed(remote_path)):
+                        self._rec()["detail"] = "exists"
+                        stats.inc("skipped_exists")
+                        stats.sample("skipped_exists", key)
+                        self.mark_done(key)
+                        self.manifest.record(rel_path, size, mtime, key)
+                        return "skipped", key, change
+                    if remote_size is not None:
+                        change = "changed"
+                        stats.sample("changed", f"{rel_path} (S3 {remote_size} bytes != SFTP {size} bytes)")
+                        self.logger.info(f"Objeto en S3 con tamaño distinto ({remote_size} != {size}): {key}")
+            except (BotoCoreError, ClientError) as e:
+                self.logger.warning(f"Problema consultando S3 (head_object): {e}. Continuo; boto/retry puede resolver.")
+
+        self.logger.info(f"SUBIR: {remote_path} ({size} bytes) -> {key}")
+
+        if args.dry_run:
+            stats.inc("uploaded")
+            stats.sample("uploaded", key + "  [dry-run]")
+            return "dry-run", key, change
+
+        return "", key, change
+
+    # ---- dedup por contenido ----
+    def dedup_prehash(self, remote_path: str) -> Optional[str]:
+        """
+        Pre-hash para dedup; solo se llama si el tamaño coincide con algún contenido conocido
+        o en curso (DedupIndex.begin_unhashed). Con spool el hash sale gratis del disco y se
+        resuelve en upload_spooled. None = no se pudo, se sube normal.
+        """
+        try:
+            return self.content_digest(remote_path)
+        except Exception as e:
+            self.logger.warning(f"Dedup: no pude pre-hashear {remote_path}: {e}. Se sube normal.")
+            return None
+
+    def content_digest(self, remote_path: str) -> str:
+        def _hash():
+            h = hashlib.sha256()
+            with self.channels.get().open(remote_path, "rb") as rf:
+                rf.prefetch()
+                for block in iter_blocks(maybe_throttled(rf, self.limiter), 1024 * 1024):
+                    h.update(block)
+            return h.hexdigest()
+
+        def _hash_reconnecting():
+            try:
+                return _hash()
+            except (EOFError, paramiko.SSHException):
+                self.channels.reconnect()
+                raise
+
+        self.throttle_request()
+        with self.phase("prehash"):
+            return retry(f"Prehash {remote_path}", _hash_reconnecting, self.logger, attempts=3, base_sleep=1.0,
+                         retry_exceptions=(IOError, OSError, EOFError, paramiko.SSHException),
+                         breakers=(BREAKER_SFTP,))
+
+    def dedup_hit(self, remote_path: str, rel_path: str, mtime: int, size: int, key: str, digest: str) -> bool:
+        """
+        Si el contenido ya está en el bucket bajo otro key: escribe puntero / copia server-side / nada
+        (según --dedup) y deja el archivo como hecho. False = hay que subirlo.
+        """
+        ent = self.dedup.lookup(f"sha256:{digest}")
+        if ent is None:
+            return False
+        canonical = ent["key"]
+        if canonical == key:
+            return False
+
+        self.throttle_request()
+        try:
+            remote_size = guarded_call(lambda: head_content_length(self.s3, self.s3_cfg.bucket, canonical),
+                                       (BREAKER_S3,))
+        except (BotoCoreError, ClientError) as e:
+            self.logger.warning(f"Dedup: no pude verificar {canonical}: {e}. Se sube normal.")
+            return False
+        if remote_size != ent.get("stored", ent["size"]):
+            # el canónico ya no está (o cambió): se olvida y este archivo pasa a ser el nuevo canónico
+            self.dedup.forget(f"sha256:{digest}")
+            return False
+
+        mode = self.args.dedup
+        if mode != "skip":
+            self.throttle_request()
+            with self.phase("upload"):
+                if mode == "copy":
+                    guarded_call(lambda: self.s3.copy_object(
+                        Bucket=self.s3_cfg.bucket, Key=key, CopySource={"Bucket": self.s3_cfg.bucket, "Key": canonical},
+                        MetadataDirective="REPLACE", Metadata={"dedup-of": canonical, "content-sha256": digest},
+                    ), (BREAKER_S3,))
+                else:
+                    body = json.dumps({"pointer_to": canonical, "sha256": digest, "size": size,
+                                       "source": remote_path}, ensure_ascii=False).encode("utf-8")
+                    guarded_call(lambda: self.s3.put_object(
+                        Bucket=self.s3_cfg.bucket, Key=key, Body=body, ContentType="application/json",
+                        Metadata={"dedup-of": canonical, "content-sha256": digest},
+                    ), (BREAKER_S3,))
+
+        self._rec().update(digest=f"sha256:{digest}", detail=f"dedup {mode} -> {canonical}")
+        self.stats.inc("deduped")
+        self.stats.add_bytes("dedup_bytes_saved", size)
+        self.stats.sample("deduped", f"{key} == {canonical}")
+        self.logger.info(f"DUPLICADO: {remote_path} tiene el mismo contenido que {canonical} ({mode})")
+        self.mark_done(key, digest)
+        if self.manifest is not None:
+            self.manifest.record(rel_path, size, mtime, key)
+        return True
+
+    def discard_object(self, key: str):
+        """
+        Borra un objeto que quedó subido con el tamaño equivocado: si se deja, el HEAD de plan()
+        lo da por subido y nunca se reintenta.
+        """
+        self.throttle_request()
+        try:
+            guarded_call(lambda: self.s3.delete_object(Bucket=self.s3_cfg.bucket, Key=key), (BREAKER_S3,))
+        except (BotoCoreError, ClientError) as e:
+            self.logger.warning(f"No pude borrar {key} tras fallar la verificación: {e}")
+
+    def finish(self, remote_path: str, rel_path: str, mtime: int, size: int, key: str, change: str,
+               digest: str, nbytes: int, expected: Optional[int] = None, content_digest: str = "") -> str:
+        """
+        Verificación + contadores + state/manifest tras un upload (directo o desde spool).
+        expected: bytes que debe tener el objeto si no es el original (transformado).
+        content_digest: digest del original cuando difiere del subido (para dedup).
+        """
+        args = self.args
+        stats = self.stats
+        want = size if expected is None else expected
+
+        if args.checksum != "none":
+            # MinIO ya validó cada bloque; solo confirmamos que leímos lo que listamos
+            if nbytes != want:
+                self.discard_object(key)
+                self.fail(remote_path, key, f"verify(bytes) FAILED ({nbytes} != {want})",
+                          f"Bytes leídos ({nbytes}) != tamaño esperado ({want}); ¿archivo cambiando? Queda para reintento.")
+                return "failed"
+            stats.inc("verified_checksum")
+            self.logger.debug(f"{args.checksum}({key}) = {digest}")
+        else:
+            # Verificación por tamaño
+            self.throttle_request()
+            with self.phase("verify"):
+                verified = guarded_call(lambda: verify_uploaded_size(self.s3, self.s3_cfg.bucket, key, want),
+                                        (BREAKER_S3,))
+            if not verified:
+                self.discard_object(key)
+                self.fail(remote_path, key, f"verify(ContentLength) FAILED (expected {want})",
+                          f"Upload no verificado por tamaño (ContentLength != {want}). Queda para reintento.")
+                return "failed"
+
+        uploaded = stats.inc("uploaded")
+        METRICS.inc("bytes_uploaded_total", nbytes)
+        if digest:
+            self._rec()["digest"] = f"{args.checksum}:{digest}"
+            if self.dedup is not None:
+                self.dedup.record(f"sha256:{content_digest or digest}", size, key, stored=want)
+        stats.sample("uploaded", f"{key}  {args.checksum}={digest}" if digest else key)
+        self.mark_done(key, digest)
+        if change == "changed":
+            stats.inc("changed_reuploads")
+        if self.manifest is not None:
+            self.manifest.record(rel_path, size, mtime, key)
+
+        if args.max_files and uploaded >= args.max_files and not self.stop.is_set():
+            self.logger.info(f"Alcanzado --max-files={args.max_files}. Corto ejecución.")
+            self.stop.set()
+        return "uploaded"
+
+    # ---- spool ----
+    def spool_file(self, remote_path: str, rel_path: str, mtime: int, size: int, key: str, change: str) -> str:
+        """
+        Lado lector: SFTP -> disco. La subida la hace upload_spooled() en otro hilo.
+        """
+        if not self.spool.claim(key):
+            # ya está en el spool (recuperado o de un sondeo anterior) esperando subida
+            self.stats.inc("skipped_spool")
+            self._rec()["detail"] = "spool"
+            return "skipped"
+        if not self.spool.reserve(size, self.stop):
+            self.spool.unclaim(key)
+            return "failed"
+        meta = {"key": key, "remote_path": remote_path, "rel_path": rel_path, "size": size,
+                "mtime": mtime, "change": change}
+
+        def _fill():
+            self.throttle_request()
+            with self.phase("spool"):
+                return self.spool.fill(self.channels.get(), remote_path, meta, self.args.checksum, self.limiter)
+
+        def _fill_reconnecting():
+            try:
+                return _fill()
+            except (EOFError, paramiko.SSHException):
+                self.channels.reconnect()
+                raise
+
+        try:
+            meta = retry(f"Spool {remote_path}", _fill_reconnecting, self.logger, attempts=4, base_sleep=1.0,
+                         retry_exceptions=(IOError, OSError, EOFError, paramiko.SSHException),
+                         breakers=(BREAKER_SFTP,))
+        except Exception as e:
+            self.spool.release(size)
+            self.spool.unclaim(key)
+            self.fail(remote_path, key, e, f"Fallo bajando {remote_path} al spool: {e}")
+            return "failed"
+
+        self.stats.inc("spooled")
+        self.spool.put(meta)
+        return "spooled"
+
+    def upload_spooled(self, meta: Dict[str, Any]):
+        """
+        Lado S3: disco -> MinIO, verificación y limpieza del spool.
+        """
+        self._tl.rec = {"source_path": meta.get("remote_path", meta["key"]), "rel_path": meta.get("rel_path", ""),
+                        "key": meta["key"], "size": int(meta["size"]), "mtime": int(meta.get("mtime", 0)),
+                        "detail": "spool"}
+        t0 = time.monotonic()
+        outcome = "failed"
+        size = int(meta["size"])
+        digest = None
+        if self.dedup is not None and int(meta.get("spooled_bytes", -1)) == size:
+            digest = meta.get("digest") or None
+        try:
+            if self.dedup is not None:
+                self.dedup.begin(size, digest)
+            try:
+                outcome = self._upload_spooled(meta)
+            finally:
+                if self.dedup is not None:
+                    self.dedup.end(size, digest)
+        finally:
+            self._ledger_row(outcome, t0)
+
+    def _upload_spooled(self, meta: Dict[str, Any]) -> str:
+        key = meta["key"]
+        size = int(meta["size"])
+        remote_path = meta.get("remote_path", key)
+        _part, data, _meta = self.spool.paths(key)
+
+        if self.dedup is not None and meta.get("digest") and int(meta.get("spooled_bytes", -1)) == size:
+            try:
+                hit = self.dedup_hit(remote_path, meta.get("rel_path", ""), int(meta.get("mtime", 0)), size, key,
+                                     meta["digest"])
+            except Exception as e:
+                self.logger.warning(f"Dedup: fallo resolviendo duplicado de {key}: {e}. Se sube normal.")
+                hit = False
+            if hit:
+                self.spool.discard(key, size)
+                return "deduped"
+
+        upload_path, expected, extra = data, None, None
+        if self.transformed(remote_path):
+            try:
+                with self.phase("transform"):
+                    upload_path, src_digest, expected = self.transformer.run(data, self.args.checksum)
+            except Exception as e:
+                # el original queda en el spool: se reintenta con la próxima ejecución/sondeo
+                self.spool.defer(meta)
+                detail = getattr(e, "stderr", b"") or b""
+                self.fail(remote_path, key, e, f"Fallo transformando {key} ({self.transformer.tag}): {e} "
+                                               f"{detail.decode('utf-8', 'replace').strip()[-300:]}")
+                return "failed"
+            if meta.get("digest") and src_digest != meta["digest"]:
+                os.remove(upload_path)
+                self.spool.discard(key, size)
+                self.fail(remote_path, key, "digest spool != digest transformado",
+                          f"Spool corrupto para {key}: digest no coincide. Se descarta y se vuelve a bajar.")
+                return "failed"
+            extra = self.transformer.extra(size, self.args.checksum, meta.get("digest", ""))
+            self.stats.inc("transformed")
+            self.stats.add_bytes("transform_bytes_in", size)
+            self.stats.add_bytes("transform_bytes_out", expected)
+
+        try:
+            try:
+                self.throttle_request()
+                with self.phase("upload"):
+                    digest, nbytes = upload_local_file(self.s3, self.s3_cfg, upload_path, key, self.args.checksum,
+                                                       self.part_size, self.logger, extra=extra)
+            except Exception as e:
+                # queda en disco: se reintenta en el próximo sondeo del daemon o en la próxima ejecución
+                self.spool.defer(meta)
+                self.fail(remote_path, key, e, f"Fallo subiendo desde spool {key}: {e}")
+                return "failed"
+        finally:
+            if upload_path != data:
+                try:
+                    os.remove(upload_path)
+                except FileNotFoundError:
+                    pass
+
+        if expected is None and meta.get("digest") and digest and meta["digest"] != digest:
+            self.spool.discard(key, size)
+            self.fail(remote_path, key, "digest spool != digest subida",
+                      f"Spool corrupto para {key}: digest no coincide. Se descarta y se vuelve a bajar.")
+            return "failed"
+
+        outcome = self.finish(remote_path, meta.get("rel_path", ""), int(meta.get("mtime", 0)), size, key,
+                              meta.get("change", "new"), digest, nbytes, expected=expected,
+                              content_digest=meta.get("digest", "") if expected is not None else "")
+        if outcome == "uploaded" or nbytes != (size if expected is None else expected):
+            self.spool.discard(key, size)
+        return outcome
+
+
+def run_pipeline(produce, process, workers: int, logger: logging.Logger, stop: threading.Event,
+                 queue_size: int = 1000, on_worker_exit=None):
+    """
+    produce(emit) mete tuplas (remote_path, rel_path, mtime, size) en una cola acotada
+    (back-pressure hacia el listado); 'workers' hilos las consumen con process(...).
+    """
+    q: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=queue_size)
+
+    def _consumer():
+        while True:
+            item = q.get()
+            METRICS.set("queue_depth", q.qsize(), queue="upload")
+            if item is None:
+                if on_worker_exit is not None:
+                    on_worker_exit()
+                return
+            if stop.is_set():
+                continue
+            try:
+                process(*item)
+            except Exception as e:
+                logger.error(f"Error inesperado procesando {item[0]}: {e}")
+
+    def _emit(*item):
+        if not stop.is_set():
+            q.put(item)
+            METRICS.set("queue_depth", q.qsize(), queue="upload")
+
+    threads = [threading.Thread(target=_consumer, name=f"upload-{i}", daemon=True) for i in range(max(1, workers))]
+    for t in threads:
+        t.start()
+    try:
+        produce(_emit)
+    finally:
+        for _ in threads:
+            q.put(None)
+        for t in threads:
+            t.join()
+
+
+# =========================
+# Motor asyncio (--engine async)
+# =========================
+class AsyncBudget:
+    """
+    Tope de bytes en memoria para los archivos en vuelo (acquire espera si no hay cupo;
+    un archivo más grande que el tope pasa solo cuando no hay nada más en vuelo).
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.used = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self, n: int):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.used == 0 or self.used + n <= self.limit)
+            self.used += n
+
+    async def release(self, n: int):
+        async with self._cond:
+            self.used -= n
+            self._cond.notify_all()
+
+
+class AsyncBlockReader:
+    """
+    File-like para boto3 corriendo en un hilo del pool: read(n) pide el bloque al event loop
+    (asyncssh) y espera el resultado. 'head' es lo ya leído desde el loop; si fue un archivo
+    chico completo (eof=True) no hay ningún salto de vuelta al loop.
+    """
+
+    def __init__(self, loop, fobj, limiter: Optional[RateLimiter], head: bytes = b"", eof: bool = False):
+        self._loop = loop
+        self._f = fobj
+        self._limiter = limiter
+        self._buf = head
+        self._eof = eof
+        self.nbytes = 0
+
+    async def _read(self, size: int) -> bytes:
+        data = await self._f.read(size)
+        if data and self._limiter is not None:
+            await self._limiter.athrottle_bytes(len(data))
+        return data
+
+    def read(self, size: int = -1) -> bytes:
+        if self._buf:
+            n = len(self._buf) if size is None or size < 0 else size
+            data, self._buf = self._buf[:n], self._buf[n:]
+        elif self._eof:
+            data = b""
+        else:
+            data = asyncio.run_coroutine_threadsafe(self._read(size), self._loop).result()
+        self.nbytes += len(data)
+        return data
+
+
+class AsyncEngine:
+    """
+    Listado y lectura SFTP con asyncssh: cientos de archivos en vuelo sobre una sola conexión
+    (requests SFTP en pipeline), sin un hilo ni un canal por archivo. Las llamadas boto3 van a
+    un pool de hilos acotado (--s3-threads); las decisiones (filtros, state, manifest, HEAD,
+    verificación, ledger) son las mismas de Copier.
+    """
+
+    def __init__(self, args, cfg: SftpConfig, copier: Copier, logger: logging.Logger, stop: threading.Event,
+                 limiter: Optional[RateLimiter] = None):
+        self.args = args
+        self.cfg = cfg
+        self.copier = copier
+        self.logger = logger
+        self.stop = stop
+        self.limiter = limiter
+        self.inflight = max(1, args.inflight)
+        self.pool = ThreadPoolExecutor(max_workers=max(1, args.s3_threads), thread_name_prefix="s3")
+        self._conn = None
+        self._sftp = None
+        self._gen = 0
+        self._lost: Optional[int] = None  # generación que quedó caída con el circuito abierto
+        self._reconnect_lock: Optional[asyncio.Lock] = None
+        self._loop = None
+
+    # ---- conexión ----
+    async def _connect(self):
+        last = None
+        for i in range(1, 6):
+            try:
+                conn = await asyncio.wait_for(asyncssh.connect(
+                    self.cfg.host, port=self.cfg.port, username=self.cfg.username, password=self.cfg.password,
+                    known_hosts=None, keepalive_interval=self.cfg.keepalive), timeout=self.cfg.timeout)
+                return conn, await conn.start_sftp_client()
+            except (OSError, asyncio.TimeoutError, asyncssh.Error) as e:
+                last = e
+                sleep_s = random.uniform(0.5, 1.0) * (2 ** (i - 1))
+                self.logger.warning(f"Conexión SFTP (async) falló (intento {i}/5): {e} | reintento en {sleep_s:.1f}s")
+                await asyncio.sleep(sleep_s)
+        raise last
+
+    async def _reconnect(self, gen: int):
+        async with self._reconnect_lock:
+            if gen != self._gen:
+                return
+            self.logger.warning("Reconectando SFTP (async)...")
+            METRICS.inc("reconnects_total", target="sftp")
+            if self._conn is not None:
+                self._conn.close()
+            self._conn, self._sftp = await self._connect()
+            self._gen += 1
+
+    @staticmethod
+    def _connection_lost(e: BaseException) -> bool:
+        return isinstance(e, (asyncssh.DisconnectError, asyncssh.SFTPConnectionLost, ConnectionError, EOFError))
+
+    async def _sftp_ready(self, owner):
+        """
+        Espera a BREAKER_SFTP (cooldown común a todas las corutinas). Si la conexión se cayó
+        con el circuito abierto, el primero que pasa (el canario) reconecta.
+        """
+        await BREAKER_SFTP.abefore_call(owner)
+        if self._lost is not None and self._lost == self._gen:
+            await self._reconnect(self._gen)
+
+    async def _after_failure(self, e: BaseException, gen: int, owner) -> bool:
+        """
+        Informa el fallo al breaker y reconecta si hace falta. True = el circuito quedó abierto
+        (no hay que dormir un backoff propio; la reconexión queda para cuando se pueda pasar).
+        """
+        BREAKER_SFTP.record_failure(e, owner)
+        tripped = BREAKER_SFTP.state == CircuitBreaker.OPEN
+        if self._connection_lost(e):
+            if tripped:
+                self._lost = gen
+            else:
+                await self._reconnect(gen)
+        return tripped
+
+    async def _sftp_call(self, op_name: str, fn, attempts: int = 4, base_sleep: float = 0.5):
+        """
+        Equivalente async de retry() para operaciones SFTP (fn recibe el cliente vigente).
+        Pasa por BREAKER_SFTP: con el circuito abierto espera el cooldown común.
+        """
+        owner = asyncio.current_task()
+        for i in range(1, attempts + 1):
+            gen = self._gen
+            try:
+                await self._sftp_ready(owner)
+                gen = self._gen
+                result = await fn(self._sftp)
+            except (OSError, EOFError, asyncssh.Error) as e:
+                tripped = await self._after_failure(e, gen, owner)
+                if i == attempts:
+                    raise
+                if tripped:
+                    # sin backoff propio: el próximo intento espera el cooldown del breaker
+                    continue
+                cap = base_sleep * (2 ** (i - 1))
+                sleep_s = random.uniform(cap / 2, cap)
+                METRICS.inc("retries_total", op=op_name.split(" ", 1)[0].lower())
+                self.logger.warning(f"{op_name} falló (intento {i}/{attempts}): {e} | reintento en {sleep_s:.1f}s")
+                await asyncio.sleep(sleep_s)
+            else:
+                BREAKER_SFTP.record_success()
+                return result
+
+    async def _offload(self, rec: Dict[str, Any], fn, *a):
+        return await self._loop.run_in_executor(self.pool, self.copier.with_rec, rec, fn, *a)
+
+    async def _throttle_request(self):
+        if self.limiter is not None:
+            await self.limiter.athrottle_request()
+
+    # ---- listado ----
+    async def _walk(self, folder: str, q: "asyncio.Queue"):
+        folder = folder.rstrip("/")
+        sem = asyncio.Semaphore(max(1, self.args.list_workers))
+        errors = [0]
+
+        async def _dir(cur: str):
+            if self.stop.is_set() or errors[0] >= 50:
+                return
+            async with sem:
+                await self._throttle_request()
+                try:
+                    with METRICS.timer("list"):
+                        names = await self._sftp_call(f"Listar {cur}", lambda sftp: sftp.readdir(cur))
+                except Exception as e:
+                    self.logger.warning(f"No pude listar {cur}: {e}")
+                    errors[0] += 1
+                    if errors[0] == 50:
+                        self.logger.error("Demasiados errores listando. Corto el recorrido.")
+                    return
+
+            subdirs = []
+            for ent in names:
+                if ent.filename in (".", ".."):
+                    continue
+                rpath = f"{cur}/{ent.filename}"
+                mode = ent.attrs.permissions or 0
+                if stat.S_ISDIR(mode):
+                    subdirs.append(rpath)
+                elif stat.S_ISREG(mode):
+                    rel = rpath[len(folder) + 1:] if rpath.startswith(folder + "/") else ent.filename
+                    await q.put((rpath, rel, int(ent.attrs.mtime or 0), int(ent.attrs.size or 0)))
+                    METRICS.set("queue_depth", q.qsize(), queue="upload")
+            await asyncio.gather(*(_dir(d) for d in subdirs))
+
+        await _dir(folder)
+
+    # ---- por archivo ----
+    def _upload_reader(self, reader: AsyncBlockReader, key: str) -> Tuple[str, int]:
+        """
+        Corre en el pool: mismo camino de subida que el motor por hilos.
+        """
+        copier = self.copier
+        copier.throttle_request()
+
+        def _put():
+            if self.args.checksum != "none":
+                return upload_blocks_with_checksum(copier.s3, copier.s3_cfg.bucket, key,
+                                                   iter_blocks(reader, copier.part_size), self.args.checksum)
+            copier.s3.upload_fileobj(reader, copier.s3_cfg.bucket, key)
+            return "", reader.nbytes
+
+        return guarded_call(_put, (BREAKER_S3,))
+
+    async def _transfer(self, rec: Dict[str, Any], remote_path: str, key: str, size: int,
+                        attempts: int = 3) -> Tuple[str, int]:
+        part = self.copier.part_size
+        owner = asyncio.current_task()
+        for i in range(1, attempts + 1):
+            gen = self._gen
+            t0 = t1 = None
+            try:
+                # con SFTPGo caído los archivos en vuelo esperan el mismo cooldown en vez de insistir cada uno
+                await self._sftp_ready(owner)
+                gen = self._gen
+                t0 = time.monotonic()
+                with METRICS.timer("upload"):
+                    async with self._sftp.open(remote_path, "rb") as f:
+                        # archivo chico: se lee entero desde el loop y el hilo solo hace el PUT
+                        head = await f.read(part) if size < part else b""
+                        if head and self.limiter is not None:
+                            await self.limiter.athrottle_bytes(len(head))
+                        reader = AsyncBlockReader(self._loop, f, self.limiter, head, eof=0 < len(head) < part)
+                        result = await self._offload(rec, self._upload_reader, reader, key)
+                BREAKER_SFTP.record_success()
+                return result
+            except CircuitOpenError:
+                BREAKER_SFTP.release(owner)
+                raise
+            except Exception as e:
+                t1 = time.monotonic()  # fin del intento: la reconexión y el backoff no cuentan
+                tripped = await self._after_failure(e, gen, owner)
+                if i == attempts:
+                    raise
+                if tripped:
+                    raise CircuitOpenError(f"{BREAKER_SFTP.name}: circuito abierto subiendo {remote_path}") from e
+                sleep_s = random.uniform(0.5, 1.0) * (2 ** (i - 1))
+                METRICS.inc("retries_total", op="upload")
+                self.logger.warning(f"Upload {remote_path} falló (intento {i}/{attempts}): {e} | "
+                                    f"reintento en {sleep_s:.1f}s")
+                await asyncio.sleep(sleep_s)
+            finally:
+                if t0 is not None:
+                    end = t1 if t1 is not None else time.monotonic()
+                    rec["upload_ms"] = rec.get("upload_ms", 0.0) + (end - t0) * 1000
+        raise RuntimeError("unreachable")  # pragma: no cover
+
+    async def _upload(self, rec: Dict[str, Any], budget: AsyncBudget, remote_path: str, rel_path: str,
+                      mtime: int, size: int, key: str, change: str) -> str:
+        copier = self.copier
+        # en memoria: el archivo chico completo, o hasta 2 partes de un multipart
+        need = min(size, 2 * copier.part_size) or 1
+        await budget.acquire(need)
+        try:
+            digest, nbytes = await self._transfer(rec, remote_path, key, size)
+        finally:
+            await budget.release(need)
+        return await self._offload(rec, copier.finish, remote_path, rel_path, mtime, size, key, change,
+                                   digest, nbytes)
+
+    async def _one(self, budget: AsyncBudget, remote_path: str, rel_path: str, mtime: int, size: int):
+        copier = self.copier
+        rec = {"source_path": remote_path, "rel_path": rel_path, "size": size, "mtime": mtime}
+        t0 = time.monotonic()
+        outcome = "failed"
+        key = ""
+        try:
+            verdict, key, change = await self._offload(rec, copier.plan, remote_path, rel_path, mtime, size)
+            if verdict:
+                outcome = verdict
+                return
+            if copier.dedup is None:
+                outcome = await self._upload(rec, budget, remote_path, rel_path, mtime, size, key, change)
+                return
+            content = None
+            if not copier.dedup.begin_unhashed(size):
+                content = await self._offload(rec, copier.dedup_prehash, remote_path)
+                # se espera en el loop, no en el pool: los hilos S3 los necesita la subida que se espera
+                while not copier.dedup.try_begin(size, content):
+                    await asyncio.sleep(0.2)
+            try:
+                if content is not None and await self._offload(rec, copier.dedup_hit, remote_path, rel_path, mtime,
+                                                               size, key, content):
+                    outcome = "deduped"
+                    return
+                outcome = await self._upload(rec, budget, remote_path, rel_path, mtime, size, key, change)
+            finally:
+                copier.dedup.end(size, content)
+        except CircuitOpenError as e:
+            await self._offload(rec, copier.fail, remote_path, key, e, f"Cancelado subiendo {remote_path}: {e}")
+        except Exception as e:
+            await self._offload(rec, copier.fail, remote_path, key, e, f"Fallo definitivo subiendo {remote_path}: {e}")
+        finally:
+            copier.with_rec(rec, copier._ledger_row, outcome, t0)
+
+    async def _consumer(self, q: "asyncio.Queue", budget: AsyncBudget):
+        while True:
+            item = await q.get()
+            METRICS.set("queue_depth", q.qsize(), queue="upload")
+            if item is None:
+                return
+            if self.stop.is_set():
+                continue
+            try:
+                await self._one(budget, *item)
+            except Exception as e:
+                self.logger.error(f"Error inesperado procesando {item[0]}: {e}")
+
+    async def _run(self, folder: str):
+        self._loop = asyncio.get_running_loop()
+        self._reconnect_lock = asyncio.Lock()
+        self._conn, self._sftp = await self._connect()
+        q: "asyncio.Queue[Optional[tuple]]" = asyncio.Queue(maxsize=self.args.queue_size)
+        budget = AsyncBudget(self.args.inflight_mb * 1024 * 1024)
+        consumers = [asyncio.create_task(self._consumer(q, budget)) for _ in range(self.inflight)]
+        try:
+            await self._walk(folder, q)
+        finally:
+            for _ in consumers:
+                await q.put(None)
+            await asyncio.gather(*consumers, return_exceptions=True)
+            self._conn.close()
+
+    def run(self, folder: str):
+        try:
+            asyncio.run(self._run(folder))
+        finally:
+            self.pool.shutdown(wait=True)
+
+
+# =========================
+# Modo daemon (sondeo incremental de HOY)
+# =========================
+class DirWatermarks:
+    """
+    Estado incremental del modo daemon.
+    Por directorio: mtime del dir, hwm (mtime máx. de archivos ya resueltos) y si tiene subdirectorios.
+      - un dir hoja con el mismo mtime y sin archivos pendientes no se vuelve a listar
+      - archivos con mtime < hwm ya se resolvieron: no vuelven a la cola
+    Por archivo: (size, mtime, sondeos_iguales); se sube cuando llega a stable_polls.
+    """
+
+    def __init__(self, saved: Dict[str, Any], stable_polls: int):
+        self.dirs: Dict[str, Dict[str, Any]] = dict(saved.get("dirs", {}))
+        self.stable_polls = max(1, stable_polls)
+        self.observed: Dict[str, Tuple[int, int, int]] = {}
+        self._lock = threading.Lock()
+        self._full = True
+        self._pending_dirs: set = set()
+        self._seen_mtime: Dict[str, int] = {}
+
+    def begin_poll(self, full: bool):
+        with self._lock:
+            self._full = full
+            self._pending_dirs = {posixpath.dirname(p) for p in self.observed}
+            self._seen_mtime = {}
+
+    def should_list(self, path: str, dir_mtime: int) -> bool:
+        with self._lock:
+            self._seen_mtime[path] = dir_mtime
+            info = self.dirs.get(path)
+            if self._full or info is None or info.get("subdirs", True):
+                return True
+            return info.get("mtime") != dir_mtime or path in self._pending_dirs
+
+    def listed(self, path: str, entries):
+        has_subdirs = any(stat.S_ISDIR(e.st_mode) for e in entries)
+        with self._lock:
+            info = self.dirs.setdefault(path, {"hwm": 0})
+            info["subdirs"] = has_subdirs
+            if path in self._seen_mtime:
+                info["mtime"] = self._seen_mtime[path]
+
+    def candidate(self, emit, remote_path: str, rel_path: str, mtime: int, size: int):
+        with self._lock:
+            obs = self.observed.get(remote_path)
+            if obs is None and not self._full:
+                info = self.dirs.get(posixpath.dirname(remote_path), {})
+                hwm = info.get("hwm", 0)
+                if mtime < hwm or (mtime == hwm and remote_path in info.get("at_hwm", ())):
+                    return
+            n = obs[2] + 1 if obs is not None and obs[0] == size and obs[1] == mtime else 1
+            self.observed[remote_path] = (size, mtime, n)
+            ready = n >= self.stable_polls
+        if ready:
+            emit(remote_path, rel_path, mtime, size)
+
+    def resolve(self, remote_path: str, mtime: int, size: int, outcome: str):
+        with self._lock:
+            if outcome == "failed":
+                # vuelve a intentarse en el próximo sondeo si sigue igual
+                self.observed[remote_path] = (size, mtime, self.stable_polls - 1)
+                return
+            self.observed.pop(remote_path, None)
+            info = self.dirs.setdefault(posixpath.dirname(remote_path), {"hwm": 0, "subdirs": True})
+            if mtime > info.get("hwm", 0):
+                info["hwm"] = mtime
+                info["at_hwm"] = [remote_path]
+            elif mtime == info["hwm"] and remote_path not in info.setdefault("at_hwm", []):
+                # mismo segundo que el hwm: recordamos cuáles ya se resolvieron
+                info["at_hwm"].append(remote_path)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self.observed)
+
+    def to_state(self, folders: List[str]) -> Dict[str, Any]:
+        # solo guardamos lo de las carpetas vigiladas (los días viejos se descartan)
+        with self._lock:
+            keep = {d: v for d, v in self.dirs.items() if any(d == f or d.startswith(f + "/") for f in folders)}
+            self.dirs = keep
+            return {"dirs": dict(keep)}
+
+
+def daemon_folders(remote_root: str, tz: ZoneInfo, rollover_minutes: int) -> List[str]:
+    """
+    Carpeta de HOY; justo después de medianoche también la de AYER (para rematar lo último del día).
+    """
+    remote_root = remote_root.rstrip("/")
+    now = datetime.now(tz=tz)
+    folders = [f"{remote_root}/{now.strftime('%Y%m%d')}"]
+    if now.hour * 60 + now.minute < rollover_minutes:
+        folders.insert(0, f"{remote_root}/{(now - timedelta(days=1)).strftime('%Y%m%d')}")
+    return folders
+
+
+def run_daemon(args, channels: SftpChannels, copier: "Copier", logger: logging.Logger, tz: ZoneInfo,
+               limiter: Optional[RateLimiter], stop: threading.Event) -> List[str]:
+    """
+    Sondea hasta SIGTERM/SIGINT (o --max-files). Las sesiones SSH/S3 se reutilizan entre sondeos.
+    Retorna las últimas carpetas vigiladas (para el reporte).
+    """
+    marks = DirWatermarks(copier.state.get("daemon", {}), args.stable_polls)
+    # un archivo de HOY puede volver a listarse hasta el fin del rollover de mañana (+1h de margen)
+    done_ttl = (24 * 60 + args.rollover_minutes + 60) * 60
+
+    def _halt(signum, _frame):
+        logger.info(f"Señal {signum}: termino después del sondeo en curso.")
+        stop.set()
+        cancel_breakers()
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, _halt)
+
+    folders: List[str] = []
+    poll = 0
+    while not stop.is_set():
+        poll += 1
+        t0 = time.monotonic()
+        folders = daemon_folders(args.remote_root, tz, args.rollover_minutes)
+        full = poll == 1 or (args.full_rescan_polls > 0 and poll % args.full_rescan_polls == 0)
+        marks.begin_poll(full)
+        uploaded_before = copier.stats.get("uploaded")
+        if copier.spool is not None:
+            requeued = copier.spool.requeue_deferred()
+            if requeued:
+                logger.info(f"Spool: reencolo {requeued} subidas fallidas del sondeo anterior.")
+
+        def _produce(emit):
+            for folder in folders:
+                try:
+                    st = channels.get().stat(folder)
+                except (EOFError, paramiko.SSHException) as e:
+                    logger.warning(f"Fallo SFTP consultando {folder}: {e}")
+                    channels.reconnect()
+                    continue
+                except (IOError, OSError):
+                    logger.debug(f"Aún no existe {folder}")
+                    continue
+                if not stat.S_ISDIR(st.st_mode) or not marks.should_list(folder, int(st.st_mtime)):
+                    continue
+                walk_files_parallel(channels, folder, logger,
+                                    lambda rp, rel, mt, sz: marks.candidate(emit, rp, rel, mt, sz),
+                                    list_workers=args.list_workers, stop=stop, limiter=limiter,
+                                    descend=marks.should_list, on_listed=marks.listed)
+
+        def _process(remote_path, rel_path, mtime, size):
+            outcome = copier.process(remote_path, rel_path, mtime, size)
+            marks.resolve(remote_path, mtime, size, outcome)
+
+        run_pipeline(_produce, _process, args.workers, logger, stop, queue_size=args.queue_size,
+                     on_worker_exit=channels.release)
+
+        copier.state["daemon"] = marks.to_state(folders)
+        pruned = copier.prune_done(done_ttl)
+        if pruned:
+            logger.info(f"State: olvido {pruned} keys de carpetas que ya no se vigilan.")
+        copier.flush_state()
+        if copier.manifest is not None:
+            copier.manifest.flush()
+
+        logger.info(f"Sondeo #{poll}{' (completo)' if full else ''}: {', '.join(folders)} | "
+                    f"subidos={copier.stats.get('uploaded') - uploaded_before} "
+                    f"pendientes_estabilidad={marks.pending()} | {time.monotonic() - t0:.1f}s")
+
+        stop.wait(args.poll_interval)
+
+    return folders
 
 
 # =========================
@@ -379,18 +3332,102 @@ def main():
     ap.add_argument("--s3-prefix", default="")
     ap.add_argument("--secure", action="store_true")
     ap.add_argument("--no-verify-tls", action="store_true")
+    ap.add_argument("--checksum", choices=CHECKSUM_MODES, default="none",
+                    help="none = verificación por tamaño (HEAD). md5/sha256 = checksum por bloque en streaming, sin HEAD.")
+    ap.add_argument("--part-size-mb", type=int, default=DEFAULT_PART_SIZE_MB,
+                    help="Tamaño de bloque/parte para --checksum (MB).")
 
     # Operación
     ap.add_argument("--tz", default="America/Bogota")
     ap.add_argument("--dry-run", action="store_true")
     ap.add_argument("--max-files", type=int, default=0, help="0 = sin límite.")
+    ap.add_argument("--workers", type=int, default=4, help="Hilos de subida (cada uno con su canal SFTP).")
+    ap.add_argument("--list-workers", type=int, default=4, help="Hilos listando directorios en paralelo.")
+    ap.add_argument("--queue-size", type=int, default=1000, help="Tamaño máximo de la cola listado -> subida.")
+    ap.add_argument("--engine", choices=("threads", "async"), default="threads",
+                    help="threads = un canal SFTP por worker. async = asyncssh + pool S3 (muchos archivos en vuelo).")
+    ap.add_argument("--inflight", type=int, default=256, help="Archivos en vuelo a la vez (--engine async).")
+    ap.add_argument("--inflight-mb", type=int, default=512,
+                    help="Tope de memoria para los archivos en vuelo en MB (--engine async).")
+    ap.add_argument("--s3-threads", type=int, default=32, help="Hilos para llamadas boto3 (--engine async).")
+
+    # Throttling
+    ap.add_argument("--max-bandwidth", default="0", help="Bytes/s totales (ej: 800K, 5M). 0 = sin límite.")
+    ap.add_argument("--max-rps", type=float, default=0, help="Requests/s totales (SFTP listdir + S3). 0 = sin límite.")
+    ap.add_argument("--throttle-schedule", default="",
+                    help="Franjas 'HH:MM-HH:MM=BW[/RPS],...' en --tz. Ej: '08:00-18:00=2M/20,18:00-08:00=0'.")
+    ap.add_argument("--throttle-file", default="",
+                    help="JSON de control releído en caliente (o con SIGHUP): {\"bandwidth\": \"2M\", \"rps\": 20, \"schedule\": \"...\"}")
+    ap.add_argument("--shard", default="",
+                    help="i/N: esta instancia procesa solo los rel_path con sha1 mod N == i. State, manifest, spool "
+                         "e índice de dedup reciben sufijo .shardIofN.")
     ap.add_argument("--state-file", default="", help="JSON para reanudar (guarda keys subidos).")
+    ap.add_argument("--dedup", choices=("off", "pointer", "copy", "skip"), default="off",
+                    help="Contenido ya subido bajo otro key: pointer = objeto JSON chico que apunta al canónico, "
+                         "copy = copia server-side (sin subir bytes), skip = no escribe nada. Fuerza --checksum sha256.")
+    ap.add_argument("--dedup-index", default="", help="JSON sha256 -> key canónico (requerido con --dedup).")
+    ap.add_argument("--manifest-file", default="",
+                    help="JSON rel_path -> (size, mtime, key). Salta sin tocar S3 lo que no cambió y re-sube lo que cambió.")
     ap.add_argument("--log-file", default="", help="Log adicional a archivo.")
     ap.add_argument("-v", "--verbose", action="store_true")
 
+    # Spool
+    ap.add_argument("--spool-dir", default="",
+                    help="Staging local: lectores SFTP -> disco -> uploaders S3 (sobrevive reinicios).")
+    ap.add_argument("--spool-max-mb", type=int, default=2048, help="Tope del spool en MB (back-pressure).")
+    ap.add_argument("--spool-uploaders", type=int, default=4, help="Hilos que suben del spool a S3.")
+    ap.add_argument("--transform", choices=TRANSFORM_CODECS, default="none",
+                    help="Transformar antes de subir (requiere --spool-dir): zstd/gzip o cmd (--transform-cmd).")
+    ap.add_argument("--transform-level", type=int, default=None, help="Nivel de compresión (zstd 3, gzip 6 por defecto).")
+    ap.add_argument("--transform-cmd", default="",
+                    help="Comando con {in} y {out}, ej: 'ffmpeg -y -loglevel error -i {in} -c:a libopus -b:a 24k {out}'.")
+    ap.add_argument("--transform-suffix", default="", help="Sufijo del key transformado (.zst/.gz por defecto; requerido con cmd).")
+    ap.add_argument("--transform-ext", default="wav,raw,pcm", help="Extensiones a transformar (coma).")
+    ap.add_argument("--transform-workers", type=int, default=os.cpu_count() or 2, help="Procesos del pool de transformación.")
+    ap.add_argument("--spool-part-max-age-h", type=float, default=48.0,
+                    help="Horas tras las cuales un .part abandonado se borra al arrancar.")
+
+    # Ledger
+    ap.add_argument("--ledger-db", default="", help="SQLite con una fila por archivo por ejecución.")
+    ap.add_argument("--ledger-batch", type=int, default=500, help="Filas por transacción del ledger.")
+    ap.add_argument("--ledger-query-key", default="", help="Consulta: historial de un key y sale.")
+    ap.add_argument("--ledger-query-day", default="", help="Consulta: archivos de un día YYYYMMDD y sale.")
+    ap.add_argument("--ledger-query-status", default="",
+                    help="Consulta: filtra por resultado (uploaded/skipped/failed/dry-run) y sale.")
+    ap.add_argument("--ledger-summary", action="store_true", help="Consulta: resumen por ejecución y por día, y sale.")
+    ap.add_argument("--ledger-limit", type=int, default=100, help="Máximo de filas en las consultas.")
+
+    # Circuit breaker
+    ap.add_argument("--breaker-threshold", type=int, default=5,
+                    help="Fallos de caída seguidos (SFTP o S3) que abren el circuito para todos los workers.")
+    ap.add_argument("--breaker-cooldown", type=float, default=5.0, help="Pausa inicial con el circuito abierto (s).")
+    ap.add_argument("--breaker-max-cooldown", type=float, default=300.0, help="Pausa máxima con el circuito abierto (s).")
+
+    # Métricas
+    ap.add_argument("--metrics-textfile", default="",
+                    help="Archivo .prom para node_exporter textfile-collector (se reescribe periódicamente).")
+    ap.add_argument("--metrics-port", type=int, default=0, help="Puerto HTTP para /metrics. 0 = desactivado.")
+    ap.add_argument("--metrics-interval", type=float, default=15.0, help="Segundos entre escrituras del textfile.")
+
+    # Daemon
+    ap.add_argument("--daemon", action="store_true",
+                    help="Modo continuo: sondea la carpeta de HOY y sube archivos estables (en vez de AYER en batch).")
+    ap.add_argument("--poll-interval", type=float, default=60.0, help="Segundos entre sondeos (--daemon).")
+    ap.add_argument("--stable-polls", type=int, default=2,
+                    help="Sondeos con igual size/mtime antes de subir (--daemon).")
+    ap.add_argument("--rollover-minutes", type=int, default=60,
+                    help="Minutos tras medianoche en que se sigue vigilando la carpeta de AYER (--daemon).")
+    ap.add_argument("--full-rescan-polls", type=int, default=60,
+                    help="Cada N sondeos se relista todo ignorando marcas (--daemon). 0 = nunca.")
+
     # Filtro por nombre
-    ap.add_argument("--name-contains", default="INBOUND")
+    ap.add_argument("--name-contains", default=None,
+                    help="Subcadena requerida en el nombre (por defecto INBOUND si no hay --include).")
     ap.add_argument("--ignore-case", action="store_true")
+    ap.add_argument("--include", action="append", default=[],
+                    help="Regla include (repetible, basta una): contains:X icontains:X glob:P regex:P iregex:P "
+                         "ext:wav,mp3 size:>=10K size:10K-500M mtime:ISO..ISO age:<6h")
+    ap.add_argument("--exclude", action="append", default=[], help="Regla exclude (repetible, mismo formato).")
 
     # Selección carpeta
     ap.add_argument("--fallback-latest", action="store_true",
@@ -402,10 +3439,63 @@ def main():
 
     args = ap.parse_args()
 
+    if args.ledger_summary or args.ledger_query_key or args.ledger_query_day or args.ledger_query_status:
+        if not args.ledger_db:
+            ap.error("Las consultas del ledger requieren --ledger-db")
+        sys.exit(ledger_query(args))
+
+    if args.dedup != "off":
+        if not args.dedup_index:
+            ap.error("--dedup requiere --dedup-index")
+        # el digest del contenido sale del mismo streaming con checksum por bloque
+        args.checksum = "sha256"
+
+    if args.transform != "none":
+        if not args.spool_dir:
+            ap.error("--transform requiere --spool-dir (se transforma de disco a disco)")
+        if args.transform == "zstd" and zstandard is None:
+            ap.error("--transform zstd requiere zstandard: pip install zstandard (o usa --transform gzip)")
+        if args.transform == "cmd" and ("{in}" not in args.transform_cmd or "{out}" not in args.transform_cmd
+                                        or not args.transform_suffix):
+            ap.error("--transform cmd requiere --transform-cmd con {in} y {out}, y --transform-suffix")
+
+    if args.engine == "async":
+        if asyncssh is None:
+            ap.error("--engine async requiere asyncssh: pip install asyncssh")
+        if args.daemon or args.spool_dir:
+            ap.error("--engine async no soporta --daemon ni --spool-dir (usa --engine threads)")
+
+    try:
+        parse_rate(args.max_bandwidth)
+        parse_schedule(args.throttle_schedule)
+    except ValueError as e:
+        ap.error(f"Throttling inválido: {e}")
+
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            ap.error(str(e))
+        args.state_file = shard_path(args.state_file, shard)
+        args.manifest_file = shard_path(args.manifest_file, shard)
+        args.spool_dir = shard_path(args.spool_dir, shard)
+        args.dedup_index = shard_path(args.dedup_index, shard)
+
     report_file = args.report_file.strip() if args.report_file.strip() else default_report_name()
+    if shard is not None and not args.report_file.strip():
+        report_file = shard_path(report_file, shard)
+
+    try:
+        filters = build_filter_engine(args, ZoneInfo(args.tz))
+    except (ValueError, re.error) as e:
+        ap.error(f"Filtro inválido: {e}")
 
     logger = setup_logger(args.verbose, args.log_file if args.log_file else None)
 
+    for breaker in (BREAKER_SFTP, BREAKER_S3):
+        breaker.configure(args.breaker_threshold, args.breaker_cooldown, args.breaker_max_cooldown)
+
     # Calcular AYER en formato carpeta YYYYMMDD
     tz = ZoneInfo(args.tz)
     now = datetime.now(tz=tz)
@@ -431,41 +3521,78 @@ def main():
         prefix=args.s3_prefix.lstrip("/"),
     )
 
-    s3 = s3_client(s3_cfg)
+    s3_threads = args.s3_threads if args.engine == "async" else args.workers
+    s3 = s3_client(s3_cfg, max_pool_connections=max(10, s3_threads * 2))
 
     state = load_state(args.state_file)
-    done_keys = set(state.get("done_keys", []))
-
-    # Conectar SFTP
-    ssh, sftp = connect_sftp(sftp_cfg, logger)
 
-    def reconnect():
-        nonlocal ssh, sftp
-        logger.warning("Reconectando SFTP...")
-        safe_close(sftp)
-        safe_close(ssh)
-        ssh, sftp = connect_sftp(sftp_cfg, logger)
+    # Conectar SFTP (canal del hilo principal; los workers abren el suyo)
+    channels = SftpChannels(sftp_cfg, logger)
 
     # Stats + samples para reporte
     start_ts = datetime.now(tz=tz)
     chosen_folder = ""
     chosen_mode = ""
-    total_files_seen = 0
-    matched_name = 0
-    uploaded = 0
-    skipped_exists = 0
-    skipped_state = 0
-    failed_uploads = 0
-    sample_uploaded: List[str] = []
-    sample_skipped_exists: List[str] = []
-    sample_skipped_name: List[str] = []
-    sample_failed: List[str] = []
+    stats = RunStats()
+    stop = threading.Event()
+    manifest = Manifest(args.manifest_file) if args.manifest_file else None
+
+    limiter = None
+    if parse_rate(args.max_bandwidth) or args.max_rps or args.throttle_schedule or args.throttle_file:
+        limiter = RateLimiter(parse_rate(args.max_bandwidth), args.max_rps, args.throttle_schedule,
+                              args.throttle_file, tz, logger)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, limiter.request_reload)
+
+    spool = Spool(args.spool_dir, args.spool_max_mb * 1024 * 1024, logger) if args.spool_dir else None
+
+    ledger = Ledger(args.ledger_db, tz, logger, batch_size=args.ledger_batch) if args.ledger_db else None
+    if ledger is not None:
+        logger.info(f"Ledger: {args.ledger_db} (run_id={ledger.run_id})")
+
+    dedup = DedupIndex(args.dedup_index) if args.dedup != "off" else None
+    if dedup is not None:
+        logger.info(f"Dedup: {args.dedup} (índice {args.dedup_index}, {len(dedup.entries)} contenidos conocidos)")
+
+    transformer = None
+    if args.transform != "none":
+        transformer = Transformer(args.transform, args.transform_level, args.transform_cmd, args.transform_suffix,
+                                  args.transform_ext, args.transform_workers)
+        logger.info(f"Transformación: {transformer.tag} sobre .{', .'.join(sorted(transformer.exts))} "
+                    f"-> key{transformer.suffix} ({args.transform_workers} procesos)")
+
+    copier = Copier(args, s3, s3_cfg, channels, state, stats, logger, stop, manifest=manifest, limiter=limiter,
+                    spool=spool, filters=filters, ledger=ledger, dedup=dedup, transformer=transformer, shard=shard)
+
+    if spool is not None:
+        recovered = spool.recover(args.spool_part_max_age_h * 3600)
+        if recovered:
+            logger.info(f"Spool: {len(recovered)} archivos pendientes de una ejecución anterior vuelven a la cola.")
+        spool.start_uploaders(copier.upload_spooled, args.spool_uploaders, stop)
+        for meta in recovered:
+            spool.put(meta)
+
+    metrics_stop = threading.Event()
+    metrics_srv = METRICS.serve(args.metrics_port, logger) if args.metrics_port else None
+    if args.metrics_textfile:
+        start_textfile_writer(args.metrics_textfile, args.metrics_interval, metrics_stop, logger)
 
     try:
+        if args.daemon:
+            chosen_mode = "daemon"
+            logger.info(f"DAEMON: sondeo cada {args.poll_interval:g}s, estable tras {args.stable_polls} sondeos iguales")
+            logger.info(f"Filtros: {filters.describe()}")
+            logger.info(f"Concurrencia: list_workers={args.list_workers} upload_workers={args.workers}")
+            if args.dry_run:
+                logger.info("DRY-RUN: no se subirá nada.")
+            logger.info(f"Reporte (al terminar): {report_file} (append={args.report_append})")
+            chosen_folder = ", ".join(run_daemon(args, channels, copier, logger, tz, limiter, stop))
+            return
+
         # Seleccionar folder objetivo
         try:
             chosen_folder, chosen_mode = choose_target_folder(
-                sftp=sftp,
+                sftp=channels.get(),
                 remote_root=sftp_cfg.remote_root,
                 yesterday_str=yesterday_str,
                 allow_fallback_latest=args.fallback_latest,
@@ -473,9 +3600,9 @@ def main():
             )
         except (EOFError, OSError, IOError, paramiko.SSHException) as e:
             logger.warning(f"Fallo al seleccionar carpeta objetivo: {e}")
-            reconnect()
+            channels.reconnect()
             chosen_folder, chosen_mode = choose_target_folder(
-                sftp=sftp,
+                sftp=channels.get(),
                 remote_root=sftp_cfg.remote_root,
                 yesterday_str=yesterday_str,
                 allow_fallback_latest=args.fallback_latest,
@@ -483,106 +3610,87 @@ def main():
             )
 
         logger.info(f"Carpeta objetivo: {chosen_folder} (modo={chosen_mode})")
-        logger.info(f"Filtro nombre: contiene '{args.name_contains}' (ignore_case={args.ignore_case})")
+        if shard is not None:
+            logger.info(f"Shard {shard[0]}/{shard[1]}: solo rel_path con sha1 mod {shard[1]} == {shard[0]}")
+        logger.info(f"Filtros: {filters.describe()}")
         logger.info("Modo: plano (sin estructura) + hash anti-colisión por rel_path")
+        if args.engine == "async":
+            logger.info(f"Concurrencia (async): en vuelo={args.inflight} ({args.inflight_mb} MB) "
+                        f"list={args.list_workers} s3_threads={args.s3_threads}")
+        else:
+            logger.info(f"Concurrencia: list_workers={args.list_workers} upload_workers={args.workers}")
         if args.dry_run:
             logger.info("DRY-RUN: no se subirá nada.")
         if args.state_file:
             logger.info(f"State file: {args.state_file}")
+        if manifest is not None:
+            logger.info(f"Manifest: {args.manifest_file} ({len(manifest.entries)} entradas)")
         logger.info(f"Reporte: {report_file} (append={args.report_append})")
 
         # Si la carpeta de ayer no existe y no hay fallback, igual intentamos listar y quedará vacío.
         # Recorremos archivos del folder elegido (recursivo por si hay subcarpetas)
-        for remote_path, rel_path, mtime, size in list_files_in_folder(sftp, chosen_folder, logger):
-            total_files_seen += 1
-
-            filename = os.path.basename(remote_path)
-            if not name_matches(filename, args.name_contains, args.ignore_case):
-                if args.verbose:
-                    logger.debug(f"SKIP nombre: {filename}")
-                if len(sample_skipped_name) < 10:
-                    sample_skipped_name.append(filename)
-                continue
-
-            matched_name += 1
-
-            flat_name = flat_name_with_hash(remote_path, rel_path)
-            key = f"{s3_cfg.prefix.rstrip('/') + '/' if s3_cfg.prefix else ''}{flat_name}"
-
-            if key in done_keys:
-                skipped_state += 1
-                continue
-
-            # Exists en S3
-            try:
-                if object_exists(s3, s3_cfg.bucket, key):
-                    skipped_exists += 1
-                    if len(sample_skipped_exists) < 10:
-                        sample_skipped_exists.append(key)
-                    done_keys.add(key)
-                    state["done_keys"] = sorted(done_keys)
-                    save_state(args.state_file, state)
-                    continue
-            except (EndpointConnectionError, ConnectionClosedError, ClientError) as e:
-                logger.warning(f"Problema consultando S3 (head_object): {e}. Continuo; boto/retry puede resolver.")
+        def _produce(emit):
+            if args.list_workers <= 1:
+                for entry in list_files_in_folder(channels.get(), chosen_folder, logger):
+                    if stop.is_set():
+                        break
+                    emit(*entry)
+                return
+            walk_files_parallel(channels, chosen_folder, logger, emit,
+                                list_workers=args.list_workers, stop=stop, limiter=limiter)
 
-            logger.info(f"SUBIR: {remote_path} ({size} bytes) -> {key}")
+        if args.engine == "async":
+            AsyncEngine(args, sftp_cfg, copier, logger, stop, limiter).run(chosen_folder)
+        else:
+            run_pipeline(_produce, copier.process, args.workers, logger, stop, queue_size=args.queue_size,
+                         on_worker_exit=channels.release)
 
-            if args.dry_run:
-                uploaded += 1
-                if len(sample_uploaded) < 10:
-                    sample_uploaded.append(key + "  [dry-run]")
-                continue
-
-            # Upload con reconexión si cae SFTP
+    finally:
+        if spool is not None:
+            spool.stop_uploaders()
+        if transformer is not None:
+            transformer.close()
+        copier.flush_state()
+        if manifest is not None:
+            manifest.flush()
+        if dedup is not None:
+            dedup.flush()
+        channels.close()
+
+        metrics_stop.set()
+        if args.metrics_textfile:
             try:
-                upload_streaming_sftp_to_s3(sftp, s3, s3_cfg, remote_path, key, logger, attempts=5)
-            except (EOFError, OSError, IOError, paramiko.SSHException) as e:
-                logger.warning(f"Falla SFTP durante upload: {e}")
-                reconnect()
-                try:
-                    upload_streaming_sftp_to_s3(sftp, s3, s3_cfg, remote_path, key, logger, attempts=5)
-                except Exception as e2:
-                    failed_uploads += 1
-                    if len(sample_failed) < 10:
-                        sample_failed.append(f"{remote_path} -> {key} | {e2}")
-                    logger.error(f"Fallo definitivo subiendo {remote_path}: {e2}")
-                    continue
+                METRICS.write_textfile(args.metrics_textfile)
             except Exception as e:
-                failed_uploads += 1
-                if len(sample_failed) < 10:
-                    sample_failed.append(f"{remote_path} -> {key} | {e}")
-                logger.error(f"Fallo subiendo {remote_path}: {e}")
-                continue
-
-            # Verificación por tamaño
-            if not verify_uploaded_size(s3, s3_cfg.bucket, key, size):
-                failed_uploads += 1
-                if len(sample_failed) < 10:
-                    sample_failed.append(f"{remote_path} -> {key} | verify(ContentLength) FAILED (expected {size})")
-                logger.error(f"Upload no verificado por tamaño (ContentLength != {size}). Queda para reintento.")
-                continue
-
-            uploaded += 1
-            if len(sample_uploaded) < 10:
-                sample_uploaded.append(key)
-
-            # state
-            done_keys.add(key)
-            state["done_keys"] = sorted(done_keys)
-            save_state(args.state_file, state)
-
-            if args.max_files and uploaded >= args.max_files:
-                logger.info(f"Alcanzado --max-files={args.max_files}. Corto ejecución.")
-                break
-
-    finally:
-        safe_close(sftp)
-        safe_close(ssh)
+                logger.warning(f"No pude escribir métricas en {args.metrics_textfile}: {e}")
+        if metrics_srv is not None:
+            metrics_srv.shutdown()
 
         end_ts = datetime.now(tz=tz)
         elapsed_s = (end_ts - start_ts).total_seconds()
 
+        total_files_seen = stats.get("total_files_seen")
+        matched_name = stats.get("matched_name")
+        uploaded = stats.get("uploaded")
+        skipped_exists = stats.get("skipped_exists")
+        skipped_state = stats.get("skipped_state")
+        failed_uploads = stats.get("failed_uploads")
+        verified_checksum = stats.get("verified_checksum")
+        skipped_manifest = stats.get("skipped_manifest")
+        changed_reuploads = stats.get("changed_reuploads")
+        spooled = stats.get("spooled")
+        deduped = stats.get("deduped")
+        transformed = stats.get("transformed")
+        transform_in = stats.get("transform_bytes_in")
+        transform_out = stats.get("transform_bytes_out")
+        dedup_bytes_saved = stats.get("dedup_bytes_saved")
+        spool_pending = spool.pending_files() if spool is not None else 0
+        sample_changed = stats.samples["changed"]
+        sample_uploaded = stats.samples["uploaded"]
+        sample_skipped_exists = stats.samples["skipped_exists"]
+        sample_skipped_name = stats.samples["skipped_name"]
+        sample_failed = stats.samples["failed"]
+
         # Generar reporte de texto (siempre)
         report_lines = []
         report_lines.append("=" * 78)
@@ -598,18 +3706,47 @@ def main():
         report_lines.append(f"- Carpeta usada: {chosen_folder if chosen_folder else '(no determinada)'}")
         report_lines.append(f"- Modo selección: {chosen_mode if chosen_mode else '(n/a)'}")
         report_lines.append(f"- Fallback latest: {args.fallback_latest}")
-        report_lines.append(f"- Filtro nombre contiene: '{args.name_contains}' (ignore_case={args.ignore_case})")
+        report_lines.append(f"- Filtros: {filters.describe()}")
         report_lines.append(f"- Dry-run: {args.dry_run}")
+        report_lines.append(f"- Shard: {f'{shard[0]}/{shard[1]}' if shard is not None else '(no)'}")
+        report_lines.append(f"- Manifest: {args.manifest_file if args.manifest_file else '(no)'}")
+        report_lines.append(f"- Dedup: {args.dedup + ' (' + args.dedup_index + ')' if dedup is not None else '(no)'}")
+        report_lines.append(f"- Spool: {args.spool_dir + f' (tope {args.spool_max_mb} MB)' if args.spool_dir else '(no)'}")
+        report_lines.append(f"- Concurrencia: list_workers={args.list_workers} upload_workers={args.workers}")
+        report_lines.append(f"- Throttle: bandwidth={args.max_bandwidth} rps={args.max_rps:g} "
+                            f"schedule='{args.throttle_schedule}' control='{args.throttle_file}'")
         report_lines.append(f"- S3 bucket: {s3_cfg.bucket}")
         report_lines.append(f"- S3 prefix: '{s3_cfg.prefix}'")
+        report_lines.append(f"- Verificación: {'checksum ' + args.checksum + ' en streaming' if args.checksum != 'none' else 'tamaño (HEAD ContentLength)'}")
         report_lines.append("")
         report_lines.append("RESULTADOS")
         report_lines.append(f"- Archivos vistos en carpeta: {total_files_seen}")
-        report_lines.append(f"- Match por nombre: {matched_name}")
+        if shard is not None:
+            report_lines.append(f"- De otros shards (ignorados): {stats.get('other_shard')}")
+        report_lines.append(f"- Match por filtros: {matched_name}")
         report_lines.append(f"- Subidos (o simulados en dry-run): {uploaded}")
         report_lines.append(f"- Omitidos (existían en S3): {skipped_exists}")
         report_lines.append(f"- Omitidos (state): {skipped_state}")
+        if manifest is not None:
+            report_lines.append(f"- Omitidos (manifest, sin cambios): {skipped_manifest}")
+            report_lines.append(f"- Re-subidos por cambio: {changed_reuploads}")
         report_lines.append(f"- Fallos (upload/verificación): {failed_uploads}")
+        if spool is not None:
+            report_lines.append(f"- Bajados al spool: {spooled}")
+            report_lines.append(f"- Omitidos (ya en spool esperando subida): {stats.get('skipped_spool')}")
+            report_lines.append(f"- Pendientes en spool al terminar: {spool_pending}")
+        if args.checksum != "none":
+            report_lines.append(f"- Verificados por checksum ({args.checksum}): {verified_checksum}")
+        if transformer is not None:
+            ratio = f"{transform_out / transform_in * 100:.1f}%" if transform_in else "n/a"
+            report_lines.append(f"- Transformados ({transformer.tag}): {transformed} "
+                                f"({transform_in / 1024 / 1024:.1f} MB -> {transform_out / 1024 / 1024:.1f} MB, {ratio})")
+        if dedup is not None:
+            report_lines.append(f"- Duplicados por contenido ({args.dedup}): {deduped} "
+                                f"({dedup_bytes_saved / 1024 / 1024:.1f} MB sin subir)")
+        report_lines.append("")
+        report_lines.append("FILTROS (entradas decididas por regla)")
+        report_lines.extend(filters.report_lines())
         report_lines.append("")
         if sample_uploaded:
             report_lines.append("EJEMPLOS SUBIDOS (top 10)")
@@ -621,8 +3758,13 @@ def main():
             for x in sample_skipped_exists:
                 report_lines.append(f"  - {x}")
             report_lines.append("")
+        if sample_changed:
+            report_lines.append("EJEMPLOS CAMBIADOS / RE-SUBIDOS (top 10)")
+            for x in sample_changed:
+                report_lines.append(f"  - {x}")
+            report_lines.append("")
         if sample_skipped_name:
-            report_lines.append("EJEMPLOS OMITIDOS POR NOMBRE (top 10)")
+            report_lines.append("EJEMPLOS OMITIDOS POR FILTRO (top 10)")
             for x in sample_skipped_name:
                 report_lines.append(f"  - {x}")
             report_lines.append("")
@@ -632,6 +3774,17 @@ def main():
                 report_lines.append(f"  - {x}")
             report_lines.append("")
 
+        if ledger is not None:
+            report_lines.append(f"Ledger: {args.ledger_db} (run_id={ledger.run_id})")
+            try:
+                ledger.close(chosen_folder, chosen_mode, {
+                    "seen": total_files_seen, "matched": matched_name, "uploaded": uploaded,
+                    "skipped_exists": skipped_exists, "skipped_state": skipped_state, "failed": failed_uploads,
+                    "elapsed_s": round(elapsed_s, 1),
+                })
+            except Exception as e:
+                logger.warning(f"Ledger: error al cerrar: {e}")
+
         try:
             write_report(report_file, args.report_append, report_lines)
         except Exception as e:
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pool de conexiones SSH compartido por los scripts de flota
+(copiar_cadena_kubeconfig.py, ejecutar_snmp_multi_nodos_dinamico.py, registro_*.py).
+
+- Una sola conexión (transport) por host; cada comando abre un canal nuevo sobre ella.
+- Credenciales cargadas una vez al crear el pool (password, llaves, agente, ~/.ssh/config).
+- Keepalive para que la conexión no se caiga entre pasos largos.
+- Semáforo por host: no más de max_canales comandos a la vez en el mismo nodo
+  (sshd corta por MaxSessions=10).
+- Si la conexión se murió, se reconecta una vez y se reintenta el comando.
+- barrido(): prueba TCP/22, banner SSH y login en todos los hosts a la vez con un
+  plazo global (toda la flota en ~un timeout, no uno por host).
+
+Uso:
+    from ssh_pool import SSHPool
+
+    with SSHPool(user="root", password="...") as pool:
+        rc, out, err = pool.exec("10.0.0.11", "hostname")
+        with pool.sftp("10.0.0.11") as sftp:
+            sftp.put("local", "/tmp/remoto")
+"""
+
+import errno
+import os
+import select
+import selectors
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import paramiko
+
+
+SSH_CONFIG_PATH = os.path.expanduser("~/.ssh/config")
+
+
+class SSHPool:
+    def __init__(
+        self,
+        user=None,
+        password=None,
+        port=22,
+        timeout=12,
+        key_filename=None,
+        keepalive=30,
+        max_canales=8,
+        usar_ssh_config=True,
+    ):
+        """
+        password=None -> se autentica con llaves (~/.ssh/id_*) o con el agente, igual que `ssh root@nodo`.
+        user=None -> el User de ~/.ssh/config para ese host, y si no hay, root.
+        """
+        self.user = user
+        self.password = password
+        self.port = port
+        self.timeout = timeout
+        self.key_filename = key_filename
+        self.keepalive = keepalive
+        self.max_canales = max_canales
+
+        self.ssh_config = None
+        if usar_ssh_config and os.path.exists(SSH_CONFIG_PATH):
+            self.ssh_config = paramiko.SSHConfig.from_path(SSH_CONFIG_PATH)
+
+        self._lock = threading.Lock()
+        self._clientes = {}
+        self._locks_host = {}
+        self._semaforos = {}
+
+        self.conexiones = 0
+        self.canales = 0
+
+    # ---------------- conexión ----------------
+
+    def _parametros(self, host):
+        """
+        Parámetros de connect() para el host, aplicando ~/.ssh/config (HostName, Port, User, IdentityFile).
+        """
+        params = {
+            "hostname": host,
+            "port": self.port,
+            "username": self.user or "root",
+            "timeout": self.timeout,
+            "banner_timeout": self.timeout,
+            "auth_timeout": self.timeout,
+        }
+
+        if self.password:
+            params.update(password=self.password, look_for_keys=False, allow_agent=False)
+
+        if self.key_filename:
+            params["key_filename"] = self.key_filename
+
+        if self.ssh_config is not None:
+            cfg = self.ssh_config.lookup(host)
+            params["hostname"] = cfg.get("hostname", host)
+            if "port" in cfg:
+                params["port"] = int(cfg["port"])
+            if not self.user and "user" in cfg:
+                params["username"] = cfg["user"]
+            if "identityfile" in cfg and not self.key_filename and not self.password:
+                params["key_filename"] = cfg["identityfile"]
+
+        return params
+
+    def _lock_host(self, host):
+        with self._lock:
+            if host not in self._locks_host:
+                self._locks_host[host] = threading.Lock()
+                self._semaforos[host] = threading.BoundedSemaphore(self.max_canales)
+            return self._locks_host[host]
+
+    def cliente(self, host):
+        """
+        SSHClient conectado al host (se crea la primera vez, se reusa después).
+        Se puede usar directo: exec_command(), open_sftp(), get_transport().
+        """
+        with self._lock_host(host):
+            client = self._clientes.get(host)
+            transport = client.get_transport() if client is not None else None
+
+            if transport is not None and transport.is_active():
+                return client
+
+            if client is not None:
+                client.close()
+
+            client = paramiko.SSHClient()
+            client.load_system_host_keys()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+            try:
+                client.connect(**self._parametros(host))
+            except Exception:
+                client.close()
+                raise
+
+            if self.keepalive:
+                client.get_transport().set_keepalive(self.keepalive)
+
+            self._clientes[host] = client
+
+            with self._lock:
+                self.conexiones += 1
+
+            return client
+
+    def conectado(self, host):
+        with self._lock:
+            client = self._clientes.get(host)
+        transport = client.get_transport() if client is not None else None
+        return transport is not None and transport.is_active()
+
+    def cerrar(self, host):
+        with self._lock_host(host):
+            client = self._clientes.pop(host, None)
+            if client is not None:
+                client.close()
+
+    def cerrar_todo(self):
+        with self._lock:
+            hosts = list(self._clientes)
+        for host in hosts:
+            self.cerrar(host)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar_todo()
+
+    # ---------------- canales ----------------
+
+    @contextmanager
+    def canal(self, host):
+        """
+        Reserva un lugar en el semáforo del host y entrega el SSHClient.
+        Para usos que manejan el canal a mano (salida en streaming, stdin, etc.).
+        """
+        self._lock_host(host)
+        semaforo = self._semaforos[host]
+
+        with semaforo:
+            with self._lock:
+                self.canales += 1
+            yield self.cliente(host)
+
+    def _abrir_sesion(self, host):
+        """
+        Abre un canal de sesión; si la conexión estaba muerta reconecta una vez.
+        """
+        try:
+            return self.cliente(host).get_transport().open_session(timeout=self.timeout)
+        except (paramiko.SSHException, EOFError, OSError, AttributeError):
+            self.cerrar(host)
+            return self.cliente(host).get_transport().open_session(timeout=self.timeout)
+
+    def exec(self, host, command, timeout=None, stdin_data=None):
+        """
+        Ejecuta un comando en un canal nuevo sobre la conexión del host.
+        Retorna (exit_status, stdout, stderr). timeout=None espera lo que tarde el comando;
+        si se cumple el timeout se cierra el canal y se retorna rc=124.
+        """
+        self._lock_host(host)
+
+        with self._semaforos[host]:
+            with self._lock:
+                self.canales += 1
+
+            chan = self._abrir_sesion(host)
+
+            try:
+                chan.exec_command(command)
+
+                if stdin_data is not None:
+                    chan.sendall(stdin_data.encode() if isinstance(stdin_data, str) else stdin_data)
+                    chan.shutdown_write()
+
+                out, err, termino = leer_canal(chan, timeout)
+
+                if not termino:
+                    return 124, out, (err + "\nTimeout ejecutando comando remoto.").strip()
+
+                return chan.recv_exit_status(), out, err
+
+            finally:
+                chan.close()
+
+    @contextmanager
+    def sftp(self, host):
+        with self.canal(host) as client:
+            sftp = client.open_sftp()
+            try:
+                yield sftp
+            finally:
+                sftp.close()
+
+    def stats(self):
+        with self._lock:
+            return {"hosts": len(self._clientes), "conexiones": self.conexiones, "canales": self.canales}
+
+
+def leer_canal(chan, timeout=None):
+    """
+    Lee stdout y stderr a la vez (select sobre el canal, sin dormir) hasta EOF + exit status.
+    Leer los dos juntos evita que un stderr grande llene la ventana del canal y se trabe.
+    Retorna (stdout, stderr, termino).
+    """
+    out = []
+    err = []
+    limite = None if timeout is None else time.time() + timeout
+
+    while True:
+        leido = False
+        # fin se mira antes de drenar: lo que llegó junto con el EOF ya está en el buffer
+        fin = chan.closed or (chan.eof_received and chan.exit_status_ready())
+
+        while chan.recv_ready():
+            out.append(chan.recv(65536))
+            leido = True
+
+        while chan.recv_stderr_ready():
+            err.append(chan.recv_stderr(65536))
+            leido = True
+
+        if fin:
+            break
+
+        if leido:
+            continue
+
+        espera = 5.0
+        if limite is not None:
+            espera = limite - time.time()
+            if espera <= 0:
+                return (
+                    b"".join(out).decode(errors="replace"),
+                    b"".join(err).decode(errors="replace"),
+                    False,
+                )
+            espera = min(espera, 5.0)
+
+        try:
+            select.select([chan], [], [], espera)
+        except (OSError, ValueError, socket.error):
+            time.sleep(0.05)
+
+    return b"".join(out).decode(errors="replace"), b"".join(err).decode(errors="replace"), True
+
+
+# =========================
+# Barrido de alcance
+# =========================
+@dataclass
+class Alcance:
+    host: str
+    tcp: bool = False
+    banner: str = ""
+    auth: bool = False
+    mensaje: str = ""
+    ms: int = 0
+
+    @property
+    def ok(self):
+        return self.auth
+
+
+def barrido(hosts, pool=None, port=22, plazo=10.0, auth=True):
+    """
+    Prueba todos los hosts a la vez y retorna {host: Alcance} en el orden recibido.
+
+    1) TCP + banner: un solo selector con todos los sockets no bloqueantes.
+    2) Login: apenas un host muestra su banner se lanza su login con el pool (si auth y
+       hay pool), sin esperar a los demás; las conexiones quedan abiertas en el pool
+       para lo que venga después. Sin login, ok = mostró el banner SSH.
+    Todo dentro de `plazo` segundos en total; lo que no terminó se reporta como timeout.
+    """
+    inicio = time.time()
+    limite = inicio + plazo
+    res = {h: Alcance(h) for h in hosts}
+    sel = selectors.DefaultSelector()
+    buffers = {}
+
+    login = auth and pool is not None
+    ex = ThreadPoolExecutor(max_workers=min(64, max(1, len(hosts)))) if login else None
+    futs = {}
+    vencido = threading.Event()
+
+    def loguear(host):
+        try:
+            pool.cliente(host)
+            ok, mensaje = True, ""
+        except paramiko.AuthenticationException:
+            ok, mensaje = False, "login rechazado"
+        except Exception as e:
+            ok, mensaje = False, f"login: {e}"
+        # si ya se cumplió el plazo el resultado ya se entregó como timeout: no tocarlo
+        if not vencido.is_set():
+            res[host].auth, res[host].mensaje = ok, mensaje
+            res[host].ms = int((time.time() - inicio) * 1000)
+
+    def terminar(sock, host, mensaje=""):
+        try:
+            sel.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+        sock.close()
+        if mensaje:
+            res[host].mensaje = mensaje
+        res[host].ms = int((time.time() - inicio) * 1000)
+
+    for host in hosts:
+        destino, puerto = host, port
+        if pool is not None:
+            params = pool._parametros(host)
+            destino, puerto = params["hostname"], params["port"]
+
+        try:
+            familia, tipo, proto, _, addr = socket.getaddrinfo(destino, puerto, type=socket.SOCK_STREAM)[0]
+            sock = socket.socket(familia, tipo, proto)
+        except OSError as e:
+            res[host].mensaje = f"no resuelve: {e}"
+            continue
+
+        sock.setblocking(False)
+        rc = sock.connect_ex(addr)
+
+        if rc not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            terminar(sock, host, f"TCP {puerto}: {os.strerror(rc)}")
+            continue
+
+        buffers[host] = b""
+        sel.register(sock, selectors.EVENT_WRITE, host)
+
+    while sel.get_map():
+        restante = limite - time.time()
+        if restante <= 0:
+            break
+
+        for key, evento in sel.select(timeout=restante):
+            sock, host = key.fileobj, key.data
+
+            if evento & selectors.EVENT_WRITE:
+                err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if err:
+                    terminar(sock, host, f"TCP: {os.strerror(err)}")
+                    continue
+                res[host].tcp = True
+                sel.modify(sock, selectors.EVENT_READ, host)
+                continue
+
+            try:
+                data = sock.recv(4096)
+            except OSError as e:
+                terminar(sock, host, f"banner: {e}")
+                continue
+
+            if not data:
+                terminar(sock, host, "banner: el servidor cerró la conexión")
+                continue
+
+            buffers[host] += data
+
+            # RFC 4253: puede haber líneas antes del banner, la que vale empieza con SSH-
+            for linea in buffers[host].split(b"\n")[:-1]:
+                if linea.startswith(b"SSH-"):
+                    res[host].banner = linea.strip().decode(errors="replace")
+                    terminar(sock, host)
+                    if login:
+                        futs[ex.submit(loguear, host)] = host
+                    break
+            else:
+                if len(buffers[host]) > 8192:
+                    terminar(sock, host, "banner: no es un servidor SSH")
+
+    for key in list(sel.get_map().values()):
+        host = key.data
+        terminar(key.fileobj, host, "timeout TCP" if not res[host].tcp else "timeout esperando banner SSH")
+    sel.close()
+
+    if login:
+        if futs:
+            _, pendientes = wait(futs, timeout=max(0.0, limite - time.time()))
+            vencido.set()
+
+            for f in pendientes:
+                res[futs[f]].mensaje = "timeout en el login"
+                res[futs[f]].ms = int(plazo * 1000)
+
+        ex.shutdown(wait=False)
+    else:
+        # sin login (auth=False o sin pool) alcanza con que muestre el banner
+        for a in res.values():
+            a.auth = bool(a.banner)
+
+    return {h: res[h] for h in hosts}